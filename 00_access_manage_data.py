@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 import pandas_datareader as pdr
 import sqlite3
+from sqlite_writer import bulk_write
 
 # Define date variables, range of data
 start_date = "1960-01-01"
@@ -134,12 +135,12 @@ cpi_monthly = (pdr.DataReader(
 tidy_finance = sqlite3.connect(
   database = "data/tidy_finance_python.sqlite"
 )
-(factors_ff3_monthly.to_sql(
+bulk_write(
+  factors_ff3_monthly, 
   name = "factors_ff3_monthly", 
   con = tidy_finance, 
-  if_exists = "replace",
-  index = False
-))
+  if_exists = "replace"
+)
 pd.read_sql_query(
   sql = "SELECT month, rf FROM factors_ff3_monthly", 
   con = tidy_finance, 
@@ -156,9 +157,9 @@ data_dict = {
   "cpi_monthly" : cpi_monthly
 }
 for key, value in data_dict.items():
-  value.to_sql(name = key, 
+  bulk_write(value, name = key, 
   con = tidy_finance, 
-  if_exists = "replace", index=False)
+  if_exists = "replace")
 
 # These are the steps to follow after setup
 import pandas as pd
@@ -6,21 +6,121 @@ import os
 from plotnine import *
 from mizani.formatters import comma.format, percent format
 from datetime import datetime
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
+from wrds_extract import wrds_engine, extract_tables
+from incremental_refresh import refresh_tables, load_extract
 load_dotenv()
 
-# Starting and end query data dates
+# "full" pulls the whole span, "incremental" only rows after each
+# table's watermark (minus a revision lookback)
+refresh_mode = os.getenv("REFRESH_MODE", "full")
+
+# Starting and end query data dates; incremental refreshes run up to
+# today unless END_DATE is set
 start_date = "01/01/1960"
-end_date = "12/31/2022"
+if refresh_mode == "incremental":
+  end_date = os.getenv("END_DATE", datetime.today().strftime("%m/%d/%Y"))
+else:
+  end_date = os.getenv("END_DATE", "12/31/2022")
 
-# With push multi-factor authentication, since May 2023
-connection_string = (
-  "postgresql+psycopg2://"
- f"{os.getenv('WRDS_USER')}:{os.getenv('WRDS_PASSWORD')}"
-  "@wrds-pgdata.wharton.upenn.edu:9737/wrds"
-)
-wrds = create_engine(
-  connection_string, pool_pre_ping = True)
+# With push multi-factor authentication, since May 2023; one pooled
+# connection per concurrent pull
+wrds = wrds_engine(pool_size = 3)
 
 # Downloading Monthly CRSP data
+crsp_monthly_query = (
+  "SELECT msf.permno, msf.date, "
+  "date_trunc('month', msf.date)::date AS month, "
+  "msf.ret, msf.shrout, msf.altprc, "
+  "msenames.exchcd, msenames.siccd, "
+  "msedelist.dlret, msedelist.dlstcd "
+  "FROM crsp.msf AS msf "
+  "LEFT JOIN crsp.msenames AS msenames "
+  "ON msf.permno = msenames.permno AND "
+  "msenames.namedt <= msf.date AND "
+  "msf.date <= msenames.nameendt "
+  "LEFT JOIN crsp.msedelist AS msedelist "
+  "ON msf.permno = msedelist.permno AND "
+  "date_trunc('month', msf.date)::date = "
+  "date_trunc('month', msedelist.dlstdt)::date "
+  "WHERE msf.date BETWEEN :start_date AND :end_date "
+  "AND msenames.shrcd IN (10, 11)"
+)
+
+# Daily CRSP returns, the largest pull, streamed in chunks
+crsp_daily_query = (
+  "SELECT dsf.permno, dsf.date, dsf.ret "
+  "FROM crsp.dsf AS dsf "
+  "WHERE dsf.date BETWEEN :start_date AND :end_date"
+)
+
+# Compustat annual fundamentals
+compustat_query = (
+  "SELECT gvkey, datadate, seq, ceq, at, lt, txditc, txdb, "
+  "itcb, pstkrv, pstkl, pstk, capx, oancf, sale, cogs, xint, xsga "
+  "FROM comp.funda "
+  "WHERE indfmt = 'INDL' "
+  "AND datafmt = 'STD' "
+  "AND consol = 'C' "
+  "AND datadate BETWEEN :start_date AND :end_date"
+)
+
+# Keys for upserts, watermark columns, revision lookback and the derived
+# tables to flag as stale when new rows arrive
+refresh_specs = {
+  "crsp_monthly_raw" : {
+    "query" : crsp_monthly_query, 
+    "keys" : ["permno", "date"], 
+    "watermark" : "date", 
+    "lookback_days" : 92, 
+    "dependents" : ["crsp_monthly", "beta", "crsp_monthly_ff3"]
+  }, 
+  "crsp_daily_raw" : {
+    "query" : crsp_daily_query, 
+    "keys" : ["permno", "date"], 
+    "watermark" : "date", 
+    "lookback_days" : 31, 
+    "dependents" : ["crsp_daily", "beta"]
+  }, 
+  "compustat_raw" : {
+    "query" : compustat_query, 
+    "keys" : ["gvkey", "datadate"], 
+    "watermark" : "datadate", 
+    "lookback_days" : 730, 
+    "dependents" : ["compustat"]
+  }
+}
+tidy_finance = sqlite3.connect(
+  database = "data/tidy_finance_python.sqlite"
+)
+
+if refresh_mode == "incremental":
+  # Only new and revised rows, merged into the raw tables by key
+  refresh_summary = refresh_tables(
+    wrds, tidy_finance, refresh_specs, start_date, end_date, 
+    chunk_size = 500000
+  )
+  print(refresh_summary)
+else:
+  # Pull the independent tables concurrently into data/wrds as parquet,
+  # then seed the raw tables and their watermarks from the files
+  date_range = {"start_date" : start_date, "end_date" : end_date}
+  extract_summary = extract_tables(
+    wrds, 
+    {name : (spec["query"], date_range) 
+    for name, spec in refresh_specs.items()}, 
+    chunk_size = 500000
+  )
+  print(extract_summary)
+  for name, spec in refresh_specs.items():
+    load_extract(tidy_finance, name, spec, chunk_size = 500000)
+crsp_monthly = pd.read_sql_query(
+  sql = "SELECT * FROM crsp_monthly_raw", 
+  con = tidy_finance, 
+  parse_dates = {"date", "month"}
+)
+compustat = pd.read_sql_query(
+  sql = "SELECT * FROM compustat_raw", 
+  con = tidy_finance, 
+  parse_dates = {"datadate"}
+)
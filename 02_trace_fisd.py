@@ -8,18 +8,14 @@ from plotnine import *
 from mizani.formatters import comma.format, percent format
 from mizani.breaks import date_breaks
 from datetime import datetime
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
+from wrds_extract import wrds_engine, extract_tables, read_extract
+from batch_runner import BatchRunner
+from sqlite_writer import BulkWriter, bulk_write
 load_dotenv()
 
-# Setup connections
-connection_string = (
-  "postgresql+psycopg2://"
-  f"{os.getenv('WRDS_USER')}:{os.getenv('WRDS_PASSWORD')}"
-  "@wrds-pgdata.wharton.upenn.edu:9737/wrds"
-)
-wrds = create_engine(connection_string, 
-  pool_pre_ping = True)
+# Setup connections, one pooled WRDS connection per concurrent pull
+wrds = wrds_engine(pool_size = 4)
 tidy_finance = sqlite3.connect(
   database="data/tidy_finance_python.sqlite")
 
@@ -58,32 +54,29 @@ fisd_query = (
   "AND perpetual = 'N' "
   "AND (preferred_security = 'N' OR preferred_security IS NULL)"
 )
-fisd = pd.read_sql_query(
-  sql = fisd_query,
-  con = wrds, 
-  dtype = {"complete_cusip": str, 
-  "interest_frequency" : int,
-  "issue_id" : int, 
-  "isssuer_id" : int
-  }, 
-  parse_dates = {"maturity", "offering_date", 
-  "dated_date", "last_interest_date"}
-)
 
 # Pull data from Merged Issuer for Issuer info
 fisd_issuer_query = (
   "SELECT issuer_id, sic_code, country_domicile "
   "FROM fisd.fisd_mergedissuer"
 )
-fisd_issuer = pd.read_sql_query(
-  sql = fisd_issuer_query,
-  con = wrds,
-  dtype = {
-    "issuer_id" : int, 
-    "sic_cide" : str,
-    "country_domicile" : str
-  }
-)
+
+# Both pulls run concurrently and stream into data/wrds as parquet
+extract_tables(wrds, {
+  "fisd" : fisd_query, 
+  "fisd_issuer" : fisd_issuer_query
+})
+fisd = read_extract("fisd").astype({
+  "complete_cusip": "string", 
+  "interest_frequency" : int,
+  "issue_id" : int, 
+  "issuer_id" : int
+})
+fisd_issuer = read_extract("fisd_issuer").astype({
+  "issuer_id" : int, 
+  "sic_code" : "string",
+  "country_domicile" : "string"
+})
 fisd = (fisd.merge(
   fisd_issuer, how = "inner", on = "issuer_id"
 ).query(
@@ -91,10 +84,12 @@ fisd = (fisd.merge(
 ).drop(columns = "country_domicile"))
 
 # Save bond characteristics to database
-fisd.to_sql(
+bulk_write(
+  fisd, 
   name = "fisd", 
   con = tidy_finance, 
-  if_exists = "replace", index = False
+  if_exists = "replace", 
+  indexes = ["complete_cusip"]
 )
 
 # TRACE data excerpt querying 
@@ -108,34 +103,40 @@ with httimport.remote_repo(gist_url):
 cusips = list(fisd['complete_cusip'].unique())
 batch_size = 1000
 batches = np.ceil(len(cusips) / batch_size).astype(int)
+cusip_batches = {
+  j : cusips[((j - 1) * batch_size) : (min(j * batch_size, len(cusips)))]
+  for j in range(1, batches + 1)
+}
 
-# Run downloading in loops 
-for j in range(1, batches + 1):
-  cusip_batch = cusips[
-    ((j - 1) * batch_size) : (min(j * batch_size, len(cusips)))
-  ]
+def download_trace_batch(cusip_batch):
   cusip_batch_formatted = ", ".join(
     f"'{cusip}'" for cusip in cusip_batch)
-  cusip_string = f"({permno_batch_formatted})"
-  trace_enhanced_sub = cleaned_enhanced_trace(
+  cusip_string = f"({cusip_batch_formatted})"
+  return clean_enhanced_trace(
     cusips = cusip_string, 
     connection = wrds,
     start_date = "'01/01/2014'",
     end_date = "'11/30/2016'"
   )
-  if not trace_enhanced_sub.empty:
-    if j == 1:
-      if_exists_string = "replace"
-    else:
-      if_exists_string = "append"
-    trace_enhanced_sub.to_sql(
-      name = "trace_enhanced", 
-      con = tidy_finance,
-      if_exists = if_exists_string, 
-      index = False
-    )
-  print(
-    f"Batch {j} out of {batches} done ({j/batches}*100:.2f%)\n")
+
+# Run downloading in batches, a rerun resumes after the last finished one
+trace_runner = BatchRunner(
+  "trace_enhanced", 
+  params = {"cusips" : cusips, "batch_size" : batch_size, 
+  "start_date" : "01/01/2014", "end_date" : "11/30/2016"}, 
+  n_jobs = 4, prefer = "threads"
+).run(cusip_batches, download_trace_batch)
+
+# Store the finished batches in one transaction, replacing the table
+# once and indexing after the load
+with BulkWriter(
+  tidy_finance, "trace_enhanced", if_exists = "replace", 
+  indexes = [["cusip_id", "trd_exctn_dt"]]
+) as trace_writer:
+  for trace_enhanced_sub in trace_runner.iter_results():
+    if not trace_enhanced_sub.empty:
+      trace_writer.write(trace_enhanced_sub)
+print(trace_writer.summary())
     
 # Insights into corporate bonds
 date = pd.date_range(
@@ -8,29 +8,25 @@ from statsmodels.regression.rolling import RollingOLS
 from plotnine import *
 from mizani.breaks import date_breaks
 from mizani.formatters import percent_format, date_format
-from joblib import Parallel, delayed, cpu_count
 from itertools import product
+from data_catalog import default_catalog
+from instrument import stage
+from batch_runner import BatchRunner
+from sqlite_writer import bulk_write
+from capm_beta import capm_beta, read_daily_returns
 
 # Estimate beta from monthly return
-tidy_finance = sqlite3.connect(
-  database = "data/tidy_finance_python.sqlite"
+catalog = default_catalog()
+tidy_finance = catalog.connection
+with stage("load crsp_monthly") as load_stage:
+  crsp_monthly = (catalog.load(
+    "crsp_monthly_ff3", 
+    ["permno", "month", "industry", "ret_excess", "mkt_excess"]
+  ).dropna(subset = ["permno", "month", "industry", "ret_excess"]))
+  load_stage.rows(len(crsp_monthly))
+factors_ff3_monthly = catalog.load(
+  "factors_ff3_monthly", ["month", "mkt_excess"]
 )
-crsp_monthly = (pd.read_sql_query(
-  sql = "SELECT permno, month, industry, ret_excess "
-  "FROM crsp_monthly", 
-  con = tidy_finance, 
-  parse_dates = {"month"},
-).dropna())
-factors_ff3_monthly = pd.read_sql_query(
-  sql = "SELECT month, mkt_excess " 
-  "FROM factors_ff3_monthly",
-  con = tidy_finance, 
-  parse_dates = {"month"}
-)
-crsp_monthly = (crsp_monthly.merge(
-  factors_ff3_monthly, how = "left",
-  on = "month"
-))
 
 # Regress stock excess return on market portfolio excess return
 model_beta = (smf.ols(
@@ -133,145 +129,56 @@ plot_beta = (
 )
 plot_beta.draw()
 
-# Estimate beta using all monthly returns
-def roll_capm_estimation_for_joblib(permno, group):
-  if "date" in group.columns:
-    group = group.sort_values(by = "date")
-  else:
-    group = group.sort_values(by = "month")
-  beta_values = (RollingOLS.from_formula(
-    formula = "ret_excess ~ mkt_excess", 
-    data = group, 
-    window = window_size, 
-    min_nobs = min_obs, 
-    missing = "drop"
-  ).fit().params.get(
-    "mkt_excess"
-  ))
-  result = pd.DataFrame(beta_values)
-  result.columns = ["beta"]
-  result["month"] = group["month"].values
-  result["permno"] = permno
-  try:
-    result["date"] = group["date"].values
-    result = result[
-      (result.groupby("month")["date"].transform(
-        "max"
-      )) == result["date"]
-    ]
-  except(KeyError):
-    pass
-  return result
-permno_groups = (returns_monthly.merge(
-  valid_permnos, how = "inner", 
-  on = "permno"
-).groupby("permno", group_keys = False))
-n_cores = cpu_count() - 1
-beta_monthly = (
-  pd.concat(
-    Parallel(n_jobs = n_cores)
-    (delayed(roll_capm_estimation_for_joblib)(name, group)
-    for name, group in permno_groups)
-  ).dropna().rename(
+# Estimate beta using all monthly returns: the same padded panel and
+# 60-month window, with moving sums instead of one RollingOLS per stock
+with stage("rolling beta", permnos = len(valid_permnos)):
+  beta_monthly = capm_beta(
+    crsp_monthly, factors_ff3_monthly, "month", window_size, min_obs
+  ).rename(
     columns = {"beta": "beta_monthly"}
   )
-)
 
 # Estimating beta using daily returns
-factors_ff_daily = pd.read_sql_query(
-  sql = "SELECT date, mkt_excess FROM factors_ff3_daily",
-  con = tidy_finance, 
-  parse_dates = {"date"}
+factors_ff3_daily = catalog.load(
+  "factors_ff3_daily", ["date", "mkt_excess"]
 )
-unique_Date = factors_ff3_daily["date"].unique()
 
 # Consider 3 months of data as window
 window_size = 60
 min_obs = 50
-permnos = list(
-  crsp_monthly["permno"].unique.astype(str))
+permnos = [int(p) for p in crsp_monthly["permno"].unique()]
 batch_size = 500
 batches = np.ceil(
   len(permnos) / batch_size
 ).astype(int)
 
-# Same steps as monthly CRSP data
-beta_daily = []
-for j in range(1, batches + 1):
-  permno_batch = permnos[
-    ((j-1) * batch_size) : (
-      min(j * batch_size, len(permnos)))
-  ]
-  permno_batch_formatted = (
-    ", ".join(
-      f"'{permno}'" for permno in permno_batch
-    )
-  )
-  permno_string = f"({permno_batch_formatted})"
-  crsp_daily_sub_query(
-    "SELECT permno, month, date, ret_excess "
-    "FROM crsp_daily "
-    f"WHERE permno IN {permno_string}"
-  )
-  crsp_daily_sub = pd.read_sql_query(
-    sql = crsp_daily_sub_query, 
-    con = tidy_finance, 
-    dtype = {"permno" : int},
-    parse_dates = {"date", "month"}
-  )
-  valid_permnos = (crsp_daily_sub.groupby(
-    "permno"
-  )["permno"].count().reset_index(
-    name = "counts"
-  ).query(
-    r"counts > {window_size} + 1"
-  ).drop(
-    columns = "counts"
-  ))
-  permno_information = (crsp_daily_sub.merge(
-    valid_permnos, 
-    how = "inner", on = "permno"
-  ).groupby(
-    ["permno"]
-  ).aggregate(
-    first_date = ("date", "min"), 
-    last_date = ("date", "max")
-  ).reset_index()
-  )
-  unique_permno = permno_information["permno"].unique()
-  all_combinations = pd.DataFrame(
-    product(unique_permno, unique_date), 
-    colunms = ["permno", "date"]
-  )
-  returns_daily = (crsp_daily_sub.merge(
-    all_combinations, how = "right", 
-    on = ["permno", "date"]
-  ).merge(
-    permno_information, how = "left", 
-    on = "permno"
-  ).query(
-    "(date >= first_date) & (date <= last_date)"
-  ).drop(
-    columns = ["first_date", "last_date"]
-  ).merge(
-    factors_ff3_daily, how = "left", on = "date"
-  ))
-  permno_groups = (returns_daily.groupby(
-    "permno", group_keys = False
-  ))
-  beta_daily_sub = (
-    pd.concat(
-      Parallel(n_jobs = n_cores)
-      (delayed(roll_capm_estimation_for_joblib)(name, group)
-      for name, group in permno_groups)
-    ).dropna().rename(
-      columns = {"beta" : "beta_daily"}
-    )
+permno_batches = {
+  j : permnos[((j-1) * batch_size) : (min(j * batch_size, len(permnos)))]
+  for j in range(1, batches + 1)
+}
+
+# Same steps as monthly CRSP data, estimates of the last trading day of
+# each month
+def estimate_daily_beta_batch(permno_batch):
+  with catalog.lock:
+    crsp_daily_sub = read_daily_returns(tidy_finance, permno_batch)
+  return capm_beta(
+    crsp_daily_sub, factors_ff3_daily, "date", window_size, min_obs
+  ).rename(
+    columns = {"beta" : "beta_daily"}
   )
-  beta_daily.append(beta_daily_sub)
-  print(
-    f"Batch {j} out of {batches} done ({(j / batches) * 100:.2f}%)\n")
-beta_daily = pd.concat(beta_daily)
+
+# Each finished batch is stored, a rerun resumes after the last one
+# unless the daily tables changed since
+beta_daily = BatchRunner(
+  "beta_daily", 
+  params = {"permnos" : permnos, "batch_size" : batch_size, 
+  "window_size" : window_size, "min_obs" : min_obs}, 
+  inputs = {
+    table : catalog.fingerprint(table) 
+    for table in ["crsp_daily", "factors_ff3_daily"]
+  }
+).run(permno_batches, estimate_daily_beta_batch).read()
 
 # Comparing beta estimates
 beta_industries = (beta_monthly.merge(
@@ -382,12 +289,12 @@ plot_beta_comparison = (
 plot_beta_comparison.draw()
 
 # Write the estimates to database in future chapters
-(beta.to_dql(
+bulk_write(
+  beta, 
   name = "beta", 
   con = tidy_finance, 
-  if_exists = "replace", 
-  index = False
-))
+  if_exists = "replace"
+)
 
 # Plausibility tests, share of stocks with estimates 
 beta_long = (crsp_monthly.merge(
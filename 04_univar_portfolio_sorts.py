@@ -6,39 +6,32 @@ import statsmodels.api as sm
 from plotnine import *
 from mizani.formatters import percent_format
 from regtabletotext import prettify_result
+from pipeline import pipeline_catalog
+from panel_shift import panel_shift
+from instrument import stage
+from portfolio_sorts import portfolio_returns
 
 # Data preparation
-tidy_finance = sqlite3.connect(database = 
-"data/tidy_finance_python.sqlite")
-crsp_monthly = pd.readl_sql_query(
-  sql = "SELECT permno, month, ret_excess, mktcap_lag "
-  "FROM crsp_monthly", 
-  con = tidy_finance, 
-  parse_date = {"month"}
+catalog = pipeline_catalog()
+crsp_monthly = catalog.load(
+  "crsp_monthly", ["permno", "month", "ret_excess", "mktcap_lag"]
 )
-factors_ff3_monthly = pd.readl_sql_query(
-  sql = "SELECT month, mkt_excess FROM factors_ff3_monthly", 
-  con = tidy_finance,
-  parse_dates = {"month"}
+factors_ff3_monthly = catalog.load(
+  "factors_ff3_monthly", ["month", "mkt_excess"]
 )
-beta = (pd.read_sql_query(
-  sql = "SELECT permno, month, beta_monthly FROM beta", 
-  con = tidy_finance,
-  parse_dates = {"month"}
-))
+beta = catalog.load("beta", ["permno", "month", "beta_monthly"])
 
 # Sorting by Market beta
-beta_lag = (beta.assign(
-  month = lambda x: x["month"] + pd.DateOffset(months = 1)
-).get(
-  ["permno", "month", "beta_monthly"]
+data_for_sorts = (panel_shift(
+  crsp_monthly.merge(beta, how = "left", on = ["permno", "month"]), 
+  "beta_monthly", periods = 1
 ).rename(
-  columns = {"beta_monthly" : "beta_lag"}
-).dropna())
-data_for_sorts = (crsp_monthly.merge
-  beta_lag, how = "inner", 
-  on = ["permno", "month"]
-)
+  columns = {"beta_monthly_lag" : "beta_lag"}
+).drop(
+  columns = "beta_monthly"
+).dropna(
+  subset = ["beta_lag"]
+))
 
 # Periodic breakpoints to group stocks into portfolios
 beta_portfolios = (date_for_sorts.groupby(
@@ -81,41 +74,19 @@ model_fit = (sm.OLS.from_formula(
 ))
 prettify_result(model_fit)
 
-# Functional programming for Portfolio Sorts
-def assign_portfolio(data, sorting_variable, n_portfolios):
-  breakpoints = np.quantile(
-    data[sorting_variable].dropna(), 
-    np.linspace(0, 1, n_portfolios + 1),
-    method = "linear"
-  )
-  assigned_portfolios = pd.cut(
-    data[sorting_variable], 
-    bins = breakpoints, 
-    labels = range(1, breakpoints.size), 
-    include_lowest = True, 
-    right = False
-  )
-  return assigned_portfolios
-
-# Use top function to sort stocks into 10 portfolios each month
-beta_portfolios = (data_for_sorts.groupby(
-  "month"
-).apply(
-  lambda x: x.assign(
-    portfolio = assign_portfolio(x, "beta_lag", 10)
-  )
-).reset_index().groupby(
-  ["portfolio", "month"]
-).apply(
-  lambda x: x.assign(
-    ret = np.average(
-      x["ret_excess"], weights = x["mktcap_lag"]
-    )
-  )
-).reset_index().merge(
-  factors_ff3_monthly, how = "left", 
-  on = "month"
-))
+# Functional programming for Portfolio Sorts, shared with the benchmarks
+# through portfolio_sorts.py: sort stocks into 10 portfolios each month
+with stage(
+  "beta portfolio sorts", 
+  months = data_for_sorts["month"].nunique()
+) as sort_stage:
+  beta_portfolios = (portfolio_returns(
+    data_for_sorts, "beta_lag", 10
+  ).merge(
+    factors_ff3_monthly, how = "left", 
+    on = "month"
+  ))
+  sort_stage.rows(len(beta_portfolios))
 
 # More performance evaluation, CAPM-adjusted alphas
 beta_portfolios_summary = (beta_portfolios.groupby(
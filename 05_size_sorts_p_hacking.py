@@ -6,20 +6,16 @@ from plotnine import *
 from mizani.formatters import percent_format
 from itertools import product
 from joblib import Parallel, delayed, cpu_count
+from data_catalog import default_catalog
 
-# Data preparation & retrieval
-tidy_finance = sqlite3.connect(database = 
-"data/tidy_finance_python.sqlite")
-crsp_monthly = pd.read_sql_query(
-  sql = "SELECT * FROM crsp_monthly", 
-  con = tidy_finance, 
-  parse_dates = {"month"}
-)
-factors_ff3_monthly = pd.read_sql_query(
-  sql = "SELECT & from factors_ff3_monthly", 
-  con = tidy_finance, 
-  parse_dates = {"month"}
+# Data preparation & retrieval, compact dtypes for the full panel; the
+# catalog converts while reading and keeps only the compact frame
+catalog = default_catalog()
+crsp_monthly = catalog.load(
+  "crsp_monthly", 
+  compact = {"month_as_ordinal" : False}
 )
+factors_ff3_monthly = catalog.load("factors_ff3_monthly")
 
 # Size portfolio distributions
 market_cap_concentration = (crsp_monthly.groupby(
@@ -85,7 +81,7 @@ plot_market_cap_concentration.draw()
 
 # Examine different firm sizes across listing exchanges
 market_cap_share = (crsp_monthly.gropuby(
-  ["month", "exchange"]
+  ["month", "exchange"], observed = True
 ).aggregate(
   {"mktcap" : "sum"}
 ).reset_index(
@@ -141,7 +137,7 @@ percentiles):
   summary = (data.get(
     [filter_variable, variable]
   ).groupby(
-    filter_variable
+    filter_variable, observed = True
   ).describe(
     percentiles = percentiles
   )
@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 import datetime as dt
 import sqlite3
+from calendar_ordinal import shift_month
 
 # Data preparation
 tidy_finance = sqlite3.connect(
@@ -28,8 +29,7 @@ parse_dates = {"datadate"}
 
 # Book to market ratio, avoiding look-ahead bias
 me = (crsp_monthly.assign(
-  sorting_date = lambda x: 
-    x["month"] + pd.DateOffset(months = 1)
+  sorting_date = lambda x: shift_month(x["month"], 1)
 ).rename(
   columns = {"mktcap" : 'me}
 ).get(
@@ -41,9 +41,7 @@ bm = (book_equity.merge(
   on = ["gvkey", "month"]
 ).assign(
   bm = lambda x: x["be"]/x["mktcap"], 
-  sorting_dte = lambda x: x["month"] + pd.DateOffset(
-    months = 6
-  )
+  sorting_dte = lambda x: shift_month(x["month"], 6)
 ).assign(
   comp_date = lambda x: x["sorting_date"]
 ).get(
@@ -75,7 +73,7 @@ data_for_sorts = (data_for_sorts.sort_values(
   drop = True
 ).assign(
   threshold_date = lambda x: (
-    x["month"] - pd.DateOffset(months = 12)
+    shift_month(x["month"], -12)
   )
 ).query(
   "comp_date > threshold_date"
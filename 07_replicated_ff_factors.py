@@ -4,6 +4,7 @@ import numpy as np
 import sqlite3
 import statsmodels.formula.api as smf
 from regtabletotext import prettify_Result
+from calendar_ordinal import shift_month, july_formation_month, fiscal_formation_month
 
 # Prepare and load data sources
 tidy_finance = sqlite3.connect(
@@ -37,9 +38,7 @@ factors_ff5_monthly = pd.read_sql_query(
 size = (crsp_monthly.query(
   "month.dt.month == 6"
 ).assign(
-  sorting_date = lambda x: (
-    x["month"] + pd.DateOffset(months = 1)
-  )
+  sorting_date = lambda x: shift_month(x["month"], 1)
 ).get(
   ["permno", "exchange", "sorting_date", "mktcap"]
 ).rename(
@@ -49,19 +48,14 @@ size = (crsp_monthly.query(
 market_equity = (crsp_monthly.query(
   "month.dt.month == 12"
 ).assign(
-  sorting_date = lambda x : (
-    x["month"] + pd.DateOffset(months = 7)
-  )
+  sorting_date = lambda x: shift_month(x["month"], 7)
 ).get(
   ["permno", "gvkey", "sorting_date", "mktcap"]
 ).rename(
   columns = {"mktcap" : "me"}
 ))
 book_to_market = (compustat.assign(
-  sorting_date= lambda x: (pd.to_datetime(
-    x["datadate"].dt.year + 1
-  ).astype(str) + "0701", 
-  format = "%Y%m%d")
+  sorting_date = lambda x: fiscal_formation_month(x["datadate"])
 ).merge(
   market_equity, 
   how = "inner", 
@@ -119,14 +113,7 @@ portfolios = (sorting_variables.groupby(
 
 # Merge portfolios to return data for rest of the year
 portfolios = (crsp_monthly.assign(
-  sorting_date = lambda x: (
-    pd_to_datetime(
-      x["month"].apply(
-        lambda x: str(x.year - 1) + "0701" if x.month <= 6
-        else xtr(x.year) + "0701"
-      )
-    )
-  )
+  sorting_date = lambda x: july_formation_month(x["month"])
 ).merge(
   portfolios, how = "inner", 
   on = ["permno", "sorting_date"]
@@ -176,11 +163,7 @@ prettify_result(model_hml)
 
 # Fama French five factor model
 other_sorting_variables = (compustat.assign(
-  sorting_date = lambda x: (pd.to_datetime(
-    (
-      x["datadate"].dt.year + 1
-    ).astype(str) + "0701", format = "%Y%m%d"
-  ))
+  sorting_date = lambda x: fiscal_formation_month(x["datadate"])
 ).merge(
   market_equity, how = "inner", 
   on = ["gvkey", "sorting_date"]
@@ -229,12 +212,7 @@ portfolios = (sorting_variables.groupby(
 )
 )
 portfolios = (crsp_monthly.assign(
-  sorting_date = lambda x: (pd.to_datetime(
-    x["month"].apply(
-      lambda x: str(x.year-1) + "0701" if x.month <= 6
-      else str(x.year) + "0701"
-    )
-  ))
+  sorting_date = lambda x: july_formation_month(x["month"])
 ).merge(
   portfolios, how = "inner", 
   on = ["permno", "sorting_date"]
@@ -3,6 +3,10 @@ import pandas as pd
 import numpy as np
 import sqlite3 
 import statsmodels.formula.api as smf
+from calendar_ordinal import shift_month
+from panel_shift import panel_shift
+from instrument import stage
+from pipeline import pipeline_catalog
 
 # Data preparation
 tidy_finance = sqlite3.connect(
@@ -19,10 +23,8 @@ compustat = pd.read_sql_query(
   con = tidy_finance, 
   parse_dates = {"datadate"}
 )
-beta = pd.read_sql_query(
-  sql = "SELECT month, permno, beta_monthly FROM beta", 
-  con = tidy_finance, 
-  parse_dates = {"month"}
+beta = pipeline_catalog().load(
+  "beta", ["month", "permno", "beta_monthly"]
 )
 characteristics = (compustat.assign(
   month = lambda x: 
@@ -36,7 +38,7 @@ characteristics = (compustat.assign(
 ).assign(
   bm = lambda x: x["be"] / x["mktcap"], 
   log_mktcap = lambda x: np.log(x["mktcap"]), 
-  sorting_date = lambda x: x["month"] + pd.DateOffset(months = 6)
+  sorting_date = lambda x: shift_month(x["month"], 6)
 ).get(
   ["gvkey", "bm", "log_mktcap", "beta_monthly", 
   "sorting_date"]
@@ -63,32 +65,24 @@ data_fama_macbeth = (crsp_monthly.merge(
     drop = True
   )
 )
-data_fama_macbeth_lagged = (data_fama_macbeth.assign(
-  month = lambda x: x["month"] - pd.DateOffset(months = 1)
-).get(
-  ["permno", "month", "ret_excess"]
-).rename(
-  columns = {"ret_excess" : "ret_excess_lead"}
-))
-data_fama_macbeth = (data_fama_macbeth.merge(
-  data_fama_macbeth_lagged, 
-  how = "left", 
-  on = ["permno", "month"]
+data_fama_macbeth = (panel_shift(
+  data_fama_macbeth, "ret_excess", periods = -1
 ).get(
   ["permno", "month", "ret_excess_lead", 
   "beta", "log_mktcap", "bm"]
 ).dropna())
 
 # Cross section regressions
-risk_premiums = (data_fama_macbeth.groupby(
-  "month"
-).apply(
-  lambda x: smf.ols(
-    formula = "ret_excess_lead ~ beta + log_mktcap + bm",
-    data = x
-  ).fit().params
-).reset_index()
-)
+with stage("FM regressions", rows = len(data_fama_macbeth)):
+  risk_premiums = (data_fama_macbeth.groupby(
+    "month"
+  ).apply(
+    lambda x: smf.ols(
+      formula = "ret_excess_lead ~ beta + log_mktcap + bm",
+      data = x
+    ).fit().params
+  ).reset_index()
+  )
 
 # Time series aggregation
 price_of_rise = (risk_premiums.melt(
@@ -6,6 +6,8 @@ import datetime as dt
 import itertools
 import linearmodels as lm
 from regtabletotext import prettify_result, prettify_result
+from fe_absorb import AbsorbedPanel, comparison_table
+from winsorize import winsorize_frame
 
 # Data Preparation
 tidy_finance = sqlite3.connect()
@@ -40,18 +42,11 @@ data_investment = (data_investment.merge(
 )
 
 # Winsorizing main variables
-def winsorize(x, cut):
-  tmp_x = x.copy()
-  upper_quantile = np.nanquantile(tmp_x, 1 - cut)
-  lower_quantile = np.nanquantile(tmp_x, cut)
-  tmp_x[] = upper_quantile
-  tmp_x[tmp_x < lower_quantile] = lower_quantile
-  return tmp_x
-data_investment = (data_investment.assign(
-  investment_lead = lambda x: winsorize(x[],
-  cash_flows = lambda x: winsorize(x[], 0.01), 
-  tobins_q = lambda x: winsorize(, 0.01))
-))
+data_investment, investment_winsorizer = winsorize_frame(
+  data_investment, 
+  columns = ["investment_lead", "cash_flows", "tobins_q"], 
+  cut = 0.01
+)
 
 # Tabulating summary statistics
 data_investment_summary = (data_investment.melt(
@@ -74,43 +69,47 @@ model_ols = (lm.PanelOLS.from_formula(
 ).fit())
 prettify_result(model_ols)
 
-# Including firm FE
-model_fe_firm = (lm.PanelOLS.from_formula(
-  formula = (
-    "investment_lead ~ cash_flows + tobins_q + EntityEffects"
-    ), 
-    data = data_investment.set_index(["gvkey", "year"]),
-).fit())
-prettify_result(model_fe_firm)
+# Including firm FE, absorbed once for the firm-FE fit
+panel_firm = AbsorbedPanel(
+  data_investment, 
+  effects = ["gvkey"], 
+  variables = ["investment_lead", "cash_flows", "tobins_q"]
+)
+model_fe_firm = panel_firm.fit(
+  "investment_lead", ["cash_flows", "tobins_q"]
+)
 
-# Including time FE
-model_fe_firmyear = (lm.PanelOLS.from_formula(
-  formula = (
-    
-  ), 
-  data = data_investment.set_index(["gvkey", "year"]),
-).fit())
-prettify_result(model_fe_firmyear)
+# Including time FE, the two-way absorption is shared by the clustered
+# fits below
+panel_firmyear = AbsorbedPanel(
+  data_investment, 
+  effects = ["gvkey", "year"], 
+  variables = ["investment_lead", "cash_flows", "tobins_q"]
+)
+model_fe_firmyear = panel_firmyear.fit(
+  "investment_lead", ["cash_flows", "tobins_q"]
+)
 
 # Comparing such models
-prettify_result([model_ols, model_fe_firm, 
-model_fe_firmyear])
+comparison_table({
+  "firm FE" : model_fe_firm, 
+  "firm-year FE" : model_fe_firmyear
+}).round(4)
 
 # Clustering SE, residuals correlated across years
-model_cluster_firm = lm.PanelOLS.from_formula(
-  formula = (), 
-  data = data_investment.set_index(),
-).fit(cov_type = "clustered"", 
-cluster_entity = True, cluster_time = False)
-model_cluster_firmyear = lm.PanelOLS.from_formula(
-  formula = (), 
-  data = data_investment.set_index([]), 
-).fit(cov_type = "clustered", 
-cluster_entity = True, cluster_time = True)
-prettify_result([
-  model_fe_firmyear, model_cluster_firm,
-  model_cluster_firmyear
-])
+model_cluster_firm = panel_firmyear.fit(
+  "investment_lead", ["cash_flows", "tobins_q"], 
+  clusters = ["gvkey"]
+)
+model_cluster_firmyear = panel_firmyear.fit(
+  "investment_lead", ["cash_flows", "tobins_q"], 
+  clusters = ["gvkey", "year"]
+)
+comparison_table({
+  "firm-year FE" : model_fe_firmyear, 
+  "clustered by firm" : model_cluster_firm, 
+  "clustered by firm and year" : model_cluster_firmyear
+}).round(4)
 
 # Exercises 
 # 2 way FE model with 2 way clustered SE, COMPUSTAT
@@ -9,6 +9,10 @@ from scipy.stats import norm
 from mizani.breaks import date_breaks
 from mizani.formatters import date_format
 from regtabletotext import prettify_result
+from bond_panel import build_bond_panel, read_trace_chunks
+from event_study import fit_event_study
+from fe_absorb import AbsorbedPanel, comparison_table
+from wild_bootstrap import wild_cluster_bootstrap
 
 # Data preparation
 tidy_finance = sqlite3.connect(database = 
@@ -18,12 +22,6 @@ fisd = (pd.read_sql_query(
   con = tidy_finance, 
   parse_dates = {"maturity"}).dropna()
 )
-trace_enhanced = (pd.read_sql_query(
-  sql= ,
-  con = tidy_finance, 
-  parse_dates = {"trd_exctn_dt"}
-).dropna()
-)
 
 # Further prepare bonds datasets
 treatment_date = pd.to_datetime("2015-12-12")
@@ -44,37 +42,9 @@ bonds = (fisd.query(
 )
 
 # Aggregating individual transaction in bond yields
-trace_enhanced = (trace_enhanced.query(
-  
-).assign(
-  
-).assign(
-  
-)
-)
-trace_aggregated = (trace_enhanced.groupby(
-  []
-  ).aggregate(
-    weighted_yield_sum = (), 
-    weight_sum = ("weight", "sum"), 
-    trades = ("rptd_pr", "count")
-  ).reset_index().assign(
-    
-  ).dropna(subset = ["avg_yield"]
-  ).query("trades >= 5"
-  ).assign(
-    
-  ).assign(
-    
-  )
-)
-date_index = (trade_aggregated.groupby(
-  
-).idmax()
-)
-trace_aggreagted = (
-  trace_aggregated.loc[date_index].get([
-    "cusip_id", "month", "avg_yield"])
+trace_aggregated = build_bond_panel(
+  read_trace_chunks(tidy_finance), 
+  min_trades = 5
 )
 bonds_panel = (bonds.merge(
   trace_aggregated, how = "inner", 
@@ -104,52 +74,59 @@ bonds_panel_summary = bonds_panel.melt(
 )
 np.round(bonds_panel_summary, 2)
 
-# Panel Regressions
-
-# Visualizing Parallel trends
-
-# FE model and focus on polluter response to signing
-bonds_panel_alt = (bonds_panel
+# Panel Regressions: pooled model with the bond characteristics, then
+# bond and month FE absorbed once, with standard errors clustered by bond
+bonds_panel_pooled = AbsorbedPanel(
+  bonds_panel.assign(intercept = 1.0), 
+  effects = [], 
+  variables = ["avg_yield", "intercept", "treated", "post_period", 
+  "polluter", "log_offering_amount", "time_to_maturity"], 
+  keep = ["cusip_id"]
 )
-variables = (bonds_panel_alt.get(
-  
-).reset_index(drop = True)
+model_without_fe = bonds_panel_pooled.fit(
+  "avg_yield", 
+  ["intercept", "treated", "post_period", "polluter", 
+  "log_offering_amount", "time_to_maturity"], 
+  clusters = ["cusip_id"]
 )
-formula = "avg_yield ~ 1+ "
-for j in range(variables.shape[0]):
-  if variables["diff_to_treatment"].iloc[j] != 0:
-    old_names = list()
-    bonds_panel_alt["new_var"] = (
-      
-    ) & bonds_panel_alt["polluter"]
-    
-    diff_to_treatment_value = variables[
-      "diff_to_treatment"].iloc[j]
-    direction = "lag" if 
-    diff_to_treatment_value <0 else "lead"
-    abs_diff_to_treatment = int()
-    new_var_name = f""
-    variables.at[j, "variable_name"] = new_var_name
-    bonds_panel_alt[] = bonds_panel_alt[]
-    formula += (f"")
-formula = formula+" + EntityEffects + TimeEffects"
-model_with_fe_time = (lm.PanelOLS.from_formula(
-  formula = formula, 
-  data = bonds_panel_alt.set_index(
-    ["cusip_id", "month"]
-  ).fit().summary)
-
-# Collect regression results, with CI
-lag0_row = pd.DataFrame(
-  
+bonds_panel_absorbed = AbsorbedPanel(
+  bonds_panel, 
+  effects = ["cusip_id", "month"], 
+  variables = ["avg_yield", "treated"], 
+  keep = ["sic_code"]
 )
-model_with_fe_time_coefs = (
-  
+model_with_fe = bonds_panel_absorbed.fit(
+  "avg_yield", ["treated"], clusters = ["cusip_id"]
+)
+comparison_table({
+  "without FE" : model_without_fe, 
+  "with FE" : model_with_fe
+}).round(4)
+
+# Wild cluster bootstrap on the same absorbed panel, few treated
+# industries as clusters
+model_treated_bootstrap = wild_cluster_bootstrap(
+  bonds_panel_absorbed, 
+  outcome = "avg_yield", 
+  regressors = ["treated"], 
+  term = "treated", 
+  cluster = "sic_code", 
+  weights = "webb", 
+  seed = 42, 
+  n_jobs = -1
 )
-model_with_fe_time_coefs = pd.concat(
-  [], 
-  ignore_index = True
+
+# Visualizing Parallel trends
+
+# FE model and focus on polluter response to signing
+model_with_fe_time, model_with_fe_time_coefs = fit_event_study(
+  bonds_panel, 
+  treatment_date = treatment_date, 
+  outcome = "avg_yield", 
+  treated = "polluter", 
+  reference = 0
 )
+model_with_fe_time.summary
 
 # Plot figure with coefficient estimates
 polluter_plot = (
@@ -15,6 +15,10 @@ from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.linear_model import ElasticNet, Lasso, Ridge
+from interactions import InteractionFeatures
+from reg_path import lasso_coef_path, ridge_coef_path, path_long
+from path_cv import path_grid_search
+from rolling_forecast import industry_forecasts
 
 # Data preparation
 tidy_finance = sqlite3.connect(
@@ -89,31 +93,11 @@ macro_variables = data.filter(
 factor_variables = data.filter(
   like = "factor"
 ).columns
-column_combinations = list(
-  product(
-    macro_variables, factor_variables
-  )
-)
-new_column_values = []
-for macro_column, factor_column in column_combinations:
-  new_column_values.append(
-    data[macro_column] * data[factor_column]
-  )
-column_names = [" x ".join(t) for t in column_combinations]
-new_columns = pd.DataFrame(
-  dict(zip(
-    column_names, new_column_values
-  ))
-)
-data = pd.concat([data, new_columns], axis = 1)
-preprocessor = ColumnTransformer(
-  transormers = [
-    ("scale", StandardScaler(), 
-    [col for col in data.columns 
-    if col not in ["ret_excess", "month", "industry"]])
-  ], 
-  remainder = "drop",
-  verbose_feature_names_out = False
+preprocessor = InteractionFeatures(
+  macro_columns = macro_variables, 
+  factor_columns = factor_variables, 
+  include_base = True, 
+  standardize = True
 )
 
 # Build a model
@@ -184,35 +168,29 @@ predicted_values_plot = (
 )
 predicted_values_plot.draw()
 
+# Real-time evaluation, refit every month on a rolling window
+industry_oos, industry_oos_summary = industry_forecasts(
+  data, 
+  macro_columns = macro_variables, 
+  factor_columns = factor_variables, 
+  alpha = 0.007, 
+  l1_ratio = 1, 
+  window = 60, 
+  expanding = False
+)
+
 # What do estimated coefficients look like? 
 x = preprocessor.fit_transform(data_manufacturing)
 y = data_manufacturing["ret_excess"]
 alphas = np.logspace(-5, 5, 100)
-coefficient_lasso = []
-for a in alphas:
-  lasso = Lasso(alpha = a, fit_intercept = False)
-  coefficients_lasso.append(
-    lasso.fit(x, y).coef_
-  )
-coefficients_lasso = (pd.DataFrame(coefficients_lasso
-).assign(
-  alpha = alphas, model = "Lasso"
-).melt(
-  id_vars = ["alpha", "model"]
-))  
-coefficients_ridge = []
-for a in alphas:
-  ridge = Ridge(alpha = a, fit_intercept = False)
-  coefficients_ridge.append(
-    ridge.fit(x, y).coef_
-  )
-coefficients_ridge = (pd.DatFrame(
-  coefficients_ridge
-).assign(
-  alpha = alphas, model = "Ridge"
-).melt(
-  id_vars = ["apha", "model"]
-))
+coefficients_lasso = path_long(
+  lasso_coef_path(x, y, alphas), 
+  alphas, model = "Lasso"
+)
+coefficients_ridge = path_long(
+  ridge_coef_path(x, y, alphas), 
+  alphas, model = "Ridge"
+)
 
 # Trajectory of regression coefficients based on penalty
 coefficients_plot = (
@@ -298,45 +276,22 @@ guides(linetype = "none")
 ) 
 validation_plot.draw()
 
-# Full workflow
-lm_model = Lasso(fit_intercept = False, 
-max_iter = 5000)
-params = {"regressor__alpha" : alphas}
-lm_pipeline = Pipeline([
-  ("preprocessor", preprocessor), 
-  ("regressor", lm_model)
-])
-
-# Simple parallel compuation for reducing time
+# Full workflow, industries and folds in parallel
 all_industries = data["industry"].drop_duplicates()
-results = []
-for industry in all_industries:
-  print(industry)
-  finger = GridSearchCV(
-    lm_pipeline, 
-    param_grid = params, 
-    scoring = "neg_mean_squared_error", 
-    cv = data_folds
-  )
-finder = finder.fit(
-  data.query("industry == @industry"), 
-  data.query(
-    "industry == @industry"
-  ).get("ret_excess")
-)
-results.append(
-  pd.DataFrame(
-    finder.best_estimator__.named_steps,regressor.coef_ != 0
-  )
+industry_cv_results, industry_selected = path_grid_search(
+  data, 
+  preprocessor = preprocessor, 
+  alphas = alphas, 
+  cv = data_folds, 
+  l1_ratios = (1.0,), 
+  group = "industry", 
+  scoring = "neg_mean_squared_error", 
+  n_jobs = -1
 )
-selected_factors = (
-  pd.DataFrame(
-    lm_pipeline[:-1].get_feature_names_out(), 
-    columns = ["variable"]
-  ).assign(
-    variable = lambda x: (
-      x["variable"].str.replace("factor_ff_|q|macro_", ""))
-).assign(**dict(zip(all_industries, results)))
+selected_factors = (industry_selected.reset_index(
+).assign(
+  variable = lambda x: (
+    x["variable"].str.replace("factor_ff_|q|macro_", ""))
 ).melt(
   id_vars = "variable", var_name = "industry"
 ).query("value == True")
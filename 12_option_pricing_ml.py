@@ -12,17 +12,11 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.neural_network import MLPRegressor
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.linear_model import Lasso
-
-# Options Pricing
-def black_scholes_price(S, K, r, T, sigma):
-  d1 = (np.log(S/K) + (r + sigma**2 / 2) * T)/(
-    sigma * np.sqrt(T)
-  )
-  d2 = d1 - sigma * np.sqrt(T)
-  price = S * norm.cdf(d1) - K * np.ext(
-    -r * T
-  ) * norm.cdf(d2)
-  return price
+from bs_kernel import black_scholes_price
+from option_grid import OptionGrid
+from nn_training import train_out_of_core
+from fused_predict import benchmark_export
+from error_cube import error_cube
 
 # Data simulation
 random_state = 42
@@ -32,33 +26,27 @@ K = np.arange(20, 91)
 r = np.arange(0, 0.051, 0.01)
 T = np.arange(3/12, 2.01, 1/12)
 sigma = np.arange(0.1, 0.81, 0.1)
-option_prices = pd.DataFrame(
-  product(S, K, r, T, sigma), 
-  columns = ["S", "K", "r", "T", 
-  "sigma"]
-)
-option_prices["black_scholes"] = black_scholes_price(
-  option_prices["S"].values, 
-  option_prices["K"].values, 
-  option_prices["r"].values, 
-  option_prices["T"].values, 
-  option_prices["sigma"].values
-)
-option_prices = (option_prices.assign(
-   observed_price = lambda x: (
-     x["black_scholes"] + np.random.normal(
-       scale = 0.15
-     )
-   )
-)
+option_grid = OptionGrid(
+  S, K, r, T, sigma, 
+  noise_scale = 0.15, 
+  seed = random_state
 )
 
-# Train and testing data
-train_data, test_data = train_test_split(
-  option_prices, 
+# Train and testing data, sampled in index space
+test_index = option_grid.test_index(
   test_size = 0.01, 
-  random_state = random_state
+  seed = random_state
 )
+test_data = option_grid.frame(test_index)
+
+# Training set streamed chunk by chunk into memory-mapped arrays for the
+# estimators without partial_fit, no training frame is built in memory
+train_x, train_y = option_grid.write_memmap(
+  "data/option_grid", 
+  test_index, 
+  dtype = np.float64
+)
+train_X = pd.DataFrame(train_x, columns = option_grid.names, copy = False)
 preprocessor = ColumnTransformer(
   transformers = [(
     "mnormalize_predictors", 
@@ -79,12 +67,7 @@ nnet_pipeline = Pipeline([
   ("preprocessor", preprocessor),
   ("regressor", nnet_model)
 ])
-nnet_fit = nnet_pipeline.fit(
-  train_data.drop(
-    columns = ["observed_price"]
-  ), 
-  train_data.get("observed_price")
-)
+nnet_fit = nnet_pipeline.fit(train_X, train_y)
 rf_model = RandomForestRegressor(
   n_estimators = 50, 
   min_samples_leaf = 2000, 
@@ -94,11 +77,30 @@ rf_pipeline = Pipeline([
   ("preprocessor", preprocessor), 
   ("regressor", rf_model)
 ])
-rf.fit = rf_pipeline.fit(
-  train_data.drop(
-    columns = ["observed_price"]
+rf.fit = rf_pipeline.fit(train_X, train_y)
+
+# Out-of-core training, streamed mini-batches from the grid
+validation_index = np.setdiff1d(
+  option_grid.test_index(test_size = 0.01, seed = random_state + 1), 
+  test_index
+)
+holdout_index = np.union1d(test_index, validation_index)
+nnet_stream_fit, nnet_stream_history = train_out_of_core(
+  MLPRegressor(
+    hidden_layer_sizes = 10, 
+    solver = "adam", 
+    random_state = random_state
   ), 
-  train_data.get("observed_price")
+  train_stream = lambda epoch: option_grid.iter_train_chunks(
+    holdout_index, seed = random_state + epoch
+  ), 
+  validation_stream = lambda: option_grid.iter_index_chunks(
+    validation_index
+  ), 
+  batch_size = 1000, 
+  max_epochs = 50, 
+  patience = 5, 
+  checkpoint_path = "data/nnet_stream.joblib"
 )
 
 # Deep neural net
@@ -113,12 +115,7 @@ deepnnet_pipeline = Pipeline([
   ("preprocessor", preprocessor), 
   ("regressor", deepnnet_model)
 ])
-deepnnet_fit = deepnnet_pipeline.fit(
-  train_data.drop(
-    columns = ["observed_price"]
-  ), 
-  train_data.get("observed_price")
-)
+deepnnet_fit = deepnnet_pipeline.fit(train_X, train_y)
 
 # Universal approximation
 lm_pipeline = Pipeline([
@@ -130,54 +127,65 @@ lm_pipeline = Pipeline([
   ("scaler", StandardScaler()), 
   ("regressor", Lasso(alpha = 0.01))
 ])
-lm_fit = lm_pipeline.fit(
-  train_data.get([
-    "S", "K", "r", "T", "sigma"
-  ]), 
-  train_data.get("observed_price")
-)
+lm_fit = lm_pipeline.fit(train_X, train_y)
 
 # Prediction evaluation
 test_X = test_data.get(
   ["S", "K", "r", "T", "sigma"]
 )
 test_y = test_data.get("observed_price")
-predictive_performance = (pd.concat(
-  [test_data.reset_index(drop = True), 
-  pd.DataFrame({
-    "Random forest" : rf_fit.predict(test_X), 
-    "Single layer" : nnet_fit.predict(test_X), 
-    "Deep NN" : deepnnet_fit.predict(test_X), 
-    "Lasso" : lm_fit.predict(test_X)
-  })], axis = 1
-).melt(
-  id_vars = ["S", "K", "r", "T", "sigma", 
-  "black_scholes", "observed_price"], 
-  var_name = "Model", 
-  value_name = "Predicted"
-).assign(
-  moneyness = lambda x: x["S"] - x["K"],
-  pricing_error = lambda x: np.abs(
-    x["Predicted"] - x["black_scholes"]
-  )
-))
+model_predictions = {
+  "Random forest" : rf_fit.predict(test_X), 
+  "Single layer" : nnet_fit.predict(test_X), 
+  "Deep NN" : deepnnet_fit.predict(test_X), 
+  "Lasso" : lm_fit.predict(test_X)
+}
+predictive_performance = error_cube(
+  test_data, 
+  model_predictions, 
+  reference = "black_scholes", 
+  bins = {"moneyness" : np.arange(-50, 45, 5)}
+)
+
+# Fused NumPy evaluators against the pipelines' predict
+export_benchmark = benchmark_export(
+  {
+    "Random forest" : rf_fit, 
+    "Single layer" : nnet_fit, 
+    "Deep NN" : deepnnet_fit, 
+    "Lasso" : lm_fit
+  }, 
+  test_X, 
+  repeats = 5
+)
+
+# The NumPy forest descent is measured separately: forests are exported
+# with sklearn's predict unless the fused descent is faster here
+forest_benchmark = benchmark_export(
+  {"Random forest" : rf_fit}, 
+  test_X, 
+  repeats = 5, 
+  fuse_forests = True
+)
 
 # Show the results graphically pricing accuracy
 predictive_performance_plot = (
   ggplot(predictive_performance, 
   aes(
-    x = "moneyness", 
-    y = "pricing_error"
+    x = "moneyness_bin", 
+    y = "mean_abs_error"
   )) + 
-  geom_point(
-    alpha = 0.05
+  geom_line() + 
+  geom_line(
+    aes(y = "abs_error_q90"), 
+    linetype = "dashed"
   ) + 
-  facet_wrap("Model") + 
+  facet_wrap("model") + 
   labs(
     x = "Moneyness, S-K", 
-    y = "Absolute prediction error", 
+    y = "Absolute prediction error (mean, 90% quantile)", 
     title = "Prediction errors of call options, different models"
   ) + 
   theme(legend_position = "")
 )
-prediction_performance_plot.draw()
+predictive_performance_plot.draw()
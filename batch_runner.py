@@ -0,0 +1,151 @@
+# batch_runner.py
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+from joblib import Parallel, delayed
+from instrument import stage
+
+batch_path = "data/batches"
+
+# Write to a temporary file first so a crash never leaves a partial file
+def write_atomic(data, path):
+  tmp_path = f"{path}.tmp"
+  data.to_parquet(tmp_path, index = False)
+  os.replace(tmp_path, path)
+
+def write_json_atomic(content, path):
+  tmp_path = f"{path}.tmp"
+  with open(tmp_path, "w") as file:
+    json.dump(content, file, indent = 2)
+  os.replace(tmp_path, path)
+
+def partition_name(key):
+  return f"part-{key}.parquet"
+
+# Compute one batch and store it as its own partition; runs in a worker
+def run_batch(function, payload, path):
+  tic = time.perf_counter()
+  result = function(payload)
+  if result is None:
+    result = pd.DataFrame()
+  write_atomic(result, path)
+  return len(result), time.perf_counter() - tic
+
+def run_keyed_batch(key, function, payload, path):
+  return (key, *run_batch(function, payload, path))
+
+def json_hash(content):
+  return hashlib.sha1(json.dumps(
+    content, sort_keys = True, default = str
+  ).encode()).hexdigest()
+
+# Batches keyed by name with a manifest of the finished ones. A rerun
+# with the same params and inputs skips finished batches; changed params
+# or inputs start over. inputs fingerprints the data the batches read,
+# e.g. catalog fingerprints of the source tables, and every finished
+# batch also records the hash of its payload, so a batch whose payload
+# changed is recomputed. prefer = "threads" suits batches that wait on a
+# database connection.
+class BatchRunner:
+  def __init__(self, name, params = None, inputs = None,
+               store_dir = batch_path, n_jobs = 1, prefer = "processes"):
+    self.name = name
+    self.directory = os.path.join(store_dir, name)
+    self.manifest_path = os.path.join(self.directory, "manifest.json")
+    self.params = params or {}
+    self.inputs = inputs or {}
+    self.n_jobs = n_jobs
+    self.prefer = prefer
+    os.makedirs(self.directory, exist_ok = True)
+    self.manifest = self.load_manifest()
+
+  def empty_manifest(self):
+    return {"params" : json_hash(self.params),
+      "inputs" : json_hash(self.inputs), "completed" : {}}
+
+  def load_manifest(self):
+    manifest = self.empty_manifest()
+    if os.path.exists(self.manifest_path):
+      with open(self.manifest_path) as file:
+        stored = json.load(file)
+      if (stored.get("params") == manifest["params"]
+          and stored.get("inputs") == manifest["inputs"]):
+        return stored
+      self.clear()
+    return manifest
+
+  # Drop all partitions, e.g. after the params or inputs changed
+  def clear(self):
+    for file_name in os.listdir(self.directory):
+      if file_name.startswith("part-") or file_name == "manifest.json":
+        os.remove(os.path.join(self.directory, file_name))
+    self.manifest = self.empty_manifest()
+
+  def is_complete(self, key, payload):
+    entry = self.manifest["completed"].get(str(key))
+    return (entry is not None and entry.get("payload") == json_hash(payload)
+      and os.path.exists(os.path.join(self.directory, entry["file"])))
+
+  def pending(self, batches):
+    return [key for key in batches
+      if not self.is_complete(key, batches[key])]
+
+  def mark_complete(self, key, index, payload, rows, seconds):
+    self.manifest["completed"][str(key)] = {
+      "file" : partition_name(key),
+      "index" : index,
+      "payload" : json_hash(payload),
+      "rows" : rows,
+      "seconds" : round(seconds, 3),
+      "finished" : time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    write_json_atomic(self.manifest, self.manifest_path)
+
+  # batches maps key -> payload, function(payload) -> DataFrame. Keys
+  # finished in an earlier run are skipped, the rest run in key order
+  # with at most n_jobs at a time and are recorded as they finish.
+  def run(self, batches, function):
+    keys = self.pending(batches)
+    index = {key : i for i, key in enumerate(batches)}
+    total = len(batches)
+    done = total - len(keys)
+    with stage(f"{self.name} batches", batches = total,
+               resumed = done) as run_stage:
+      tasks = (
+        delayed(run_keyed_batch)(key, function, batches[key],
+          os.path.join(self.directory, partition_name(key)))
+        for key in keys
+      )
+      for key, rows, seconds in Parallel(
+        n_jobs = self.n_jobs, prefer = self.prefer,
+        return_as = "generator_unordered"
+      )(tasks):
+        self.mark_complete(key, index[key], batches[key], rows, seconds)
+        done += 1
+        print(f"Batch {done} out of {total} done "
+          f"({done / total * 100:.2f}%)\n")
+      run_stage.rows(sum(
+        e["rows"] for e in self.manifest["completed"].values()
+      ))
+    return self
+
+  # Partition files in batch order, whatever order they finished in
+  def partitions(self, keys = None):
+    completed = self.manifest["completed"]
+    if keys is None:
+      keys = sorted(completed, key = lambda k: completed[k]["index"])
+    else:
+      keys = [str(k) for k in keys]
+    return [os.path.join(self.directory, completed[k]["file"])
+      for k in keys if k in completed]
+
+  def iter_results(self, keys = None):
+    for path in self.partitions(keys):
+      yield pd.read_parquet(path)
+
+  def read(self, keys = None):
+    results = [r for r in self.iter_results(keys) if not r.empty]
+    return pd.concat(results, ignore_index = True) if results else (
+      pd.DataFrame())
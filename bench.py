@@ -0,0 +1,245 @@
+# bench.py
+import os
+import sys
+import json
+import time
+import argparse
+import sqlite3
+import platform
+import tempfile
+import subprocess
+import pandas as pd
+import numpy as np
+from itertools import product
+from synthetic_data import synthetic_tables
+from pipeline import (book_to_market, replicated_factors,
+  cross_section_premia)
+from portfolio_sorts import portfolio_returns
+from capm_beta import capm_beta
+from panel_shift import panel_shift
+from bond_panel import build_bond_panel
+from fe_absorb import AbsorbedPanel
+from instrument import peak_rss_mb
+from sqlite_writer import BulkWriter
+
+results_path = "bench_results"
+output_path = "bench_output.txt"
+
+# Stocks and bonds per scale; daily data only up to "medium" since the
+# daily panel grows with the number of stock-days
+scales = {
+  "small" : {"n_stocks" : 500, "n_bonds" : 200, "daily" : True},
+  "medium" : {"n_stocks" : 2000, "n_bonds" : 1000, "daily" : True},
+  "large" : {"n_stocks" : 8000, "n_bonds" : 4000, "daily" : False}
+}
+
+# Slowdown ratio against the baseline that counts as a regression, and
+# differences below min_seconds are treated as timer noise
+default_threshold = 1.25
+thresholds = {"fe_regression" : 1.5}
+min_seconds = 0.05
+
+def rolling_beta(tables, window = 60, min_obs = 48):
+  return capm_beta(
+    tables["crsp_monthly"].get(["permno", "month", "ret_excess"]),
+    tables["factors_ff3_monthly"], "month", window, min_obs
+  )
+
+def daily_rolling_beta(tables, window = 60, min_obs = 50):
+  return capm_beta(tables["crsp_daily"], tables["factors_ff3_daily"],
+    "date", window, min_obs)
+
+def portfolio_sorts(tables):
+  data = tables["crsp_monthly"].dropna(subset = ["mktcap_lag"])
+  return portfolio_returns(data, "mktcap_lag", 10)
+
+# Small version of the chapter 5 p-hacking grid
+def p_hacking_grid(tables):
+  data = tables["crsp_monthly"].dropna(subset = ["mktcap_lag"])
+  grid = product([2, 5, 10], [["NYSE"], ["NYSE", "NASDAQ", "AMEX"]],
+    [True, False])
+  returns = [
+    portfolio_returns(data.query("exchange in @exchanges"), "mktcap_lag",
+      n, value_weighted)
+    for n, exchanges, value_weighted in grid
+  ]
+  return pd.concat(returns)
+
+def ff_replication(tables):
+  crsp = tables["crsp_monthly"]
+  return replicated_factors(crsp, book_to_market(crsp, tables["compustat"]))
+
+# Cross-sectional regressions of next month's return on size and last
+# month's return, then time-series t-statistics
+def fama_macbeth(tables):
+  data = (panel_shift(
+    tables["crsp_monthly"], "ret_excess", periods = [-1, 1]
+  ).assign(
+    log_mktcap = lambda x: np.log(x["mktcap"])
+  ).dropna(subset = ["ret_excess_lead", "ret_excess_lag"]))
+  premiums = cross_section_premia(data, ["log_mktcap", "ret_excess_lag"])
+  summary = premiums.mean() / premiums.std() * np.sqrt(len(premiums))
+  return premiums.assign(**{f"t_{k}" : v for k, v in summary.items()})
+
+def trace_aggregation(tables, chunksize = 200000):
+  trades = tables["trace_enhanced"]
+  chunks = (trades.iloc[start:start + chunksize]
+    for start in range(0, len(trades), chunksize))
+  return build_bond_panel(chunks, min_trades = 5)
+
+# Firm and year fixed effects with two-way clustered errors
+def fe_regression(tables):
+  data = (tables["compustat"].merge(
+    tables["crsp_monthly"].assign(
+      year = lambda x: x["month"].dt.year
+    ).groupby(["gvkey", "year"]).agg(
+      ret = ("ret_excess", "sum"), mktcap = ("mktcap", "last")
+    ).reset_index(),
+    how = "inner", on = ["gvkey", "year"]
+  ).assign(
+    log_mktcap = lambda x: np.log(x["mktcap"]),
+    log_at = lambda x: np.log(x["at"].abs())
+  ))
+  panel = AbsorbedPanel(data, ["gvkey", "year"],
+    ["op", "log_mktcap", "inv", "log_at"])
+  return panel.fit("op", ["log_mktcap", "inv", "log_at"],
+    clusters = ["gvkey", "year"])
+
+# The TRACE append path of chapter 2: batches written to a fresh SQLite
+# file, replacing the table with the first batch and appending the rest
+def trace_writes(tables, bulk, n_batches = 10):
+  trades = tables["trace_enhanced"]
+  batches = np.array_split(np.arange(len(trades)), n_batches)
+  with tempfile.TemporaryDirectory() as directory:
+    con = sqlite3.connect(os.path.join(directory, "trace.sqlite"))
+    if bulk:
+      with BulkWriter(con, "trace_enhanced", if_exists = "replace",
+                      indexes = [["cusip_id", "trd_exctn_dt"]]) as writer:
+        for rows in batches:
+          writer.write(trades.iloc[rows])
+    else:
+      for j, rows in enumerate(batches):
+        trades.iloc[rows].to_sql(name = "trace_enhanced", con = con,
+          if_exists = "replace" if j == 0 else "append", index = False)
+      con.execute("CREATE INDEX trace_enhanced_cusip_id_trd_exctn_dt "
+        "ON trace_enhanced (cusip_id, trd_exctn_dt)")
+      con.commit()
+    con.close()
+  return trades
+
+kernels = {
+  "rolling_beta" : rolling_beta,
+  "daily_rolling_beta" : daily_rolling_beta,
+  "portfolio_sorts" : portfolio_sorts,
+  "p_hacking_grid" : p_hacking_grid,
+  "ff_replication" : ff_replication,
+  "fama_macbeth" : fama_macbeth,
+  "trace_aggregation" : trace_aggregation,
+  "fe_regression" : fe_regression,
+  "trace_to_sql" : lambda tables: trace_writes(tables, bulk = False),
+  "trace_bulk_write" : lambda tables: trace_writes(tables, bulk = True)
+}
+daily_kernels = {"daily_rolling_beta"}
+
+# Best of repeats, as the minimum is the least noisy estimate
+def time_kernel(kernel, tables, repeats = 3):
+  seconds = []
+  rss_before = peak_rss_mb()
+  for _ in range(repeats):
+    tic = time.perf_counter()
+    result = kernel(tables)
+    seconds.append(time.perf_counter() - tic)
+  return {
+    "seconds" : min(seconds),
+    "median_seconds" : float(np.median(seconds)),
+    "rows" : len(result),
+    "rows_per_second" : len(result) / min(seconds),
+    "peak_rss_growth_mb" : peak_rss_mb() - rss_before
+  }
+
+def run_benchmarks(scale_names = ("small", "medium"), names = None,
+                   repeats = 3, seed = 0):
+  names = list(kernels) if names is None else list(names)
+  results = []
+  for scale in scale_names:
+    tables = synthetic_tables(seed = seed, **scales[scale])
+    input_rows = {name : len(table) for name, table in tables.items()}
+    for name in names:
+      if name in daily_kernels and not scales[scale]["daily"]:
+        continue
+      timing = time_kernel(kernels[name], tables, repeats)
+      results.append({"kernel" : name, "scale" : scale, **timing,
+        "crsp_monthly_rows" : input_rows["crsp_monthly"]})
+      print(f"{name} [{scale}]: {timing['seconds']:.3f}s")
+  return pd.DataFrame(results)
+
+def current_commit():
+  try:
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+      capture_output = True, text = True, check = True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return "local"
+
+def save_results(results, label, path = results_path):
+  os.makedirs(path, exist_ok = True)
+  with open(os.path.join(path, f"{label}.json"), "w") as file:
+    json.dump({
+      "label" : label,
+      "timestamp" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "python" : platform.python_version(),
+      "numpy" : np.__version__,
+      "pandas" : pd.__version__,
+      "machine" : platform.machine(),
+      "results" : results.to_dict(orient = "records")
+    }, file, indent = 2)
+
+def load_results(label, path = results_path):
+  with open(os.path.join(path, f"{label}.json")) as file:
+    return pd.DataFrame(json.load(file)["results"])
+
+# Ratio of current to baseline time per kernel and scale, flagged when
+# above the kernel's threshold and slower by more than timer noise
+def compare_results(current, baseline, threshold = default_threshold):
+  comparison = current.merge(
+    baseline.get(["kernel", "scale", "seconds"]),
+    how = "left", on = ["kernel", "scale"], suffixes = ("", "_baseline")
+  ).assign(
+    ratio = lambda x: x["seconds"] / x["seconds_baseline"],
+    threshold = lambda x: x["kernel"].map(thresholds).fillna(threshold)
+  ).assign(
+    regression = lambda x: (x["ratio"] > x["threshold"])
+      & (x["seconds"] - x["seconds_baseline"] > min_seconds)
+  )
+  return comparison
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(
+    description = "Time the core kernels on synthetic data")
+  parser.add_argument("--scales", nargs = "+", default = ["small", "medium"],
+    choices = list(scales))
+  parser.add_argument("--kernels", nargs = "+", choices = list(kernels))
+  parser.add_argument("--repeats", type = int, default = 3)
+  parser.add_argument("--seed", type = int, default = 0)
+  parser.add_argument("--label", default = None)
+  parser.add_argument("--compare", default = None,
+    help = "label of stored results to compare against")
+  parser.add_argument("--threshold", type = float,
+    default = default_threshold)
+  args = parser.parse_args(argv)
+  label = args.label or current_commit()
+  results = run_benchmarks(args.scales, args.kernels, args.repeats,
+    args.seed)
+  save_results(results, label)
+  report = results
+  failed = False
+  if args.compare:
+    report = compare_results(results, load_results(args.compare),
+      args.threshold)
+    failed = bool(report["regression"].any())
+  with open(output_path, "w") as file:
+    file.write(report.to_string(index = False) + "\n")
+  print(report.to_string(index = False))
+  return 1 if failed else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,120 @@
+# bond_panel.py
+import pandas as pd
+import numpy as np
+from calendar_ordinal import month_start
+
+trace_columns = ["cusip_id", "trd_exctn_dt", "rptd_pr",
+  "entrd_vol_qt", "yld_pt"]
+bond_day_keys = ["cusip_id", "trd_exctn_dt"]
+
+# Stream TRACE transactions from the database in chunks, ordered by
+# bond and date along the (cusip_id, trd_exctn_dt) index
+def read_trace_chunks(con, chunksize = 500000,
+                      start_date = None, end_date = None):
+  sql = f"SELECT {', '.join(trace_columns)} FROM trace_enhanced"
+  conditions = []
+  params = []
+  if start_date is not None:
+    conditions.append("trd_exctn_dt >= ?")
+    params.append(str(pd.to_datetime(start_date)))
+  if end_date is not None:
+    conditions.append("trd_exctn_dt <= ?")
+    params.append(str(pd.to_datetime(end_date)))
+  if conditions:
+    sql += " WHERE " + " AND ".join(conditions)
+  sql += " ORDER BY cusip_id, trd_exctn_dt"
+  yield from pd.read_sql_query(
+    sql = sql,
+    con = con,
+    params = params,
+    parse_dates = {"trd_exctn_dt"},
+    chunksize = chunksize
+  )
+
+# Volume-weighted yield sums per bond-day for one chunk of trades
+def aggregate_bond_days(trades):
+  trades = trades.get(trace_columns).dropna()
+  weight = (trades["entrd_vol_qt"].to_numpy(dtype = np.float64)
+    * trades["rptd_pr"].to_numpy(dtype = np.float64) / 100)
+  bond_days = (pd.DataFrame({
+    "cusip_id" : trades["cusip_id"].to_numpy(),
+    "trd_exctn_dt" : trades["trd_exctn_dt"].to_numpy(),
+    "weighted_yield_sum" : (
+      weight * trades["yld_pt"].to_numpy(dtype = np.float64)
+    ),
+    "weight_sum" : weight,
+    "trades" : np.ones(len(trades), dtype = np.int64)
+  }).groupby(
+    bond_day_keys, sort = False
+  ).sum())
+  return bond_days
+
+# Bond-day sums of a chunk that continue in the next chunk: the last
+# bond-month of an ordered stream may not be complete yet
+def split_open_month(bond_days):
+  keys = bond_days.index
+  cusip = keys.get_level_values("cusip_id")
+  month = month_start(keys.get_level_values("trd_exctn_dt"))
+  is_open = (cusip == cusip[-1]) & (month == month[-1])
+  return bond_days.loc[~is_open], bond_days.loc[is_open]
+
+# Month-end panels per filter, flushing every bond-month as soon as the
+# stream has moved past it. Chunks must be ordered by cusip_id and
+# trd_exctn_dt as read_trace_chunks returns them, so only the last
+# bond-month of a chunk is carried into the next one.
+def stream_bond_panels(chunks, filters):
+  panels = {name : [] for name in filters}
+  carry = None
+  def flush(bond_days):
+    bond_days = bond_days.groupby(level = bond_day_keys).sum().reset_index()
+    for name, kwargs in filters.items():
+      panels[name].append(month_end_panel(bond_days, **kwargs))
+  for chunk in chunks:
+    bond_days = aggregate_bond_days(chunk)
+    if carry is not None:
+      bond_days = pd.concat([carry, bond_days])
+    if bond_days.empty:
+      carry = None
+      continue
+    done, carry = split_open_month(bond_days)
+    if not done.empty:
+      flush(done)
+  if carry is not None and not carry.empty:
+    flush(carry)
+  return {
+    name : pd.concat(parts, ignore_index = True) if parts else
+      pd.DataFrame(columns = ["cusip_id", "month", "avg_yield"])
+    for name, parts in panels.items()
+  }
+
+# Keep the last trading day per bond and month after filtering
+def month_end_panel(bond_days, min_trades = 5, min_volume = 0):
+  keep = ((bond_days["trades"].to_numpy() >= min_trades)
+    & (bond_days["weight_sum"].to_numpy() >= min_volume)
+    & (bond_days["weight_sum"].to_numpy() != 0))
+  panel = (bond_days.loc[keep].assign(
+    avg_yield = lambda x: x["weighted_yield_sum"] / x["weight_sum"],
+    month = lambda x: month_start(x["trd_exctn_dt"])
+  ).dropna(
+    subset = ["avg_yield"]
+  ).sort_values(
+    ["cusip_id", "month", "trd_exctn_dt"]
+  ))
+  cusip = panel["cusip_id"].to_numpy()
+  month = panel["month"].to_numpy()
+  is_last = np.ones(len(panel), dtype = bool)
+  is_last[:-1] = (cusip[1:] != cusip[:-1]) | (month[1:] != month[:-1])
+  panel = (panel.loc[is_last].get(
+    ["cusip_id", "month", "avg_yield"]
+  ).reset_index(drop = True))
+  return panel
+
+# Build the bond-month panel in a single pass over TRACE
+def build_bond_panel(chunks, min_trades = 5, min_volume = 0):
+  return stream_bond_panels(chunks, {"panel" : {
+    "min_trades" : min_trades, "min_volume" : min_volume}})["panel"]
+
+# Build several robustness panels from the same pass over TRACE,
+# filters maps a name to keyword arguments for month_end_panel
+def build_bond_panels(chunks, filters):
+  return stream_bond_panels(chunks, filters)
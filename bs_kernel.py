@@ -0,0 +1,127 @@
+# bs_kernel.py
+import numpy as np
+from scipy.special import ndtr
+from scipy.optimize import brentq
+
+greek_names = ["call", "put", "delta_call", "delta_put", "gamma", "vega",
+  "theta_call", "theta_put", "rho_call", "rho_put"]
+inv_sqrt_2pi = 1 / np.sqrt(2 * np.pi)
+
+# Fused pass over one chunk, d1/d2 and the normal terms are computed
+# once and only the outputs present in out are written. Put-side terms
+# use N(-d) directly rather than 1 - N(d), which cancels in the tails.
+def black_scholes_kernel(S, K, r, T, sigma, out):
+  sqrt_t = np.sqrt(T)
+  vol_t = sigma * sqrt_t
+  d1 = np.log(S / K)
+  d1 += (r + 0.5 * sigma ** 2) * T
+  d1 /= vol_t
+  d2 = d1 - vol_t
+  nd1 = ndtr(d1)
+  nd2 = ndtr(d2)
+  discount = K * np.exp(-r * T)
+  put_side = ["put", "delta_put", "theta_put", "rho_put"]
+  if any(name in out for name in put_side):
+    n_minus_d1 = ndtr(-d1)
+    n_minus_d2 = ndtr(-d2)
+  if "call" in out:
+    out["call"][...] = S * nd1 - discount * nd2
+  if "put" in out:
+    out["put"][...] = discount * n_minus_d2 - S * n_minus_d1
+  if "delta_call" in out:
+    out["delta_call"][...] = nd1
+  if "delta_put" in out:
+    out["delta_put"][...] = -n_minus_d1
+  if any(name in out for name in ["gamma", "vega", "theta_call",
+                                  "theta_put"]):
+    pdf = np.exp(-0.5 * d1 ** 2) * inv_sqrt_2pi
+    if "gamma" in out:
+      out["gamma"][...] = pdf / (S * vol_t)
+    if "vega" in out:
+      out["vega"][...] = S * pdf * sqrt_t
+    decay = -S * pdf * sigma / (2 * sqrt_t)
+    if "theta_call" in out:
+      out["theta_call"][...] = decay - r * discount * nd2
+    if "theta_put" in out:
+      out["theta_put"][...] = decay + r * discount * n_minus_d2
+  if "rho_call" in out:
+    out["rho_call"][...] = T * discount * nd2
+  if "rho_put" in out:
+    out["rho_put"][...] = -T * discount * n_minus_d2
+  return out
+
+# Broadcast inputs and price them chunk by chunk into preallocated arrays;
+# without dtype the result type of the inputs is kept (float32 stays
+# float32, integers and Python scalars give float64)
+def black_scholes_greeks(S, K, r, T, sigma, names = None,
+                         dtype = None, chunk_size = 1000000,
+                         out = None):
+  inputs = [np.ravel(a) for a in np.broadcast_arrays(S, K, r, T, sigma)]
+  if dtype is None:
+    dtype = np.result_type(*[a.dtype for a in inputs], np.float32)
+  n = inputs[0].size
+  names = greek_names if names is None else list(names)
+  if out is None:
+    out = {name : np.empty(n, dtype = dtype) for name in names}
+  for start in range(0, n, chunk_size):
+    chunk = slice(start, min(start + chunk_size, n))
+    black_scholes_kernel(
+      *[a[chunk].astype(dtype, copy = False) for a in inputs],
+      {name : out[name][chunk] for name in names}
+    )
+  return out
+
+# Call prices only, drop-in for the chapter's black_scholes_price
+def black_scholes_price(S, K, r, T, sigma, dtype = None,
+                        chunk_size = 1000000):
+  return black_scholes_greeks(
+    S, K, r, T, sigma, names = ["call"], dtype = dtype,
+    chunk_size = chunk_size
+  )["call"]
+
+# Implied volatility over arrays, vectorized Newton steps on vega with
+# a Brent fallback for points where Newton leaves the bracket; always
+# solved in float64, as the tolerance is below float32 resolution
+def implied_volatility(price, S, K, r, T, option = "call", tol = 1e-8,
+                       max_iter = 50, lower = 1e-6, upper = 5.0):
+  price, S, K, r, T = [
+    np.ravel(a).astype(np.float64)
+    for a in np.broadcast_arrays(price, S, K, r, T)
+  ]
+  discount = K * np.exp(-r * T)
+  if option == "call":
+    valid = (price > np.maximum(S - discount, 0)) & (price < S)
+  elif option == "put":
+    valid = (price > np.maximum(discount - S, 0)) & (price < discount)
+  else:
+    raise ValueError(f"Unknown option type: {option}")
+  sigma = np.sqrt(2 * np.abs(np.log(S / K) + r * T) / T)
+  sigma = np.clip(np.where(np.isfinite(sigma), sigma, 0.2), 0.05, 1.0)
+  converged = np.zeros(price.size, dtype = bool)
+  active = valid.copy()
+  for iteration in range(max_iter):
+    idx = np.flatnonzero(active)
+    if idx.size == 0:
+      break
+    values = black_scholes_kernel(
+      S[idx], K[idx], r[idx], T[idx], sigma[idx],
+      {option : np.empty(idx.size), "vega" : np.empty(idx.size)}
+    )
+    diff = values[option] - price[idx]
+    done = np.abs(diff) < tol
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+      step = sigma[idx] - diff / values["vega"]
+    bad = ~done & (~np.isfinite(step) | (step <= lower) | (step >= upper))
+    sigma[idx] = np.where(done | bad, sigma[idx], step)
+    converged[idx[done]] = True
+    active[idx[done | bad]] = False
+  for i in np.flatnonzero(valid & ~converged):
+    objective = lambda s: float(black_scholes_kernel(
+      S[i], K[i], r[i], T[i], s, {option : np.empty(())}
+    )[option]) - price[i]
+    try:
+      sigma[i] = brentq(objective, lower, upper, xtol = tol)
+    except ValueError:
+      sigma[i] = np.nan
+  sigma[~valid] = np.nan
+  return sigma
@@ -0,0 +1,112 @@
+# calendar_ordinal.py
+import pandas as pd
+import numpy as np
+
+# Month ordinal year * 12 + month; datetime64[M] counts months from 1970-01.
+# Dates are truncated to their month, so 2020-03-17 and 2020-03-01 give
+# the same ordinal. Missing dates (NaT) give a missing ordinal: the result
+# is then a nullable Int64 array, otherwise a plain int64 array.
+ordinal_epoch = 1970 * 12 + 1
+
+# Plain int64 values and the missing mask of ordinals given as int64,
+# float with NaN or nullable integer arrays
+def ordinal_values(ordinal):
+  if isinstance(ordinal, (pd.Series, pd.Index)):
+    ordinal = ordinal.array
+  if isinstance(ordinal, pd.api.extensions.ExtensionArray):
+    missing = np.asarray(ordinal.isna(), dtype = bool)
+    return ordinal.to_numpy(dtype = np.int64, na_value = 0), missing
+  values = np.asarray(ordinal)
+  if np.issubdtype(values.dtype, np.floating):
+    missing = np.isnan(values)
+    return np.where(missing, 0, values).astype(np.int64), missing
+  return values.astype(np.int64), np.zeros(values.shape, dtype = bool)
+
+def masked_ordinal(values, missing):
+  if missing.any():
+    return pd.arrays.IntegerArray(np.where(missing, 0, values), missing)
+  return values
+
+def month_ordinal(month):
+  months = pd.to_datetime(month).to_numpy().astype("datetime64[M]")
+  missing = np.isnat(months)
+  return masked_ordinal(months.astype(np.int64) + ordinal_epoch, missing)
+
+def ordinal_month(ordinal):
+  values, missing = ordinal_values(ordinal)
+  months = (values - ordinal_epoch).astype("datetime64[M]").astype(
+    "datetime64[ns]")
+  months[missing] = np.datetime64("NaT")
+  return months
+
+def ordinal_year(ordinal):
+  values, missing = ordinal_values(ordinal)
+  return masked_ordinal((values - 1) // 12, missing)
+
+def ordinal_calendar_month(ordinal):
+  values, missing = ordinal_values(ordinal)
+  return masked_ordinal((values - 1) % 12 + 1, missing)
+
+# Vectorized replacement for month + pd.DateOffset(months = k) on month
+# starts, returned as timestamps for merges with the chapter frames.
+# Dates within a month come back as the shifted month's first day.
+def shift_month(month, k):
+  values, missing = ordinal_values(month_ordinal(month))
+  return ordinal_month(masked_ordinal(values + k, missing))
+
+# First day of the month of any date, e.g. Compustat datadate
+def month_start(date):
+  return ordinal_month(month_ordinal(date))
+
+# Fama-French formation date: July of the year for July to December,
+# July of the previous year for January to June
+def july_formation_ordinal(ordinal):
+  values, missing = ordinal_values(ordinal)
+  year = (values - 1) // 12
+  month = (values - 1) % 12 + 1
+  return masked_ordinal((year - (month <= 6)) * 12 + 7, missing)
+
+def july_formation_month(month):
+  return ordinal_month(july_formation_ordinal(month_ordinal(month)))
+
+# Accounting data of fiscal year t is used from July of t + 1, missing
+# datadates give NaT
+def fiscal_formation_month(datadate):
+  year = pd.to_datetime(datadate).dt.year.to_numpy(dtype = np.float64)
+  return ordinal_month((year + 1) * 12 + 7)
+
+# Trading days as positions in the exchange calendar, e.g. the dates of
+# factors_ff3_daily, so lags count trading days rather than calendar days
+class TradingCalendar:
+  def __init__(self, dates):
+    dates = pd.to_datetime(dates).to_numpy()
+    self.dates = np.unique(dates[~np.isnat(dates)])
+    self.months = month_ordinal(self.dates)
+
+  # Position of each date, -1 for dates that are not trading days
+  def ordinal(self, dates):
+    dates = pd.to_datetime(dates).to_numpy()
+    position = np.searchsorted(self.dates, dates)
+    inside = position < self.dates.size
+    found = np.zeros(dates.size, dtype = bool)
+    found[inside] = self.dates[position[inside]] == dates[inside]
+    return np.where(found, position, -1)
+
+  def date(self, ordinal):
+    ordinal = np.asarray(ordinal)
+    valid = (ordinal >= 0) & (ordinal < self.dates.size)
+    dates = np.full(ordinal.size, np.datetime64("NaT"), dtype =
+      "datetime64[ns]")
+    dates[valid] = self.dates[ordinal[valid]]
+    return dates
+
+  def shift(self, dates, k):
+    ordinal = self.ordinal(dates)
+    shifted = np.where(ordinal >= 0, ordinal + k, -1)
+    return self.date(shifted)
+
+  # Ordinal of the last trading day of every month ordinal
+  def month_end_ordinals(self):
+    last = np.flatnonzero(np.diff(self.months, append = np.iinfo(
+      np.int64).max) != 0)
+    return pd.Series(last, index = self.months[last])
@@ -0,0 +1,86 @@
+# capm_beta.py
+import pandas as pd
+import numpy as np
+from calendar_ordinal import month_start
+
+# Returns of one batch of stocks from crsp_daily, as chapter 3 reads them
+def read_daily_returns(con, permnos):
+  permnos = [int(p) for p in permnos]
+  return pd.read_sql_query(
+    sql = ("SELECT permno, date, ret_excess FROM crsp_daily "
+    f"WHERE permno IN ({', '.join('?' for _ in permnos)})"),
+    con = con,
+    params = permnos,
+    parse_dates = {"date"}
+  )
+
+# Chapter 3 sample: stocks with more than window_size + 1 returns, each
+# expanded to every date of the factor calendar between its first and
+# last return so that implicit gaps become explicit missing rows, with
+# the market excess return of every date
+def padded_returns(returns, factors, time = "month", window_size = 60):
+  returns = returns.dropna(subset = ["ret_excess"])
+  counts = returns.groupby("permno")["ret_excess"].count()
+  returns = returns[returns["permno"].isin(
+    counts.index[counts > window_size + 1])]
+  calendar = np.sort(factors[time].unique())
+  span = returns.groupby("permno")[time].agg(["min", "max"])
+  first = np.searchsorted(calendar, span["min"].to_numpy())
+  last = np.searchsorted(calendar, span["max"].to_numpy())
+  lengths = last - first + 1
+  offsets = np.arange(lengths.sum()) - np.repeat(
+    np.cumsum(lengths) - lengths, lengths)
+  grid = pd.DataFrame({
+    "permno" : np.repeat(span.index.to_numpy(), lengths),
+    time : calendar[np.repeat(first, lengths) + offsets]
+  })
+  return (grid.merge(
+    returns.get(["permno", time, "ret_excess"]),
+    how = "left", on = ["permno", time]
+  ).merge(
+    factors.get([time, "mkt_excess"]), how = "left", on = time
+  ))
+
+# Rolling CAPM beta on the padded panel from moving sums over the last
+# window_size dates, the equivalent of RollingOLS(window = window_size,
+# min_nobs = min_obs, missing = "drop") per stock: missing returns
+# inside a window are left out, not replaced by older ones
+def rolling_capm_beta(data, time = "month", window_size = 60,
+                      min_obs = 48):
+  data = data.sort_values(["permno", time])
+  valid = (data["ret_excess"].notna() & data["mkt_excess"].notna()
+    ).to_numpy()
+  y = np.where(valid, data["ret_excess"].to_numpy(dtype = np.float64), 0.0)
+  x = np.where(valid, data["mkt_excess"].to_numpy(dtype = np.float64), 0.0)
+  sums = (pd.DataFrame(
+    {"y" : y, "x" : x, "xy" : x * y, "xx" : x * x,
+    "n" : valid.astype(np.float64)}
+  ).groupby(
+    data["permno"].to_numpy(), sort = False
+  ).rolling(
+    window_size, min_periods = window_size
+  ).sum())
+  n = sums["n"].to_numpy()
+  beta = ((sums["xy"].to_numpy() - sums["x"].to_numpy()
+    * sums["y"].to_numpy() / n)
+    / (sums["xx"].to_numpy() - sums["x"].to_numpy() ** 2 / n))
+  return data.get(["permno", time]).assign(
+    beta = np.where(n >= min_obs, beta, np.nan)
+  ).reset_index(drop = True)
+
+# Monthly betas from monthly returns, or from daily returns with the
+# estimate of the last trading day of each month
+def capm_beta(returns, factors, time = "month", window_size = 60,
+              min_obs = 48):
+  beta = rolling_capm_beta(
+    padded_returns(returns, factors, time, window_size),
+    time, window_size, min_obs
+  )
+  if time != "month":
+    beta = (beta.assign(
+      month = lambda x: month_start(x[time])
+    ).drop_duplicates(
+      ["permno", "month"], keep = "last"
+    ).drop(columns = time))
+  return beta.dropna().get(["permno", "month", "beta"]).reset_index(
+    drop = True)
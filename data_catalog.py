@@ -0,0 +1,264 @@
+# data_catalog.py
+import os
+import glob
+import hashlib
+import json
+import sqlite3
+import threading
+import pandas as pd
+from typed_panel import compact_panel
+
+database_path = "data/tidy_finance_python.sqlite"
+cache_path = "data/cache"
+date_columns = ["month", "date", "datadate", "trd_exctn_dt", "maturity",
+  "offering_date", "dated_date", "last_interest_date"]
+
+def quote(name):
+  return f'"{name}"'
+
+# Every writer records its writes here: a table dropped and rewritten
+# with the same number of rows keeps its root page and row ids, so the
+# version is the only part of the fingerprint that is sure to move.
+# BulkWriter, the incremental refresh and write_database call it.
+def bump_version(con, name):
+  con.execute(
+    "CREATE TABLE IF NOT EXISTS catalog_versions "
+    "(name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+  )
+  con.execute(
+    "INSERT INTO catalog_versions (name, version) VALUES (?, 1) "
+    "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+    (name,)
+  )
+  con.commit()
+
+# Named source table, nothing is read until get() is called
+class LazyTable:
+  def __init__(self, catalog, name):
+    self.catalog = catalog
+    self.name = name
+
+  def get(self, columns = None):
+    return self.catalog.load(self.name, columns)
+
+  def columns(self):
+    return self.catalog.columns(self.name)
+
+  def fingerprint(self):
+    return self.catalog.fingerprint(self.name)
+
+# Hash of the values, index and column names of a frame
+def content_hash(data):
+  digest = hashlib.sha1(json.dumps([str(c) for c in data.columns]).encode())
+  digest.update(pd.util.hash_pandas_object(data, index = True).to_numpy(
+    ).tobytes())
+  return digest.hexdigest()
+
+# Shared connection, projected reads memoized per session and derived
+# datasets cached on disk under a key built from their source fingerprints
+# and parameters. The connection and the in-memory cache may be used from
+# pipeline threads: reads hold the catalog lock, each derived dataset is
+# built under its own lock so a node is never built twice at once.
+class DataCatalog:
+  def __init__(self, database = database_path, cache_dir = cache_path):
+    self.connection = sqlite3.connect(database = database,
+      check_same_thread = False)
+    self.lock = threading.RLock()
+    self.cache_dir = cache_dir
+    self.memory = {}
+    self.derived = {}
+    self.fingerprints = {}
+    self.write_state = None
+    self.node_locks = {}
+
+  def __getitem__(self, name):
+    return LazyTable(self, name)
+
+  def columns(self, name):
+    with self.lock:
+      info = self.connection.execute(
+        f"PRAGMA table_info({quote(name)})"
+      ).fetchall()
+    return [row[1] for row in info]
+
+  # Schema, row count, last rowid and the version recorded by writers.
+  # Source fingerprints are memoized until the database changes: PRAGMA
+  # data_version moves on commits from other connections, total_changes
+  # on writes through this one. Derived datasets are identified by the
+  # hash of their content, so a rebuild that gives the same result leaves
+  # dependents cached.
+  def fingerprint(self, name):
+    if name in self.derived:
+      return self.derived_content(name)
+    with self.lock:
+      data_version = self.connection.execute(
+        "PRAGMA data_version").fetchone()[0]
+      state = (data_version, self.connection.total_changes)
+      if state != self.write_state:
+        self.fingerprints = {}
+        self.write_state = state
+      if name not in self.fingerprints:
+        self.fingerprints[name] = self.table_fingerprint(name)
+      return self.fingerprints[name]
+
+  def table_fingerprint(self, name):
+    schema = self.connection.execute(
+      "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+      (name,)
+    ).fetchone()
+    if schema is None:
+      raise KeyError(f"No table named {name}")
+    rows, last_rowid = self.connection.execute(
+      f"SELECT count(*), max(rowid) FROM {quote(name)}"
+    ).fetchone()
+    version = None
+    has_versions = self.connection.execute(
+      "SELECT 1 FROM sqlite_master WHERE name = 'catalog_versions'"
+    ).fetchone()
+    if has_versions:
+      row = self.connection.execute(
+        "SELECT version FROM catalog_versions WHERE name = ?", (name,)
+      ).fetchone()
+      version = row[0] if row else None
+    return hashlib.sha1(json.dumps(
+      [schema[0], rows, last_rowid, version]
+    ).encode()).hexdigest()
+
+  # Source table with column projection, memoized for this fingerprint;
+  # a cached full read also serves later projections. compact is None or
+  # keyword arguments for compact_panel: the frame is compacted as it is
+  # read and only the compact version is kept in memory.
+  def read(self, name, columns = None, compact = None):
+    form = None if compact is None else json.dumps(compact,
+      sort_keys = True)
+    with self.lock:
+      fingerprint = self.fingerprint(name)
+      key = (name, tuple(columns) if columns else None, fingerprint, form)
+      if key in self.memory:
+        return self.memory[key]
+      full_key = (name, None, fingerprint, form)
+      if columns and full_key in self.memory:
+        return self.memory[full_key].get(list(columns))
+      selected = list(columns) if columns else self.columns(name)
+      data = pd.read_sql_query(
+        sql = (f"SELECT {', '.join(quote(c) for c in selected)} "
+        f"FROM {quote(name)}"),
+        con = self.connection,
+        parse_dates = {c for c in selected if c in date_columns}
+      )
+      if compact is not None:
+        data = compact_panel(data, copy = False, **compact)
+      self.memory[key] = data
+    return data
+
+  # Derived dataset: build(catalog, **params) -> DataFrame from the
+  # listed inputs, version is bumped by hand when the build logic changes
+  def register(self, name, inputs, build, version = "1", params = None):
+    self.derived[name] = {
+      "inputs" : list(inputs),
+      "build" : build,
+      "version" : str(version),
+      "params" : dict(params or {})
+    }
+
+  def set_params(self, name, **params):
+    self.derived[name]["params"].update(params)
+
+  def derived_key(self, name):
+    spec = self.derived[name]
+    fingerprints = [self.fingerprint(i) for i in spec["inputs"]]
+    return hashlib.sha1(json.dumps(
+      [name, spec["version"], spec["inputs"], fingerprints,
+      spec["params"]], sort_keys = True, default = str
+    ).encode()).hexdigest()
+
+  # Cache files are named after the parameters and the key, so a rebuild
+  # replaces only the files of the same parameterization
+  def params_tag(self, name):
+    return hashlib.sha1(json.dumps(self.derived[name]["params"],
+      sort_keys = True, default = str).encode()).hexdigest()[:8]
+
+  def cache_file(self, name, key, suffix):
+    return os.path.join(self.cache_dir,
+      f"{name}-{self.params_tag(name)}-{key[:16]}.{suffix}")
+
+  def is_cached(self, name):
+    key = self.derived_key(name)
+    with self.lock:
+      if (name, key) in self.memory:
+        return True
+    return os.path.exists(self.cache_file(name, key, "json"))
+
+  # Content hash of the current build, read from the cache metadata.
+  # A dataset that has not been built yet is not built here: its key,
+  # which covers its own inputs, stands in until the build has run.
+  def derived_content(self, name):
+    key = self.derived_key(name)
+    meta_path = self.cache_file(name, key, "json")
+    if not os.path.exists(meta_path):
+      return f"key-{key}"
+    with open(meta_path) as file:
+      return json.load(file)["content"]
+
+  def node_lock(self, name):
+    with self.lock:
+      return self.node_locks.setdefault(name, threading.Lock())
+
+  def load(self, name, columns = None, compact = None):
+    if name not in self.derived:
+      return self.read(name, columns, compact)
+    with self.node_lock(name):
+      key = self.derived_key(name)
+      with self.lock:
+        data = self.memory.get((name, key))
+      if data is None:
+        data = self.load_derived(name, key)
+    return data.get(list(columns)) if columns else data
+
+  # Cached file of the derived dataset, or a fresh build. The key is taken
+  # again after the build, when the inputs it loaded have been built and
+  # have content hashes.
+  def load_derived(self, name, key):
+    path = self.cache_file(name, key, "pkl")
+    meta_path = self.cache_file(name, key, "json")
+    if os.path.exists(path) and os.path.exists(meta_path):
+      data = pd.read_pickle(path)
+    else:
+      spec = self.derived[name]
+      data = spec["build"](self, **spec["params"])
+      key = self.derived_key(name)
+      path = self.cache_file(name, key, "pkl")
+      meta_path = self.cache_file(name, key, "json")
+      os.makedirs(self.cache_dir, exist_ok = True)
+      stale = glob.glob(os.path.join(self.cache_dir,
+        f"{name}-{self.params_tag(name)}-*.*"))
+      for stale_path in stale:
+        os.remove(stale_path)
+      data.to_pickle(path)
+      with open(meta_path, "w") as file:
+        json.dump({"key" : key, "params" : spec["params"],
+          "content" : content_hash(data)}, file, default = str)
+    with self.lock:
+      self.memory[(name, key)] = data
+    return data
+
+# Monthly returns with the market factor, only the columns the beta
+# estimation reads are loaded and cached
+def build_crsp_monthly_ff3(catalog):
+  return catalog.load(
+    "crsp_monthly", ["permno", "month", "industry", "ret_excess"]
+  ).merge(
+    catalog.load("factors_ff3_monthly", ["month", "mkt_excess"]),
+    how = "left", on = "month"
+  )
+
+# Datasets several chapters rebuild by hand
+def default_catalog(database = database_path, cache_dir = cache_path):
+  catalog = DataCatalog(database, cache_dir)
+  catalog.register(
+    "crsp_monthly_ff3",
+    inputs = ["crsp_monthly", "factors_ff3_monthly"],
+    build = build_crsp_monthly_ff3,
+    version = "2"
+  )
+  return catalog
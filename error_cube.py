@@ -0,0 +1,66 @@
+# error_cube.py
+import pandas as pd
+import numpy as np
+from winsorize import grouped_quantiles
+
+default_bins = {
+  "moneyness" : np.arange(-50, 45, 5),
+  "T" : np.array([0, 0.5, 1, 1.5, 2.01]),
+  "sigma" : np.array([0, 0.25, 0.5, 0.85])
+}
+
+# Bin codes per dimension, out-of-range values go to the edge bins
+def bin_codes(values, edges):
+  codes = np.searchsorted(edges, values, side = "right") - 1
+  return np.clip(codes, 0, len(edges) - 2)
+
+# Per-model pricing error statistics for every bin in one grouped pass
+# over the wide prediction matrix, no long-format copy is built
+def error_cube(test_data, predictions, reference = "black_scholes",
+               bins = None, quantiles = (0.5, 0.9, 0.99)):
+  bins = default_bins if bins is None else bins
+  if "moneyness" in bins and "moneyness" not in test_data:
+    test_data = test_data.assign(
+      moneyness = lambda x: x["S"] - x["K"]
+    )
+  dims = list(bins)
+  sizes = [len(bins[d]) - 1 for d in dims]
+  codes = [bin_codes(test_data[d].to_numpy(), bins[d]) for d in dims]
+  cell = np.ravel_multi_index(codes, sizes)
+  n_cells = int(np.prod(sizes))
+  models = list(predictions)
+  predicted = np.column_stack([
+    np.asarray(predictions[m], dtype = np.float64) for m in models
+  ])
+  errors = predicted - test_data[reference].to_numpy(
+    dtype = np.float64)[:, None]
+  count = np.bincount(cell, minlength = n_cells)
+  occupied = count > 0
+  stats = []
+  for j, model in enumerate(models):
+    error = errors[:, j]
+    abs_error = np.abs(error)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+      model_stats = {
+        "model" : model,
+        "n" : count,
+        "mean_error" : np.bincount(
+          cell, weights = error, minlength = n_cells) / count,
+        "mean_abs_error" : np.bincount(
+          cell, weights = abs_error, minlength = n_cells) / count,
+        "rmse" : np.sqrt(np.bincount(
+          cell, weights = error ** 2, minlength = n_cells) / count)
+      }
+    abs_quantiles = grouped_quantiles(abs_error, cell, n_cells,
+      list(quantiles))
+    for i, q in enumerate(quantiles):
+      model_stats[f"abs_error_q{int(round(q * 100))}"] = (
+        abs_quantiles[:, i])
+    cell_index = np.unravel_index(np.arange(n_cells), sizes)
+    for d, digits, edges in zip(dims, cell_index,
+                                [bins[d] for d in dims]):
+      edges = np.asarray(edges, dtype = np.float64)
+      model_stats[f"{d}_bin"] = (edges[digits] + edges[digits + 1]) / 2
+    stats.append(pd.DataFrame(model_stats).loc[occupied])
+  cube = pd.concat(stats, ignore_index = True)
+  return cube
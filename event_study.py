@@ -0,0 +1,106 @@
+# event_study.py
+import pandas as pd
+import numpy as np
+import linearmodels as lm
+from scipy import sparse
+
+# Months relative to treatment, same rounding as the chapter
+def relative_months(month, treatment_date):
+  days = (pd.to_datetime(month) - pd.to_datetime(treatment_date)).dt.days
+  return np.round(days.to_numpy() / 365 * 12).astype(int)
+
+# Term names for relative periods, lags before and leads after
+def event_study_terms(periods):
+  return [
+    f"lag{abs(p)}" if p <= 0 else f"lead{p}" for p in periods
+  ]
+
+# Bin relative months beyond the endpoints into the endpoint periods
+def bin_relative_months(relative_month, min_period = None,
+                        max_period = None):
+  relative_month = np.asarray(relative_month, dtype = np.int64)
+  if min_period is None and max_period is None:
+    return relative_month
+  return np.clip(relative_month, min_period, max_period)
+
+# Sparse lead/lag indicators in one step, endpoints optionally binned
+def event_study_matrix(relative_month, treated, reference = 0,
+                       min_period = None, max_period = None):
+  relative_month = bin_relative_months(
+    relative_month, min_period, max_period
+  )
+  treated = np.asarray(treated, dtype = bool)
+  periods = np.unique(relative_month)
+  periods = periods[periods != reference]
+  active = treated & (relative_month != reference)
+  rows = np.flatnonzero(active)
+  columns = np.searchsorted(periods, relative_month[rows])
+  design = sparse.csr_matrix(
+    (np.ones(rows.size), (rows, columns)),
+    shape = (relative_month.size, periods.size)
+  )
+  return design, periods
+
+# Two-way FE event study passed to PanelOLS as arrays, no formula
+def fit_event_study(data, treatment_date, outcome = "avg_yield",
+                    treated = "polluter", entity = "cusip_id",
+                    time = "month", reference = 0, min_period = None,
+                    max_period = None, level = 0.95, **fit_kwargs):
+  relative_month = relative_months(data[time], treatment_date)
+  design, periods = event_study_matrix(
+    relative_month, data[treated], reference, min_period, max_period
+  )
+  terms = event_study_terms(periods)
+  index = pd.MultiIndex.from_arrays(
+    [data[entity].to_numpy(), pd.to_datetime(data[time]).to_numpy()],
+    names = [entity, time]
+  )
+  exog = pd.DataFrame(design.toarray(), index = index, columns = terms)
+  exog.insert(0, "Intercept", 1.0)
+  dependent = pd.Series(
+    data[outcome].to_numpy(dtype = np.float64),
+    index = index, name = outcome
+  )
+  fit = lm.PanelOLS(
+    dependent, exog,
+    entity_effects = True,
+    time_effects = True,
+    drop_absorbed = True
+  ).fit(**fit_kwargs)
+  period_months = (pd.DataFrame({
+    "diff_to_treatment" : bin_relative_months(
+      relative_month, min_period, max_period
+    ),
+    "month" : pd.to_datetime(data[time]).to_numpy()
+  }).groupby("diff_to_treatment")["month"].min())
+  coefficients = event_study_coefficients(
+    fit, periods, period_months, treatment_date, reference, level
+  )
+  return fit, coefficients
+
+# Coefficient and CI table for the polluter plot, reference row at zero
+def event_study_coefficients(fit, periods, period_months,
+                             treatment_date, reference = 0,
+                             level = 0.95):
+  terms = event_study_terms(periods)
+  confidence = fit.conf_int(level = level)
+  coefficients = pd.DataFrame({
+    "term" : terms,
+    "diff_to_treatment" : periods,
+    "estimate" : fit.params.reindex(terms).to_numpy(),
+    "conf.low" : confidence["lower"].reindex(terms).to_numpy(),
+    "conf.high" : confidence["upper"].reindex(terms).to_numpy(),
+    "month" : period_months.reindex(periods).to_numpy()
+  })
+  reference_row = pd.DataFrame({
+    "term" : event_study_terms([reference]),
+    "diff_to_treatment" : [reference],
+    "estimate" : [0.0],
+    "conf.low" : [0.0],
+    "conf.high" : [0.0],
+    "month" : [pd.to_datetime(treatment_date)]
+  })
+  coefficients = (pd.concat(
+    [coefficients, reference_row], ignore_index = True
+  ).sort_values("diff_to_treatment").reset_index(drop = True))
+  return coefficients
@@ -0,0 +1,168 @@
+# fe_absorb.py
+import pandas as pd
+import numpy as np
+from scipy.stats import norm
+
+# Sums of every column of values within groups of integer codes
+def group_sums(codes, values, n_groups):
+  return np.column_stack([
+    np.bincount(codes, weights = values[:, j], minlength = n_groups)
+    for j in range(values.shape[1])
+  ])
+
+# Group means of every column of values for one set of integer codes
+def group_means(codes, counts, values):
+  return group_sums(codes, values, counts.size) / counts[:, None]
+
+# Demean a matrix on several fixed effects by alternating projections
+def alternating_projections(values, codes, tol = 1e-10, max_iter = 1000):
+  values = np.array(values, dtype = np.float64)
+  counts = [np.bincount(c).astype(np.float64) for c in codes]
+  if len(codes) == 1:
+    values -= group_means(codes[0], counts[0], values)[codes[0]]
+    return values, 1
+  scale = np.maximum(np.abs(values).max(axis = 0), 1.0)
+  for iteration in range(1, max_iter + 1):
+    change = np.zeros(values.shape[1])
+    for c, n in zip(codes, counts):
+      means = group_means(c, n, values)
+      values -= means[c]
+      change = np.maximum(change, np.abs(means).max(axis = 0))
+    if np.all(change / scale < tol):
+      return values, iteration
+  raise RuntimeError(
+    f"Fixed effects did not converge in {max_iter} iterations"
+  )
+
+# Cluster-robust meat matrix from scores summed within groups
+def cluster_meat(scores, groups):
+  codes, uniques = pd.factorize(groups)
+  score_sums = group_sums(codes, scores, uniques.size)
+  return score_sums.T @ score_sums, uniques.size
+
+# Absorbs a fixed-effect structure once and fits many models on it;
+# variables not named at construction are demeaned on first use, taken
+# from the source frame on the rows of the absorbed sample
+class AbsorbedPanel:
+  def __init__(self, data, effects, variables, keep = None,
+               tol = 1e-10, max_iter = 1000):
+    self.effects = list(effects)
+    keep = [c for c in (keep or []) if c not in self.effects]
+    sample = data.get(self.effects + keep + list(variables))
+    self.source = data
+    self.rows = np.flatnonzero(sample.notna().all(axis = 1).to_numpy())
+    self.data = sample.iloc[self.rows].reset_index(drop = True)
+    self.codes = [
+      pd.factorize(self.data[effect])[0] for effect in self.effects
+    ]
+    self.tol = tol
+    self.max_iter = max_iter
+    self.iterations = 0
+    self.cache = {}
+    self.absorb(variables)
+
+  # Demean the variables not cached yet in one batch
+  def absorb(self, variables):
+    missing = [v for v in variables if v not in self.cache]
+    if not missing:
+      return
+    values = np.column_stack([
+      self.data[v].to_numpy(dtype = np.float64) if v in self.data
+      else self.source[v].to_numpy(dtype = np.float64)[self.rows]
+      for v in missing
+    ])
+    incomplete = [v for v, n in zip(missing, np.isnan(values).any(axis = 0))
+      if n]
+    if incomplete:
+      raise ValueError(
+        f"Missing values on the absorbed sample in {incomplete}"
+      )
+    if self.codes:
+      values, self.iterations = alternating_projections(
+        values, self.codes, self.tol, self.max_iter
+      )
+    for j, variable in enumerate(missing):
+      self.cache[variable] = values[:, j]
+
+  def demeaned(self, variables):
+    self.absorb(variables)
+    return np.column_stack([self.cache[v] for v in variables])
+
+  # Degrees of freedom absorbed by the fixed effects
+  def absorbed_dof(self):
+    if not self.codes:
+      return 0
+    return sum(c.max() + 1 for c in self.codes) - (len(self.codes) - 1)
+
+  # OLS on the cached transform, clusters are column names of data
+  def fit(self, outcome, regressors, clusters = None,
+          small_sample = True):
+    y = self.demeaned([outcome])[:, 0]
+    x = self.demeaned(list(regressors))
+    nobs, k = x.shape
+    xx_inv = np.linalg.inv(x.T @ x)
+    params = xx_inv @ (x.T @ y)
+    residuals = y - x @ params
+    if not clusters:
+      df_resid = nobs - k - self.absorbed_dof()
+      cov = xx_inv * (residuals @ residuals / df_resid)
+    else:
+      scores = x * residuals[:, None]
+      cov = self.cluster_cov(scores, xx_inv, clusters, small_sample)
+    std_error = np.sqrt(np.diag(cov))
+    t_statistic = params / std_error
+    result = pd.DataFrame({
+      "estimate" : params,
+      "std_error" : std_error,
+      "t_statistic" : t_statistic,
+      "p_value" : 2 * norm.sf(np.abs(t_statistic))
+    }, index = pd.Index(list(regressors), name = "term"))
+    total = y - y.mean() if not self.codes else y
+    result.attrs["nobs"] = nobs
+    result.attrs["r2_within"] = 1 - (
+      residuals @ residuals) / (total @ total)
+    result.attrs["cov"] = cov
+    return result
+
+  # One- and two-way clustered covariance, V1 + V2 - V12
+  def cluster_cov(self, scores, xx_inv, clusters, small_sample = True):
+    nobs, k = scores.shape
+    clusters = [clusters] if isinstance(clusters, str) else list(clusters)
+    groupings = [self.data[c].to_numpy() for c in clusters]
+    signs = [1.0] * len(groupings)
+    if len(groupings) == 2:
+      groupings.append(
+        pd.MultiIndex.from_arrays(groupings).to_numpy()
+      )
+      signs.append(-1.0)
+    elif len(groupings) > 2:
+      raise ValueError("Only one- and two-way clustering is supported")
+    meat = np.zeros((k, k))
+    for grouping, sign in zip(groupings, signs):
+      group_meat, n_groups = cluster_meat(scores, grouping)
+      if small_sample:
+        group_meat *= (n_groups / (n_groups - 1)
+          * (nobs - 1) / (nobs - k))
+      meat += sign * group_meat
+    return xx_inv @ meat @ xx_inv
+
+# Fit several specifications against the same absorbed panel
+def fit_specifications(panel, specifications, clusters = None):
+  results = {
+    name : panel.fit(outcome, regressors, clusters)
+    for name, (outcome, regressors) in specifications.items()
+  }
+  return results
+
+# Side-by-side estimates and standard errors of several fits, with the
+# number of observations and the within R-squared below the terms
+def comparison_table(results):
+  table = pd.concat({
+    name : result[["estimate", "std_error"]]
+    for name, result in results.items()
+  }, axis = 1)
+  for statistic in ["nobs", "r2_within"]:
+    table.loc[statistic, :] = [
+      results[name].attrs[statistic] for name, _ in table.columns
+    ]
+  return table
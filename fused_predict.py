@@ -0,0 +1,227 @@
+# fused_predict.py
+import time
+import pandas as pd
+import numpy as np
+from scipy.special import expit
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import StandardScaler, PolynomialFeatures
+from sklearn.neural_network import MLPRegressor
+from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+# Shift and scale of a fitted StandardScaler as plain arrays
+def scaler_affine(scaler):
+  n = scaler.n_features_in_
+  shift = scaler.mean_ if scaler.with_mean else np.zeros(n)
+  scale = scaler.scale_ if scaler.with_std else np.ones(n)
+  return np.asarray(shift, dtype = np.float64), np.asarray(
+    scale, dtype = np.float64)
+
+# Selected columns and scaling of a single-scaler ColumnTransformer
+def column_scaler(transformer):
+  fitted = [t for t in transformer.transformers_ if t[0] != "remainder"]
+  if len(fitted) != 1 or not isinstance(fitted[0][1], StandardScaler):
+    raise ValueError("Only a single StandardScaler can be fused")
+  if transformer.remainder != "drop":
+    raise ValueError("Only remainder = 'drop' can be fused")
+  shift, scale = scaler_affine(fitted[0][1])
+  return list(fitted[0][2]), shift, scale
+
+# Network with the input scaling folded into the first-layer weights
+class FusedMLP:
+  def __init__(self, model, shift, scale):
+    weights = [np.array(w, dtype = np.float64) for w in model.coefs_]
+    biases = [np.array(b, dtype = np.float64) for b in model.intercepts_]
+    if shift is not None:
+      biases[0] = biases[0] - (shift / scale) @ weights[0]
+      weights[0] = weights[0] / scale[:, None]
+    self.weights = weights
+    self.biases = biases
+    self.activation = model.activation
+
+  def activate(self, h):
+    if self.activation == "relu":
+      np.maximum(h, 0, out = h)
+    elif self.activation == "logistic":
+      expit(h, out = h)
+    elif self.activation == "tanh":
+      np.tanh(h, out = h)
+    return h
+
+  def predict(self, x):
+    h = x @ self.weights[0] + self.biases[0]
+    for w, b in zip(self.weights[1:], self.biases[1:]):
+      h = self.activate(h) @ w + b
+    return h[:, 0] if h.shape[1] == 1 else h
+
+# All trees packed into flat node arrays, traversed for every sample and
+# tree at once, one level per step
+class FusedForest:
+  def __init__(self, model, shift, scale):
+    estimators = getattr(model, "estimators_", [model])
+    trees = [e.tree_ for e in estimators]
+    counts = np.array([t.node_count for t in trees])
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    self.feature = np.concatenate([t.feature for t in trees])
+    self.threshold = np.concatenate([t.threshold for t in trees])
+    self.left = np.concatenate([
+      np.where(t.children_left >= 0, t.children_left + o, -1)
+      for t, o in zip(trees, offsets)
+    ])
+    self.right = np.concatenate([
+      np.where(t.children_right >= 0, t.children_right + o, -1)
+      for t, o in zip(trees, offsets)
+    ])
+    self.value = np.concatenate([t.value[:, 0, 0] for t in trees])
+    self.roots = offsets
+    self.depth = max(t.max_depth for t in trees)
+    self.shift = shift
+    self.scale = scale
+
+  # Level-wise descent of all (row, tree) pairs at once; pairs that
+  # reached a leaf drop out, so deep trees with early leaves cost only
+  # the nodes actually visited
+  def predict(self, x):
+    if self.shift is not None:
+      x = (x - self.shift) / self.scale
+    x = np.asarray(x, dtype = np.float32)
+    n_trees = self.roots.size
+    node = np.tile(self.roots, x.shape[0])
+    active = np.arange(node.size)
+    while active.size:
+      current = node[active]
+      left = self.left[current]
+      inner = left >= 0
+      active, current, left = active[inner], current[inner], left[inner]
+      go_left = (x[active // n_trees, self.feature[current]]
+        <= self.threshold[current])
+      node[active] = np.where(go_left, left, self.right[current])
+    return self.value[node].reshape(x.shape[0], n_trees).mean(axis = 1)
+
+# Tree ensembles left to sklearn's compiled traversal, which the NumPy
+# descent does not beat: only the column selection and scaling of the
+# pipeline are replaced
+class ScaledEstimator:
+  def __init__(self, model, shift, scale):
+    self.model = model
+    self.shift = shift
+    self.scale = scale
+    self.names = getattr(model, "feature_names_in_", None)
+
+  def predict(self, x):
+    if self.shift is not None:
+      x = (x - self.shift) / self.scale
+    if self.names is not None:
+      x = pd.DataFrame(x, columns = self.names, copy = False)
+    return self.model.predict(x)
+
+# Polynomial expansion from an exponent table with only the terms the
+# linear model keeps, output scaling folded into the coefficients. Terms
+# are accumulated term_block at a time, so a chunk never holds more than
+# rows x term_block products instead of the whole expanded design.
+class FusedPolynomial:
+  def __init__(self, polynomial, scaler, linear, shift, scale,
+               term_block = 32):
+    coef = np.ravel(linear.coef_).astype(np.float64)
+    intercept = float(np.ravel(linear.intercept_)[0])
+    if scaler is not None:
+      term_shift, term_scale = scaler_affine(scaler)
+      coef = coef / term_scale
+      intercept -= coef @ term_shift
+    keep = coef != 0
+    self.powers = polynomial.powers_[keep]
+    self.coef = coef[keep]
+    self.intercept = intercept
+    self.degree = int(polynomial.powers_.max())
+    self.shift = shift
+    self.scale = scale
+    self.term_block = term_block
+
+  def predict(self, x):
+    if self.shift is not None:
+      x = (x - self.shift) / self.scale
+    x = np.asarray(x, dtype = np.float64)
+    power_table = np.ones((x.shape[0], x.shape[1], self.degree + 1))
+    for d in range(1, self.degree + 1):
+      power_table[:, :, d] = power_table[:, :, d - 1] * x
+    prediction = np.full(x.shape[0], self.intercept)
+    for start in range(0, self.coef.size, self.term_block):
+      block = slice(start, start + self.term_block)
+      powers = self.powers[block]
+      terms = power_table[:, 0, powers[:, 0]]
+      for j in range(1, x.shape[1]):
+        terms *= power_table[:, j, powers[:, j]]
+      prediction += terms @ self.coef[block]
+    return prediction
+
+# Column selection plus one fused evaluator, predicting in row chunks
+class FusedPipeline:
+  def __init__(self, columns, model, chunk_size = 100000):
+    self.columns = columns
+    self.model = model
+    self.chunk_size = chunk_size
+
+  def predict(self, X):
+    if isinstance(X, pd.DataFrame):
+      X = X[self.columns].to_numpy(dtype = np.float64)
+    x = np.asarray(X, dtype = np.float64)
+    return np.concatenate([
+      self.model.predict(x[start:start + self.chunk_size])
+      for start in range(0, x.shape[0], self.chunk_size)
+    ])
+
+# Flatten a fitted pricing pipeline into a single NumPy evaluator. Tree
+# ensembles are only fused with fuse_forests = True; benchmark_export
+# measured the NumPy descent at well below sklearn's speed on the
+# chapter's forests, so by default they keep their own predict.
+def export_pipeline(pipeline, columns = None, fuse_forests = False):
+  steps = [step for _, step in pipeline.steps]
+  shift = scale = None
+  if isinstance(steps[0], ColumnTransformer):
+    columns, shift, scale = column_scaler(steps[0])
+    steps = steps[1:]
+  elif isinstance(steps[0], StandardScaler):
+    shift, scale = scaler_affine(steps[0])
+    steps = steps[1:]
+  if columns is None:
+    columns = list(getattr(pipeline, "feature_names_in_", []))
+  if len(steps) == 1 and isinstance(steps[0], MLPRegressor):
+    model = FusedMLP(steps[0], shift, scale)
+  elif len(steps) == 1 and isinstance(steps[0], (RandomForestRegressor,
+      ExtraTreesRegressor, DecisionTreeRegressor)):
+    if fuse_forests:
+      model = FusedForest(steps[0], shift, scale)
+    else:
+      model = ScaledEstimator(steps[0], shift, scale)
+  elif isinstance(steps[0], PolynomialFeatures):
+    scaler = steps[1] if isinstance(steps[1], StandardScaler) else None
+    model = FusedPolynomial(steps[0], scaler, steps[-1], shift, scale)
+  else:
+    raise ValueError(
+      f"Cannot fuse pipeline steps: {[type(s).__name__ for s in steps]}"
+    )
+  return FusedPipeline(columns, model)
+
+# Time pipeline.predict against the fused evaluator on the same data
+def benchmark_export(pipelines, X, repeats = 5, fuse_forests = False):
+  results = []
+  for name, pipeline in pipelines.items():
+    fused = export_pipeline(pipeline, fuse_forests = fuse_forests)
+    timings = {}
+    for label, predict in [("pipeline", pipeline.predict),
+                           ("fused", fused.predict)]:
+      seconds = []
+      for _ in range(repeats):
+        tic = time.perf_counter()
+        prediction = predict(X)
+        seconds.append(time.perf_counter() - tic)
+      timings[label] = (min(seconds), prediction)
+    results.append({
+      "model" : name,
+      "pipeline_seconds" : timings["pipeline"][0],
+      "fused_seconds" : timings["fused"][0],
+      "speedup" : timings["pipeline"][0] / timings["fused"][0],
+      "max_abs_diff" : np.max(np.abs(
+        timings["pipeline"][1] - timings["fused"][1]))
+    })
+  return pd.DataFrame(results)
@@ -0,0 +1,184 @@
+# incremental_refresh.py
+import os
+import time
+import pandas as pd
+import pyarrow.parquet as pq
+from data_catalog import quote, bump_version
+from sqlite_writer import sql_rows, BulkWriter
+from wrds_extract import stream_query, extract_path, default_chunk_size
+from instrument import stage
+
+# Bookkeeping tables kept next to the data in the SQLite store
+def ensure_refresh_tables(con):
+  con.execute(
+    "CREATE TABLE IF NOT EXISTS refresh_watermarks "
+    "(name TEXT PRIMARY KEY, watermark TEXT, updated TEXT, "
+    "refreshed_at TEXT)"
+  )
+  con.execute(
+    "CREATE TABLE IF NOT EXISTS stale_tables "
+    "(name TEXT PRIMARY KEY, source TEXT, since TEXT)"
+  )
+  con.commit()
+
+def get_watermark(con, name):
+  ensure_refresh_tables(con)
+  row = con.execute(
+    "SELECT watermark, updated FROM refresh_watermarks WHERE name = ?",
+    (name,)
+  ).fetchone()
+  if row is None:
+    return None
+  return {"watermark" : row[0], "updated" : row[1]}
+
+def set_watermark(con, name, watermark, updated = None):
+  ensure_refresh_tables(con)
+  con.execute(
+    "INSERT INTO refresh_watermarks VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(name) DO UPDATE SET watermark = excluded.watermark, "
+    "updated = excluded.updated, refreshed_at = excluded.refreshed_at",
+    (name, watermark, updated, time.strftime("%Y-%m-%dT%H:%M:%S"))
+  )
+  con.commit()
+
+# Derived tables built from a refreshed source stay flagged until their
+# builder calls clear_stale
+def mark_stale(con, names, source):
+  ensure_refresh_tables(con)
+  con.executemany(
+    "INSERT INTO stale_tables VALUES (?, ?, ?) "
+    "ON CONFLICT(name) DO UPDATE SET source = excluded.source, "
+    "since = excluded.since",
+    [(n, source, time.strftime("%Y-%m-%dT%H:%M:%S")) for n in names]
+  )
+  con.commit()
+
+def stale_tables(con):
+  ensure_refresh_tables(con)
+  return pd.read_sql_query(sql = "SELECT * FROM stale_tables", con = con)
+
+def clear_stale(con, name):
+  ensure_refresh_tables(con)
+  con.execute("DELETE FROM stale_tables WHERE name = ?", (name,))
+  con.commit()
+
+# The unique index on the keys is what ON CONFLICT matches against
+def key_index(con, name, keys):
+  con.execute(
+    f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(name + '_keys')} "
+    f"ON {quote(name)} ({', '.join(quote(k) for k in keys)})"
+  )
+
+# Insert new keys and overwrite revised ones
+def upsert(con, name, data, keys):
+  if data.empty:
+    return 0
+  exists = con.execute(
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+    (name,)
+  ).fetchone()
+  if not exists:
+    data.head(0).to_sql(name = name, con = con, index = False)
+  key_index(con, name, keys)
+  columns = list(data.columns)
+  updates = [c for c in columns if c not in keys]
+  sql = (f"INSERT INTO {quote(name)} "
+    f"({', '.join(quote(c) for c in columns)}) "
+    f"VALUES ({', '.join('?' for _ in columns)}) "
+    f"ON CONFLICT({', '.join(quote(k) for k in keys)}) ")
+  if updates:
+    sql += "DO UPDATE SET " + ", ".join(
+      f"{quote(c)} = excluded.{quote(c)}" for c in updates)
+  else:
+    sql += "DO NOTHING"
+  with con:
+    con.executemany(sql, sql_rows(data))
+  return len(data)
+
+# Start of the incremental window: the watermark minus the revision
+# lookback, or the full start date on the first run
+def refresh_start(watermark, spec, start_date):
+  if watermark is None:
+    return start_date
+  since = (pd.Timestamp(watermark["watermark"])
+    - pd.Timedelta(days = spec.get("lookback_days", 0)))
+  return max(since, pd.Timestamp(start_date)).strftime("%Y-%m-%d")
+
+# Watermark and last update after a chunk has been written
+def advance_watermark(chunk, spec, watermark, updated):
+  if not chunk.empty:
+    latest = str(pd.Timestamp(chunk[spec["watermark"]].max()))
+    watermark = latest if watermark is None else max(watermark, latest)
+    if spec.get("updated"):
+      latest = str(pd.Timestamp(chunk[spec["updated"]].max()))
+      updated = latest if updated is None else max(updated, latest)
+  return watermark, updated
+
+# Upsert streamed chunks and advance the watermark, then flag dependents
+def apply_chunks(con, name, spec, chunks, previous = None):
+  rows = 0
+  watermark = previous["watermark"] if previous else None
+  updated = previous["updated"] if previous else None
+  for chunk in chunks:
+    rows += upsert(con, name, chunk, spec["keys"])
+    watermark, updated = advance_watermark(chunk, spec, watermark, updated)
+  if watermark is not None:
+    set_watermark(con, name, watermark, updated)
+  if rows:
+    bump_version(con, name)
+    mark_stale(con, spec.get("dependents", []), name)
+  return rows
+
+# Pull only rows at or after the lookback window (and, with an update
+# column, rows revised since the last refresh) and merge them by key.
+# spec: query with :start_date/:end_date (and :updated_since), keys,
+# watermark column, optional updated column, lookback_days, dependents.
+def refresh_table(engine, con, name, spec, start_date, end_date,
+                  chunk_size = default_chunk_size):
+  watermark = get_watermark(con, name)
+  params = {
+    "start_date" : refresh_start(watermark, spec, start_date),
+    "end_date" : end_date
+  }
+  if spec.get("updated"):
+    params["updated_since"] = (watermark or {}).get("updated") or (
+      "1900-01-01")
+  with stage(f"refresh {name}", since = params["start_date"]) as refresh:
+    chunks = (batch.to_pandas(date_as_object = False)
+      for batch in stream_query(engine, spec["query"], params, chunk_size))
+    rows = apply_chunks(con, name, spec, chunks, watermark)
+    refresh.rows(rows)
+  return {"table" : name, "since" : params["start_date"], "rows" : rows}
+
+def refresh_tables(engine, con, specs, start_date, end_date,
+                   chunk_size = default_chunk_size):
+  return pd.DataFrame([
+    refresh_table(engine, con, name, spec, start_date, end_date,
+      chunk_size)
+    for name, spec in specs.items()
+  ])
+
+# Replace the table and its watermark with a full extract in data/wrds.
+# The history is bulk inserted in one transaction and the unique key
+# index built afterwards; later refreshes upsert only their window.
+def load_extract(con, name, spec, store_dir = extract_path,
+                 chunk_size = default_chunk_size):
+  parquet = pq.ParquetFile(os.path.join(store_dir, f"{name}.parquet"))
+  watermark, updated = None, None
+  with BulkWriter(con, name, if_exists = "replace") as writer:
+    writer.write(parquet.schema_arrow.empty_table().to_pandas(
+      date_as_object = False))
+    for batch in parquet.iter_batches(chunk_size):
+      chunk = batch.to_pandas(date_as_object = False)
+      writer.write(chunk)
+      watermark, updated = advance_watermark(chunk, spec, watermark,
+        updated)
+    key_index(con, name, spec["keys"])
+  ensure_refresh_tables(con)
+  con.execute("DELETE FROM refresh_watermarks WHERE name = ?", (name,))
+  if watermark is not None:
+    set_watermark(con, name, watermark, updated)
+  else:
+    con.commit()
+  mark_stale(con, spec.get("dependents", []), name)
+  return writer.rows
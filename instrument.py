@@ -0,0 +1,141 @@
+# instrument.py
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import functools
+
+# Tracing is off unless TIDY_FINANCE_TRACE names the JSON trace file; the
+# flame-graph input goes next to it with a .folded suffix
+trace_path = os.getenv("TIDY_FINANCE_TRACE")
+
+# Peak resident set size of this process in MB (ru_maxrss is KB on Linux,
+# bytes on macOS)
+def peak_rss_mb():
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+# Handle yielded by a disabled tracer, every call is a no-op
+class NullStage:
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    return False
+
+  def rows(self, n):
+    pass
+
+  def note(self, **fields):
+    pass
+
+null_stage = NullStage()
+
+# One timed stage, nested stages are recorded with their full path.
+# Memory is the process-wide ru_maxrss high-water mark: peak_rss_mb is
+# the peak so far and peak_rss_growth_mb how far this stage raised it,
+# which is not the memory the stage itself used.
+class Stage:
+  def __init__(self, tracer, name, fields):
+    self.tracer = tracer
+    self.name = name
+    self.record = {"name" : name, **fields}
+
+  def __enter__(self):
+    self.tracer.stack.append(self.name)
+    self.record["path"] = ";".join(self.tracer.stack)
+    self.record["depth"] = len(self.tracer.stack) - 1
+    self.start_rss = peak_rss_mb()
+    self.start_cpu = time.process_time()
+    self.start_wall = time.perf_counter()
+    self.record["start"] = self.start_wall - self.tracer.origin
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.record["wall_seconds"] = time.perf_counter() - self.start_wall
+    self.record["cpu_seconds"] = time.process_time() - self.start_cpu
+    self.record["peak_rss_growth_mb"] = peak_rss_mb() - self.start_rss
+    self.record["peak_rss_mb"] = peak_rss_mb()
+    if exc_type is not None:
+      self.record["error"] = exc_type.__name__
+    self.tracer.stack.pop()
+    self.tracer.records.append(self.record)
+    if self.tracer.verbose:
+      print(self.tracer.format(self.record))
+    return False
+
+  def rows(self, n):
+    self.record["rows"] = int(n)
+
+  def note(self, **fields):
+    self.record.update(fields)
+
+class Tracer:
+  def __init__(self, enabled = False, verbose = True):
+    self.enabled = enabled
+    self.verbose = verbose
+    self.records = []
+    self.stack = []
+    self.origin = time.perf_counter()
+
+  def stage(self, name, **fields):
+    if not self.enabled:
+      return null_stage
+    return Stage(self, name, fields)
+
+  # Decorator; the row count is taken from the result when it has a length
+  def traced(self, name = None):
+    def decorator(function):
+      label = name or function.__name__
+      @functools.wraps(function)
+      def wrapper(*args, **kwargs):
+        if not self.enabled:
+          return function(*args, **kwargs)
+        with self.stage(label) as stage:
+          result = function(*args, **kwargs)
+          if hasattr(result, "__len__"):
+            stage.rows(len(result))
+        return result
+      return wrapper
+    return decorator
+
+  def format(self, record):
+    rows = f", {record['rows']:,} rows" if "rows" in record else ""
+    progress = (f" {record['batch']} of {record['batches']}"
+      if "batch" in record else "")
+    return (f"{'  ' * record['depth']}{record['name']}{progress}: "
+      f"{record['wall_seconds']:.2f}s wall, "
+      f"{record['cpu_seconds']:.2f}s cpu, "
+      f"process peak RSS +{record['peak_rss_growth_mb']:.0f} MB{rows}")
+
+  def write_trace(self, path):
+    with open(path, "w") as file:
+      json.dump({"argv" : sys.argv, "stages" : self.records}, file,
+        indent = 2)
+
+  # Folded stacks ("a;b;c value") with self time in microseconds, the
+  # input format of flamegraph.pl, inferno and speedscope
+  def write_folded(self, path):
+    self_time = {}
+    for record in self.records:
+      wall = int(record["wall_seconds"] * 1e6)
+      self_time[record["path"]] = self_time.get(record["path"], 0) + wall
+      parent = record["path"].rpartition(";")[0]
+      if parent:
+        self_time[parent] = self_time.get(parent, 0) - wall
+    with open(path, "w") as file:
+      for path_name, value in self_time.items():
+        file.write(f"{path_name} {max(value, 0)}\n")
+
+  def save(self, path):
+    self.write_trace(path)
+    self.write_folded(os.path.splitext(path)[0] + ".folded")
+
+tracer = Tracer(enabled = bool(trace_path))
+stage = tracer.stage
+traced = tracer.traced
+
+if trace_path:
+  atexit.register(tracer.save, trace_path)
@@ -0,0 +1,70 @@
+# interactions.py
+import pandas as pd
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+
+# Macro x factor products with scaling fitted from the base moments.
+# Placed in a pipeline, the wide interaction block is only materialized
+# for the rows being fitted or predicted, e.g. one CV fold at a time.
+class InteractionFeatures(BaseEstimator, TransformerMixin):
+  def __init__(self, macro_columns, factor_columns, include_base = True,
+               standardize = True, dtype = "float64"):
+    self.macro_columns = macro_columns
+    self.factor_columns = factor_columns
+    self.include_base = include_base
+    self.standardize = standardize
+    self.dtype = dtype
+
+  def base_columns(self):
+    return list(self.macro_columns) + list(self.factor_columns)
+
+  def get_feature_names_out(self, input_features = None):
+    names = [
+      f"{m} x {f}" for m in self.macro_columns
+      for f in self.factor_columns
+    ]
+    if self.include_base:
+      names = self.base_columns() + names
+    return np.asarray(names, dtype = object)
+
+  # E[mf] and E[m^2 f^2] from two cross-moment products, no n x (m * f)
+  # matrix is needed to get the StandardScaler statistics
+  def fit(self, X, y = None):
+    macro = X[list(self.macro_columns)].to_numpy(dtype = np.float64)
+    factor = X[list(self.factor_columns)].to_numpy(dtype = np.float64)
+    n = macro.shape[0]
+    interaction_mean = (macro.T @ factor / n).ravel()
+    interaction_square = ((macro ** 2).T @ (factor ** 2) / n).ravel()
+    interaction_var = np.maximum(
+      interaction_square - interaction_mean ** 2, 0.0
+    )
+    mean = interaction_mean
+    var = interaction_var
+    if self.include_base:
+      base = np.hstack([macro, factor])
+      mean = np.concatenate([base.mean(axis = 0), mean])
+      var = np.concatenate([base.var(axis = 0), var])
+    scale = np.sqrt(var)
+    scale[scale == 0] = 1.0
+    self.mean_ = mean
+    self.scale_ = scale
+    self.n_features_out_ = mean.size
+    return self
+
+  # One broadcast product into a preallocated array, scaled in place
+  def transform(self, X):
+    macro = X[list(self.macro_columns)].to_numpy(dtype = self.dtype)
+    factor = X[list(self.factor_columns)].to_numpy(dtype = self.dtype)
+    n, n_macro = macro.shape
+    n_factor = factor.shape[1]
+    n_base = n_macro + n_factor if self.include_base else 0
+    out = np.empty((n, n_base + n_macro * n_factor), dtype = self.dtype)
+    if self.include_base:
+      out[:, :n_macro] = macro
+      out[:, n_macro:n_base] = factor
+    block = out[:, n_base:].reshape(n, n_macro, n_factor)
+    np.multiply(macro[:, :, None], factor[:, None, :], out = block)
+    if self.standardize:
+      out -= self.mean_.astype(self.dtype)
+      out /= self.scale_.astype(self.dtype)
+    return out
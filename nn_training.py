@@ -0,0 +1,93 @@
+# nn_training.py
+import os
+import copy
+import time
+import pandas as pd
+import numpy as np
+import joblib
+from sklearn.base import clone
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from instrument import peak_rss_mb
+
+# Split streamed chunks into mini-batches of at most batch_size rows
+def iter_batches(chunks, batch_size):
+  for x, y in chunks:
+    for start in range(0, len(y), batch_size):
+      yield x[start:start + batch_size], y[start:start + batch_size]
+
+# Write to a temporary file first so a crash never leaves half a checkpoint
+def save_checkpoint(state, path):
+  tmp_path = f"{path}.tmp"
+  joblib.dump(state, tmp_path)
+  os.replace(tmp_path, path)
+
+def stream_mse(model, scaler, stream, batch_size):
+  squared_error = 0.0
+  n = 0
+  for x, y in iter_batches(stream(), batch_size):
+    squared_error += np.sum((model.predict(scaler.transform(x)) - y) ** 2)
+    n += len(y)
+  if n == 0:
+    raise ValueError("Validation stream yielded no rows")
+  return squared_error / n
+
+# Out-of-core training through partial_fit. train_stream is called with
+# the epoch number and returns a fresh iterator of (x, y) chunks, so the
+# shuffle can differ per epoch, e.g. lambda epoch:
+# option_grid.iter_train_chunks(..., seed = seed + epoch);
+# validation_stream is called without arguments.
+# The regressor must support partial_fit (MLPRegressor with adam/sgd).
+def train_out_of_core(regressor, train_stream, validation_stream,
+                      batch_size = 1000, max_epochs = 50, patience = 5,
+                      tol = 1e-6, checkpoint_path = None, resume = False):
+  if resume and checkpoint_path and os.path.exists(checkpoint_path):
+    state = joblib.load(checkpoint_path)
+  else:
+    scaler = StandardScaler()
+    for x, y in train_stream(0):
+      scaler.partial_fit(x)
+    state = {
+      "scaler" : scaler,
+      "model" : clone(regressor),
+      "best_model" : None,
+      "best_mse" : np.inf,
+      "epoch" : 0,
+      "stale_epochs" : 0,
+      "history" : []
+    }
+  scaler = state["scaler"]
+  model = state["model"]
+  while state["epoch"] < max_epochs and state["stale_epochs"] < patience:
+    tic = time.perf_counter()
+    n_samples = 0
+    for x, y in iter_batches(train_stream(state["epoch"]), batch_size):
+      model.partial_fit(scaler.transform(x), y)
+      n_samples += len(y)
+    train_seconds = time.perf_counter() - tic
+    validation_mse = stream_mse(model, scaler, validation_stream,
+      batch_size)
+    state["epoch"] += 1
+    if validation_mse < state["best_mse"] - tol:
+      state["best_mse"] = validation_mse
+      state["best_model"] = copy.deepcopy(model)
+      state["stale_epochs"] = 0
+    else:
+      state["stale_epochs"] += 1
+    state["history"].append({
+      "epoch" : state["epoch"],
+      "samples" : n_samples,
+      "train_seconds" : train_seconds,
+      "samples_per_sec" : n_samples / train_seconds,
+      "validation_mse" : validation_mse,
+      "peak_rss_mb" : peak_rss_mb()
+    })
+    print(
+      f"Epoch {state['epoch']}: {n_samples / train_seconds:,.0f} "
+      f"samples/sec, validation MSE {validation_mse:.5f}"
+    )
+    if checkpoint_path:
+      save_checkpoint(state, checkpoint_path)
+  best_model = state["best_model"] or model
+  fitted = Pipeline([("scaler", scaler), ("regressor", best_model)])
+  return fitted, pd.DataFrame(state["history"])
@@ -0,0 +1,126 @@
+# option_grid.py
+import os
+import pandas as pd
+import numpy as np
+from scipy.special import ndtri
+from bs_kernel import black_scholes_price
+
+# splitmix64 finalizer, wrapping uint64 arithmetic
+def mix64(z):
+  z = np.asarray(z, dtype = np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+  z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+  z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+  return z ^ (z >> np.uint64(31))
+
+# Lazy product(S, K, r, T, sigma) grid addressed by flat index, the last
+# axis varies fastest exactly as in itertools.product
+class OptionGrid:
+  names = ["S", "K", "r", "T", "sigma"]
+
+  def __init__(self, S, K, r, T, sigma, noise_scale = 0.15,
+               seed = 42):
+    self.axes = [np.asarray(a, dtype = np.float64)
+      for a in (S, K, r, T, sigma)]
+    self.shape = tuple(a.size for a in self.axes)
+    self.size = int(np.prod(self.shape, dtype = np.int64))
+    self.noise_scale = noise_scale
+    self.seed = seed
+
+  # Mixed-radix decoding of flat indices into grid coordinates
+  def decode(self, index):
+    digits = np.unravel_index(np.asarray(index, dtype = np.int64),
+      self.shape)
+    return np.column_stack([
+      axis[digit] for axis, digit in zip(self.axes, digits)
+    ])
+
+  # Pricing noise as a function of (seed, flat index) alone, so a point
+  # gets the same draw whatever chunking or sample it is requested in and
+  # only the requested points are drawn: a hashed uniform per index
+  # mapped through the normal quantile function
+  def noise(self, index):
+    index = np.asarray(index, dtype = np.int64).astype(np.uint64)
+    key = mix64(np.array([self.seed], dtype = np.uint64))
+    bits = mix64(index ^ key) >> np.uint64(11)
+    uniform = (bits.astype(np.float64) + 0.5) / 2.0 ** 53
+    return self.noise_scale * ndtri(uniform)
+
+  # Coordinates, model price and observed price for some flat indices
+  def evaluate(self, index, dtype = np.float64):
+    x = self.decode(index)
+    black_scholes = black_scholes_price(*x.T, dtype = dtype)
+    observed_price = black_scholes + self.noise(index)
+    return x.astype(dtype, copy = False), black_scholes, observed_price
+
+  def frame(self, index):
+    x, black_scholes, observed_price = self.evaluate(index)
+    option_prices = pd.DataFrame(x, columns = self.names).assign(
+      black_scholes = black_scholes,
+      observed_price = observed_price
+    )
+    return option_prices
+
+  # Reproducible test sample, the training set is its complement
+  def test_index(self, test_size = 0.01, seed = 42):
+    n_test = int(np.ceil(test_size * self.size))
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(self.size, size = n_test, replace = False))
+
+  def train_index(self, test_index):
+    return np.setdiff1d(
+      np.arange(self.size, dtype = np.int64), test_index,
+      assume_unique = True
+    )
+
+  # Training chunks in shuffled order for partial_fit, never holding more
+  # than one chunk of the grid in memory
+  def iter_train_chunks(self, test_index, chunk_size = 100000,
+                        shuffle = True, seed = 42, dtype = np.float64):
+    rng = np.random.default_rng(seed)
+    starts = np.arange(0, self.size, chunk_size, dtype = np.int64)
+    if shuffle:
+      starts = rng.permutation(starts)
+    for start in starts:
+      stop = min(start + chunk_size, self.size)
+      lo, hi = np.searchsorted(test_index, [start, stop])
+      keep = np.ones(stop - start, dtype = bool)
+      keep[test_index[lo:hi] - start] = False
+      index = np.arange(start, stop, dtype = np.int64)[keep]
+      if shuffle:
+        index = rng.permutation(index)
+      if index.size:
+        x, black_scholes, observed_price = self.evaluate(index, dtype)
+        yield x, observed_price
+
+  # Given flat indices in chunks, e.g. a held-out validation stream
+  def iter_index_chunks(self, index, chunk_size = 100000,
+                        dtype = np.float64):
+    for start in range(0, len(index), chunk_size):
+      x, black_scholes, observed_price = self.evaluate(
+        index[start:start + chunk_size], dtype
+      )
+      yield x, observed_price
+
+  # Training set written to .npy memory maps for estimators that need
+  # arrays but should not hold them in RAM
+  def write_memmap(self, directory, test_index, chunk_size = 100000,
+                   dtype = np.float32):
+    os.makedirs(directory, exist_ok = True)
+    n_train = self.size - test_index.size
+    x_map = np.lib.format.open_memmap(
+      os.path.join(directory, "x.npy"), mode = "w+", dtype = dtype,
+      shape = (n_train, len(self.names))
+    )
+    y_map = np.lib.format.open_memmap(
+      os.path.join(directory, "y.npy"), mode = "w+", dtype = dtype,
+      shape = (n_train,)
+    )
+    row = 0
+    for x, y in self.iter_train_chunks(test_index, chunk_size,
+                                       shuffle = False):
+      x_map[row:row + y.size] = x
+      y_map[row:row + y.size] = y
+      row += y.size
+    x_map.flush()
+    y_map.flush()
+    return x_map, y_map
@@ -0,0 +1,82 @@
+# panel_shift.py
+import pandas as pd
+import numpy as np
+from calendar_ordinal import month_ordinal
+
+# Chapter naming: k = 1 gives beta_lag, k = -1 gives ret_excess_lead
+def shift_name(column, k):
+  label = "lag" if k > 0 else "lead"
+  return f"{column}_{label}" if abs(k) == 1 else f"{column}_{label}{abs(k)}"
+
+# Month ordinals for datetime months, integer ordinals pass through
+def time_ordinal(values):
+  if values.isna().any():
+    raise ValueError("Missing time values in panel")
+  if pd.api.types.is_datetime64_any_dtype(values):
+    return month_ordinal(values)
+  return np.asarray(values, dtype = np.int64)
+
+# Sorted (entity, time) key with room for the largest horizon, so that
+# key - k never runs into the neighbouring entity
+def panel_key(data, entity, time, max_period):
+  codes = pd.factorize(data[entity])[0].astype(np.int64)
+  ordinal = time_ordinal(data[time])
+  ordinal = ordinal - ordinal.min() + max_period
+  span = ordinal.max() + max_period + 1
+  return codes * span + ordinal
+
+# Row in the sorted panel exactly k periods earlier (k > 0) or later
+# (k < 0) for the same entity, -1 where there is none. The positional
+# neighbour is checked first, only rows next to a gap are searched.
+def shift_source(sorted_key, k):
+  n = sorted_key.size
+  target = sorted_key - k
+  source = np.arange(n) - k
+  valid = (source >= 0) & (source < n)
+  hit = np.zeros(n, dtype = bool)
+  hit[valid] = sorted_key[source[valid]] == target[valid]
+  source = np.where(hit, source, -1)
+  miss = np.flatnonzero(~hit)
+  if miss.size:
+    position = np.searchsorted(sorted_key, target[miss])
+    position = np.minimum(position, n - 1)
+    found = sorted_key[position] == target[miss]
+    source[miss[found]] = position[found]
+  return source
+
+# Column values as an array whose take() fills with a missing value of a
+# matching type: nullable integers and booleans instead of float NaN,
+# NaT for datetimes, categoricals and floats as they are
+def fillable_array(values):
+  if pd.api.types.is_integer_dtype(values.dtype) or (
+      pd.api.types.is_bool_dtype(values.dtype)):
+    if isinstance(values.dtype, np.dtype):
+      return pd.array(values.to_numpy())
+  return values.array
+
+# Lagged and leaded copies of several columns for several horizons at
+# once; values whose neighbour is not exactly k months away are missing.
+# Column types are kept, integer and boolean columns become nullable.
+def panel_shift(data, columns, periods = 1, entity = "permno",
+                time = "month"):
+  columns = [columns] if isinstance(columns, str) else list(columns)
+  periods = [periods] if np.isscalar(periods) else list(periods)
+  key = panel_key(data, entity, time, max(abs(k) for k in periods))
+  if np.all(key[1:] >= key[:-1]):
+    order = np.arange(key.size)
+  else:
+    order = np.argsort(key, kind = "stable")
+  sorted_key = key[order]
+  if np.any(sorted_key[1:] == sorted_key[:-1]):
+    raise ValueError(f"Duplicate ({entity}, {time}) rows in panel")
+  arrays = {column : fillable_array(data[column]) for column in columns}
+  shifted = {}
+  for k in periods:
+    source = shift_source(sorted_key, k)
+    found = source >= 0
+    take_index = np.full(key.size, -1, dtype = np.int64)
+    take_index[order[found]] = order[source[found]]
+    for column in columns:
+      shifted[shift_name(column, k)] = arrays[column].take(
+        take_index, allow_fill = True)
+  return data.assign(**shifted)
@@ -0,0 +1,111 @@
+# path_cv.py
+import pandas as pd
+import numpy as np
+from itertools import product
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from reg_path import elastic_net_coef_path, ridge_coef_path
+
+# Whole penalty path for one l1_ratio, ElasticNet(fit_intercept = False)
+def fit_path(x, y, alphas, l1_ratio, tol = 1e-4, max_iter = 1000):
+  if l1_ratio == 0:
+    return ridge_coef_path(x, y, np.asarray(alphas) * x.shape[0])
+  return elastic_net_coef_path(x, y, alphas, l1_ratio, tol, max_iter)
+
+# Test scores for every (alpha, l1_ratio) on one fold, the preprocessor
+# is fitted once per fold and its output reused for all penalties
+def fold_scores(preprocessor, X, y, train, test, alphas, l1_ratios,
+                scoring, tol, max_iter):
+  transformer = clone(preprocessor)
+  x_train = transformer.fit_transform(X.iloc[train])
+  x_test = transformer.transform(X.iloc[test])
+  y_train = y[train]
+  y_test = y[test]
+  scores = np.empty((len(alphas), len(l1_ratios)))
+  for i, l1_ratio in enumerate(l1_ratios):
+    coefs = fit_path(x_train, y_train, alphas, l1_ratio, tol, max_iter)
+    errors = y_test[:, None] - x_test @ coefs.T
+    mse = np.mean(errors ** 2, axis = 0)
+    if scoring == "neg_mean_squared_error":
+      scores[:, i] = -mse
+    elif scoring == "neg_root_mean_squared_error":
+      scores[:, i] = -np.sqrt(mse)
+    else:
+      raise ValueError(f"Unsupported scoring: {scoring}")
+  return scores.ravel()
+
+# Refit on the whole group at the selected penalty, warm from above
+def selected_coefficients(preprocessor, X, y, alpha, l1_ratio, alphas,
+                          tol, max_iter):
+  transformer = clone(preprocessor)
+  x = transformer.fit_transform(X)
+  path_alphas = np.sort(np.asarray(alphas)[np.asarray(alphas) >= alpha])
+  coefs = fit_path(x, y, path_alphas, l1_ratio, tol, max_iter)
+  return coefs[0], transformer.get_feature_names_out()
+
+# cv_results_-style table for one group, rows ordered like ParameterGrid
+def group_cv_results(group, scores, alphas, l1_ratios):
+  grid = list(product(alphas, l1_ratios))
+  scores = np.column_stack(scores)
+  results = pd.DataFrame({
+    "group" : group,
+    "param_regressor__alpha" : [a for a, _ in grid],
+    "param_regressor__l1_ratio" : [l for _, l in grid],
+    "params" : [
+      {"regressor__alpha" : a, "regressor__l1_ratio" : l}
+      for a, l in grid
+    ]
+  })
+  for k in range(scores.shape[1]):
+    results[f"split{k}_test_score"] = scores[:, k]
+  results["mean_test_score"] = scores.mean(axis = 1)
+  results["std_test_score"] = scores.std(axis = 1)
+  results["rank_test_score"] = (results["mean_test_score"].rank(
+    ascending = False, method = "min"
+  ).astype(int))
+  return results
+
+# Grid search over alphas x l1_ratios for every group, with groups and
+# folds fitted concurrently and one warm-started path per fold
+def path_grid_search(data, preprocessor, alphas, cv, l1_ratios = (1.0,),
+                     group = "industry", target = "ret_excess",
+                     scoring = "neg_mean_squared_error", n_jobs = -1,
+                     tol = 1e-4, max_iter = 5000):
+  alphas = np.asarray(alphas, dtype = np.float64)
+  l1_ratios = list(l1_ratios)
+  groups = list(data[group].drop_duplicates())
+  subsets = {}
+  for name in groups:
+    subset = data.loc[data[group] == name].reset_index(drop = True)
+    subsets[name] = (subset, subset[target].to_numpy(dtype = np.float64))
+  tasks = [
+    (name, train, test) for name in groups
+    for train, test in cv.split(subsets[name][0])
+  ]
+  fold_results = Parallel(n_jobs = n_jobs)(
+    delayed(fold_scores)(preprocessor, *subsets[name], train, test,
+    alphas, l1_ratios, scoring, tol, max_iter)
+    for name, train, test in tasks
+  )
+  cv_results = pd.concat([
+    group_cv_results(
+      name,
+      [s for (n, _, _), s in zip(tasks, fold_results) if n == name],
+      alphas, l1_ratios
+    ) for name in groups
+  ], ignore_index = True)
+  best = cv_results.loc[
+    cv_results.groupby("group")["mean_test_score"].idxmax()
+  ].set_index("group")
+  refits = Parallel(n_jobs = n_jobs)(
+    delayed(selected_coefficients)(preprocessor, *subsets[name],
+    best.loc[name, "param_regressor__alpha"],
+    best.loc[name, "param_regressor__l1_ratio"],
+    alphas, tol, max_iter)
+    for name in groups
+  )
+  selected = pd.DataFrame(
+    {name : coef != 0 for name, (coef, _) in zip(groups, refits)},
+    index = pd.Index(refits[0][1], name = "variable")
+  )
+  return cv_results, selected
@@ -0,0 +1,237 @@
+# pipeline.py
+import time
+import pandas as pd
+import numpy as np
+from joblib import Parallel, delayed
+from data_catalog import default_catalog, database_path, cache_path
+from calendar_ordinal import (shift_month, july_formation_month,
+  fiscal_formation_month)
+from panel_shift import panel_shift
+from capm_beta import capm_beta, read_daily_returns
+from bond_panel import read_trace_chunks, build_bond_panel
+from incremental_refresh import clear_stale
+from instrument import stage
+
+# Chapter 3 betas: monthly returns over 60 months, daily returns over 60
+# trading days read in batches of stocks, both on the calendar-padded
+# panel and kept side by side
+def build_beta(catalog, window_size = 60, min_obs = 48,
+               daily_window_size = 60, daily_min_obs = 50,
+               batch_size = 500):
+  crsp_monthly = catalog.load("crsp_monthly_ff3",
+    ["permno", "month", "ret_excess"])
+  beta_monthly = capm_beta(
+    crsp_monthly, catalog.load("factors_ff3_monthly", ["month",
+      "mkt_excess"]),
+    "month", window_size, min_obs
+  ).rename(columns = {"beta" : "beta_monthly"})
+  factors_ff3_daily = catalog.load("factors_ff3_daily",
+    ["date", "mkt_excess"])
+  permnos = crsp_monthly["permno"].unique()
+  batches = [permnos[start:start + batch_size]
+    for start in range(0, len(permnos), batch_size)] or [permnos]
+  beta_daily = []
+  for batch in batches:
+    with catalog.lock:
+      crsp_daily = read_daily_returns(catalog.connection, batch)
+    beta_daily.append(capm_beta(crsp_daily, factors_ff3_daily, "date",
+      daily_window_size, daily_min_obs))
+  beta_daily = pd.concat(beta_daily, ignore_index = True).rename(
+    columns = {"beta" : "beta_daily"})
+  return beta_monthly.merge(beta_daily, how = "outer",
+    on = ["permno", "month"])
+
+# Book-to-market of fiscal year t with December t market equity, used
+# from July of t + 1
+def book_to_market(crsp_monthly, compustat):
+  market_equity = (crsp_monthly.query(
+    "month.dt.month == 12"
+  ).assign(
+    sorting_date = lambda x: shift_month(x["month"], 7)
+  ).get(
+    ["permno", "gvkey", "sorting_date", "mktcap"]
+  ).rename(
+    columns = {"mktcap" : "me"}
+  ))
+  return (compustat.assign(
+    sorting_date = lambda x: fiscal_formation_month(x["datadate"])
+  ).merge(
+    market_equity, how = "inner", on = ["gvkey", "sorting_date"]
+  ).assign(
+    bm = lambda x: x["be"] / x["me"]
+  ).get(["permno", "gvkey", "sorting_date", "me", "bm"]))
+
+def build_book_to_market(catalog):
+  return book_to_market(
+    catalog.load("crsp_monthly",
+      ["permno", "gvkey", "month", "mktcap"]),
+    catalog.load("compustat", ["gvkey", "datadate", "be"])
+  )
+
+# Breakpoints from NYSE stocks only, portfolios numbered from 1
+def nyse_portfolio(data, column, probs):
+  breakpoints = data.loc[data["exchange"] == "NYSE", column].quantile(probs)
+  return np.searchsorted(breakpoints.to_numpy(), data[column].to_numpy()) + 1
+
+# Fama-French size and value factors: June NYSE size breakpoints, 30/70
+# book-to-market breakpoints, portfolios held from July to June
+def replicated_factors(crsp_monthly, book_to_market):
+  size = (crsp_monthly.query(
+    "month.dt.month == 6"
+  ).assign(
+    sorting_date = lambda x: shift_month(x["month"], 1)
+  ).get(["permno", "exchange", "sorting_date", "mktcap"]))
+  portfolios = (size.merge(
+    book_to_market.get(["permno", "sorting_date", "bm"]),
+    how = "inner", on = ["permno", "sorting_date"]
+  ).dropna().groupby(
+    "sorting_date", group_keys = False
+  ).apply(
+    lambda x: x.assign(
+      portfolio_size = nyse_portfolio(x, "mktcap", [0.5]),
+      portfolio_bm = nyse_portfolio(x, "bm", [0.3, 0.7])
+    )
+  ).get(["permno", "sorting_date", "portfolio_size", "portfolio_bm"]))
+  factors = (crsp_monthly.assign(
+    sorting_date = lambda x: july_formation_month(x["month"])
+  ).merge(
+    portfolios, how = "inner", on = ["permno", "sorting_date"]
+  ).dropna(
+    subset = ["mktcap_lag"]
+  ).groupby(
+    ["portfolio_size", "portfolio_bm", "month"]
+  ).apply(
+    lambda x: np.average(x["ret_excess"], weights = x["mktcap_lag"])
+  ).reset_index(
+    name = "ret"
+  ).groupby("month").apply(
+    lambda x: pd.Series({
+      "smb_replicated" : x.loc[x["portfolio_size"] == 1, "ret"].mean()
+        - x.loc[x["portfolio_size"] == 2, "ret"].mean(),
+      "hml_replicated" : x.loc[x["portfolio_bm"] == 3, "ret"].mean()
+        - x.loc[x["portfolio_bm"] == 1, "ret"].mean()
+    })
+  ).reset_index())
+  return factors
+
+def build_factors_replicated(catalog):
+  return replicated_factors(
+    catalog.load("crsp_monthly", ["permno", "month", "exchange",
+      "mktcap", "mktcap_lag", "ret_excess"]),
+    catalog.load("book_to_market")
+  )
+
+# Monthly beta deciles on last month's beta
+def build_portfolio_assignments(catalog, n_portfolios = 10):
+  data = panel_shift(
+    catalog.load("crsp_monthly", ["permno", "month"]).merge(
+      catalog.load("beta"), how = "left", on = ["permno", "month"]
+    ),
+    "beta_monthly", periods = 1
+  ).dropna(subset = ["beta_monthly_lag"])
+  return data.assign(
+    portfolio = lambda x: x.groupby("month")["beta_monthly_lag"].transform(
+      lambda b: pd.qcut(b, n_portfolios, labels = False,
+        duplicates = "drop") + 1)
+  ).get(["permno", "month", "portfolio"])
+
+# Fama-MacBeth first stage: OLS of the target on an intercept and the
+# terms within every month, one row of premia per month
+def cross_section_premia(data, terms, target = "ret_excess_lead"):
+  def cross_section(x):
+    design = np.column_stack([np.ones(len(x))] + [x[t] for t in terms])
+    coef = np.linalg.lstsq(design, x[target].to_numpy(),
+      rcond = None)[0]
+    return pd.Series(coef, index = ["intercept"] + terms)
+  return data.groupby("month").apply(cross_section)
+
+# Cross-sectional regressions of next month's excess return on beta,
+# size and book-to-market
+def build_fm_premia(catalog):
+  crsp_monthly = catalog.load("crsp_monthly",
+    ["permno", "month", "ret_excess", "mktcap"])
+  data = (panel_shift(
+    crsp_monthly, "ret_excess", periods = -1
+  ).merge(
+    catalog.load("beta"), how = "left", on = ["permno", "month"]
+  ).assign(
+    log_mktcap = lambda x: np.log(x["mktcap"]),
+    sorting_date = lambda x: july_formation_month(x["month"])
+  ).merge(
+    catalog.load("book_to_market").get(["permno", "sorting_date", "bm"]),
+    how = "left", on = ["permno", "sorting_date"]
+  ).dropna(
+    subset = ["ret_excess_lead", "beta_monthly", "log_mktcap", "bm"]
+  ))
+  return cross_section_premia(data, ["beta_monthly", "log_mktcap", "bm"]
+    ).reset_index()
+
+def build_bond_panel_node(catalog, min_trades = 5, min_volume = 0):
+  with catalog.lock:
+    return build_bond_panel(read_trace_chunks(catalog.connection),
+      min_trades = min_trades, min_volume = min_volume)
+
+# Default catalog plus the derived tables of the chapters; parameters
+# are part of each node's cache key
+def pipeline_catalog(database = database_path, cache_dir = cache_path):
+  catalog = default_catalog(database, cache_dir)
+  catalog.register("beta", ["crsp_monthly_ff3", "factors_ff3_monthly",
+    "crsp_daily", "factors_ff3_daily"], build_beta, version = "2",
+    params = {"window_size" : 60, "min_obs" : 48,
+    "daily_window_size" : 60, "daily_min_obs" : 50, "batch_size" : 500})
+  catalog.register("book_to_market", ["crsp_monthly", "compustat"],
+    build_book_to_market)
+  catalog.register("factors_replicated",
+    ["crsp_monthly", "book_to_market"], build_factors_replicated)
+  catalog.register("portfolio_assignments", ["crsp_monthly", "beta"],
+    build_portfolio_assignments, params = {"n_portfolios" : 10})
+  catalog.register("fm_premia", ["crsp_monthly", "beta", "book_to_market"],
+    build_fm_premia)
+  catalog.register("bond_panel", ["trace_enhanced"], build_bond_panel_node,
+    params = {"min_trades" : 5, "min_volume" : 0})
+  return catalog
+
+# Depth of every derived node needed for the targets; nodes of equal
+# depth never depend on each other
+def dependency_levels(catalog, targets = None):
+  targets = list(catalog.derived) if targets is None else list(targets)
+  levels = {}
+  def visit(name, path):
+    if name in levels:
+      return levels[name]
+    if name in path:
+      raise ValueError(f"Cycle in pipeline: {' -> '.join(path + [name])}")
+    inputs = [i for i in catalog.derived[name]["inputs"]
+      if i in catalog.derived]
+    levels[name] = 1 + max(
+      (visit(i, path + [name]) for i in inputs), default = -1)
+    return levels[name]
+  for name in targets:
+    visit(name, [])
+  return levels
+
+def build_node(catalog, name):
+  tic = time.perf_counter()
+  with stage(f"build {name}") as build_stage:
+    data = catalog.load(name)
+    build_stage.rows(len(data))
+  with catalog.lock:
+    clear_stale(catalog.connection, name)
+  return {"node" : name, "rows" : len(data),
+    "seconds" : time.perf_counter() - tic}
+
+# Rebuild the invalidated nodes level by level, independent nodes of a
+# level side by side; cached nodes are only checked, not loaded
+def run_pipeline(catalog, targets = None, n_jobs = 4):
+  levels = dependency_levels(catalog, targets)
+  summary = []
+  for level in sorted(set(levels.values())):
+    names = [n for n, l in levels.items() if l == level]
+    rebuild = [n for n in names if not catalog.is_cached(n)]
+    built = Parallel(n_jobs = n_jobs, prefer = "threads")(
+      delayed(build_node)(catalog, n) for n in rebuild
+    )
+    summary += [{**b, "level" : level, "rebuilt" : True} for b in built]
+    summary += [{"node" : n, "level" : level, "rebuilt" : False}
+      for n in names if n not in rebuild]
+  return pd.DataFrame(summary)
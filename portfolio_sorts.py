@@ -0,0 +1,38 @@
+# portfolio_sorts.py
+import pandas as pd
+import numpy as np
+
+# Chapter 4 sort: quantile breakpoints of the sorting variable within one
+# month, portfolios numbered from 1
+def assign_portfolio(data, sorting_variable, n_portfolios):
+  breakpoints = np.quantile(
+    data[sorting_variable].dropna(),
+    np.linspace(0, 1, n_portfolios + 1),
+    method = "linear"
+  )
+  assigned_portfolios = pd.cut(
+    data[sorting_variable],
+    bins = breakpoints,
+    labels = range(1, breakpoints.size),
+    include_lowest = True,
+    right = False
+  )
+  return assigned_portfolios
+
+# Monthly portfolio returns, value weighted with last month's market cap
+# or equally weighted, one row per portfolio and month
+def portfolio_returns(data, sorting_variable, n_portfolios,
+                      value_weighted = True):
+  returns = (data.groupby(
+    "month", group_keys = False
+  ).apply(
+    lambda x: x.assign(
+      portfolio = assign_portfolio(x, sorting_variable, n_portfolios)
+    )
+  ).groupby(
+    ["portfolio", "month"], observed = True
+  ).apply(
+    lambda x: np.average(x["ret_excess"], weights = x["mktcap_lag"])
+    if value_weighted else x["ret_excess"].mean()
+  ).reset_index(name = "ret"))
+  return returns
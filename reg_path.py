@@ -0,0 +1,105 @@
+# reg_path.py
+import pandas as pd
+import numpy as np
+from sklearn.linear_model import enet_path
+
+# Ridge coefficients for every penalty from a single SVD of x,
+# same objective as Ridge(alpha = a, fit_intercept = False)
+def ridge_coef_path(x, y, alphas):
+  u, s, vt = np.linalg.svd(np.asarray(x, dtype = np.float64),
+    full_matrices = False)
+  uty = u.T @ np.asarray(y, dtype = np.float64)
+  alphas = np.asarray(alphas, dtype = np.float64)
+  shrinkage = s[None, :] / (s[None, :] ** 2 + alphas[:, None])
+  return (shrinkage * uty[None, :]) @ vt
+
+# Coordinate descent for one penalty on the covariance form, only the
+# active set is swept and gradient is updated in place. Used where only
+# moments are available (rolling windows); paths on data go through
+# sklearn's compiled solver in elastic_net_coef_path.
+def coordinate_descent(gram, gradient, coef, active, l1, l2,
+                       tol = 1e-4, max_iter = 1000):
+  diagonal = np.diag(gram)
+  for iteration in range(max_iter):
+    max_change = 0.0
+    max_coef = 0.0
+    for j in active:
+      if diagonal[j] == 0:
+        continue
+      rho = gradient[j] + diagonal[j] * coef[j]
+      new = np.sign(rho) * max(abs(rho) - l1, 0.0) / (diagonal[j] + l2)
+      delta = new - coef[j]
+      if delta != 0.0:
+        gradient -= gram[:, j] * delta
+        coef[j] = new
+        max_change = max(max_change, abs(delta))
+      max_coef = max(max_coef, abs(new))
+    if max_change <= tol * max(max_coef, 1e-12):
+      break
+  return coef
+
+# One penalty on the covariance form, warm-started from coef and screened
+# with the sequential strong rule, then checked against the KKT conditions
+def elastic_net_gram(gram, xy, alpha, l1_ratio = 1.0, coef = None,
+                     previous_alpha = None, tol = 1e-4, max_iter = 1000):
+  coef = np.zeros(xy.size) if coef is None else np.array(coef)
+  gradient = xy - gram @ coef
+  l1 = alpha * l1_ratio
+  l2 = alpha * (1 - l1_ratio)
+  if previous_alpha is None:
+    previous_l1 = np.abs(xy).max()
+  else:
+    previous_l1 = previous_alpha * l1_ratio
+  strong = np.abs(gradient) >= 2 * l1 - previous_l1
+  active = np.flatnonzero(strong | (coef != 0))
+  while True:
+    coef = coordinate_descent(
+      gram, gradient, coef, active, l1, l2, tol, max_iter
+    )
+    violations = np.flatnonzero(
+      (np.abs(gradient - l2 * coef) > l1 * (1 + 1e-8)) & (coef == 0)
+    )
+    violations = np.setdiff1d(violations, active)
+    if violations.size == 0:
+      return coef
+    active = np.union1d(active, violations)
+
+# Lasso/ElasticNet path with sklearn's warm-started coordinate descent on
+# the precomputed Gram matrix, same objective as ElasticNet(alpha = a,
+# l1_ratio, fit_intercept = False); rows follow the order of alphas
+def elastic_net_coef_path(x, y, alphas, l1_ratio = 1.0, tol = 1e-4,
+                          max_iter = 1000):
+  x = np.asarray(x, dtype = np.float64)
+  y = np.asarray(y, dtype = np.float64)
+  alphas = np.asarray(alphas, dtype = np.float64)
+  descending = np.argsort(alphas)[::-1]
+  _, coefs, _ = enet_path(
+    x, y, l1_ratio = l1_ratio, alphas = alphas[descending],
+    precompute = True, tol = tol, max_iter = max_iter
+  )
+  path = np.empty((alphas.size, x.shape[1]))
+  path[descending] = coefs.T
+  return path
+
+def lasso_coef_path(x, y, alphas, tol = 1e-4, max_iter = 1000):
+  return elastic_net_coef_path(x, y, alphas, 1.0, tol, max_iter)
+
+# Coefficient matrix in the long format of the coefficient plot
+def path_long(coefs, alphas, model, feature_names = None):
+  coefficients = pd.DataFrame(coefs, columns = feature_names)
+  coefficients = (coefficients.assign(
+    alpha = alphas, model = model
+  ).melt(
+    id_vars = ["alpha", "model"]
+  ))
+  return coefficients
+
+# Lasso and Ridge trajectories stacked for plotting
+def coefficient_paths(x, y, alphas, feature_names = None):
+  coefficients = pd.concat([
+    path_long(lasso_coef_path(x, y, alphas), alphas, "Lasso",
+      feature_names),
+    path_long(ridge_coef_path(x, y, alphas), alphas, "Ridge",
+      feature_names)
+  ], ignore_index = True)
+  return coefficients
@@ -0,0 +1,106 @@
+# rolling_forecast.py
+import pandas as pd
+import numpy as np
+import time
+from reg_path import elastic_net_gram
+from interactions import InteractionFeatures
+
+# Running sums of a window, rows enter and leave without a refit
+class WindowMoments:
+  def __init__(self, p):
+    self.n = 0
+    self.sum_x = np.zeros(p)
+    self.sum_xx = np.zeros((p, p))
+    self.sum_xy = np.zeros(p)
+    self.sum_y = 0.0
+
+  def update(self, x, y, sign = 1.0):
+    self.n += int(sign) * x.shape[0]
+    self.sum_x += sign * x.sum(axis = 0)
+    self.sum_xx += sign * (x.T @ x)
+    self.sum_xy += sign * (x.T @ y)
+    self.sum_y += sign * y.sum()
+
+  # Scaler moments and the standardized Gram matrix and Z'y / n
+  def standardized(self):
+    mean = self.sum_x / self.n
+    var = np.maximum(np.diag(self.sum_xx) / self.n - mean ** 2, 0.0)
+    scale = np.sqrt(var)
+    scale[scale == 0] = 1.0
+    gram = ((self.sum_xx / self.n - np.outer(mean, mean))
+      / np.outer(scale, scale))
+    xy = (self.sum_xy / self.n - mean * self.sum_y / self.n) / scale
+    return mean, scale, gram, xy
+
+# Monthly refits on a rolling or expanding window, each warm-started from
+# the previous month's solution, and a one-step-ahead forecast
+def rolling_forecast(months, x, y, alpha, l1_ratio = 1.0, window = 60,
+                     expanding = False, tol = 1e-4, max_iter = 5000):
+  months = pd.to_datetime(pd.Series(months)).to_numpy()
+  x = np.asarray(x, dtype = np.float64)
+  y = np.asarray(y, dtype = np.float64)
+  order = np.argsort(months, kind = "stable")
+  months, x, y = months[order], x[order], y[order]
+  unique_months, starts = np.unique(months, return_index = True)
+  ends = np.append(starts[1:], months.size)
+  moments = WindowMoments(x.shape[1])
+  coef = None
+  forecasts = []
+  for t in range(window, unique_months.size):
+    tic = time.perf_counter()
+    entering = slice(starts[t - 1], ends[t - 1])
+    if t == window:
+      entering = slice(starts[0], ends[t - 1])
+    moments.update(x[entering], y[entering])
+    if not expanding and t > window:
+      leaving = slice(starts[t - window - 1], ends[t - window - 1])
+      moments.update(x[leaving], y[leaving], sign = -1.0)
+    mean, scale, gram, xy = moments.standardized()
+    coef = elastic_net_gram(
+      gram, xy, alpha, l1_ratio, coef,
+      None if coef is None else alpha, tol, max_iter
+    )
+    refit_seconds = time.perf_counter() - tic
+    current = slice(starts[t], ends[t])
+    prediction = ((x[current] - mean) / scale) @ coef
+    forecasts.append(pd.DataFrame({
+      "month" : months[current],
+      "prediction" : prediction,
+      "realization" : y[current],
+      "n_train" : moments.n,
+      "n_selected" : int(np.sum(coef != 0)),
+      "refit_seconds" : refit_seconds
+    }))
+  return pd.concat(forecasts, ignore_index = True)
+
+# Out-of-sample R2 against a zero forecast
+def oos_r2(forecasts):
+  errors = forecasts["realization"] - forecasts["prediction"]
+  return 1 - np.sum(errors ** 2) / np.sum(forecasts["realization"] ** 2)
+
+# Monthly OOS prediction series and summary for every industry
+def industry_forecasts(data, macro_columns, factor_columns, alpha,
+                       l1_ratio = 1.0, window = 60, expanding = False,
+                       group = "industry", target = "ret_excess"):
+  features = InteractionFeatures(
+    macro_columns, factor_columns, standardize = False
+  )
+  forecasts = []
+  for name, subset in data.groupby(group, sort = False):
+    industry_forecast = rolling_forecast(
+      subset["month"],
+      features.transform(subset),
+      subset[target],
+      alpha, l1_ratio, window, expanding
+    ).assign(**{group : name})
+    forecasts.append(industry_forecast)
+  forecasts = pd.concat(forecasts, ignore_index = True)
+  summary = (forecasts.groupby(group).apply(
+    lambda x: pd.Series({
+      "oos_r2" : oos_r2(x),
+      "n_forecasts" : len(x),
+      "mean_refit_seconds" : x["refit_seconds"].mean(),
+      "total_refit_seconds" : x["refit_seconds"].sum()
+    })
+  ).reset_index())
+  return forecasts, summary
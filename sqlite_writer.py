@@ -0,0 +1,137 @@
+# sqlite_writer.py
+import time
+import pandas as pd
+import numpy as np
+from data_catalog import quote, bump_version
+
+# Python values per column, converted once with NumPy instead of per row
+# by to_sql; timestamps use the text format to_sql writes, missing
+# values become NULL
+def column_values(values):
+  missing = values.isna().to_numpy()
+  if pd.api.types.is_datetime64_any_dtype(values):
+    stamps = values.to_numpy().astype("datetime64[us]")
+    text = np.char.replace(
+      np.datetime_as_string(stamps, unit = "us"), "T", " ")
+    seconds = stamps.astype("datetime64[s]") == stamps
+    text = np.where(seconds, np.char.partition(text, ".")[:, 0], text)
+    converted = text.astype(object)
+  elif pd.api.types.is_bool_dtype(values):
+    converted = values.to_numpy().astype(np.int64).astype(object)
+  elif pd.api.types.is_numeric_dtype(values):
+    converted = values.to_numpy().astype(object)
+  else:
+    converted = values.to_numpy(dtype = object)
+  if missing.any():
+    converted[missing] = None
+  return converted.tolist()
+
+def sql_rows(data):
+  return list(zip(*(column_values(data[c]) for c in data.columns)))
+
+# Table writer for large loads: synchronous writes off, one transaction
+# for everything written until close(), executemany over pre-converted
+# columns and indexes built only after the rows are in. Used as a context
+# manager on a connection without an open transaction; close() records
+# the write with bump_version.
+class BulkWriter:
+  def __init__(self, con, name, if_exists = "append", indexes = None,
+               chunk_size = 200000):
+    self.con = con
+    self.name = name
+    self.if_exists = if_exists
+    self.indexes = indexes or []
+    self.chunk_size = chunk_size
+    self.rows = 0
+    self.seconds = 0.0
+    self.sql = None
+    self.synchronous = None
+
+  # The caller's uncommitted writes are not folded into the load
+  def __enter__(self):
+    if self.con.in_transaction:
+      raise RuntimeError(
+        f"Connection has an open transaction, commit or roll it back "
+        f"before writing {self.name}"
+      )
+    self.synchronous = self.con.execute(
+      "PRAGMA synchronous").fetchone()[0]
+    self.con.execute("PRAGMA synchronous = OFF")
+    self.con.execute("BEGIN")
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc_type is None:
+      self.close()
+    else:
+      self.con.rollback()
+      self.con.execute(f"PRAGMA synchronous = {self.synchronous}")
+    return False
+
+  def table_exists(self):
+    return self.con.execute(
+      "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+      (self.name,)
+    ).fetchone() is not None
+
+  # Create the table from the first frame, like to_sql would
+  def prepare(self, data):
+    exists = self.table_exists()
+    if exists and self.if_exists == "fail":
+      raise ValueError(f"Table {self.name} already exists")
+    if exists and self.if_exists == "replace":
+      self.con.execute(f"DROP TABLE {quote(self.name)}")
+      exists = False
+    if not exists:
+      self.con.execute(pd.io.sql.get_schema(data, self.name,
+        con = self.con))
+    self.sql = (f"INSERT INTO {quote(self.name)} "
+      f"({', '.join(quote(c) for c in data.columns)}) "
+      f"VALUES ({', '.join('?' for _ in data.columns)})")
+
+  def write(self, data):
+    tic = time.perf_counter()
+    if self.sql is None:
+      self.prepare(data)
+    for start in range(0, len(data), self.chunk_size):
+      self.con.executemany(self.sql,
+        sql_rows(data.iloc[start:start + self.chunk_size]))
+    self.rows += len(data)
+    self.seconds += time.perf_counter() - tic
+    return self
+
+  # Without any frame written there is no table to index; replace still
+  # drops the old table like to_sql would
+  def close(self):
+    tic = time.perf_counter()
+    changed = self.sql is not None
+    if self.sql is None:
+      if self.if_exists == "replace" and self.table_exists():
+        self.con.execute(f"DROP TABLE {quote(self.name)}")
+        changed = True
+    else:
+      for columns in self.indexes:
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        index_name = f"{self.name}_{'_'.join(columns)}"
+        self.con.execute(
+          f"CREATE INDEX IF NOT EXISTS {quote(index_name)} "
+          f"ON {quote(self.name)} "
+          f"({', '.join(quote(c) for c in columns)})"
+        )
+    if changed:
+      bump_version(self.con, self.name)
+    self.con.commit()
+    self.con.execute(f"PRAGMA synchronous = {self.synchronous}")
+    self.seconds += time.perf_counter() - tic
+    return self.summary()
+
+  def summary(self):
+    return {"table" : self.name, "rows" : self.rows,
+      "seconds" : self.seconds,
+      "rows_per_second" : self.rows / self.seconds if self.seconds else None}
+
+# Drop-in for data.to_sql(name, con, if_exists, index = False)
+def bulk_write(data, name, con, if_exists = "replace", indexes = None):
+  with BulkWriter(con, name, if_exists, indexes) as writer:
+    writer.write(data)
+  return writer.summary()
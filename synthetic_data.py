@@ -0,0 +1,215 @@
+# synthetic_data.py
+import sqlite3
+import pandas as pd
+import numpy as np
+from calendar_ordinal import month_ordinal, ordinal_month
+from data_catalog import bump_version
+
+exchanges = ["NYSE", "AMEX", "NASDAQ", "Other"]
+exchange_probs = [0.3, 0.12, 0.55, 0.03]
+industries = ["Manufacturing", "Finance", "Services", "Retail",
+  "Wholesale", "Transportation", "Utilities", "Mining", "Construction",
+  "Public", "Agriculture", "Missing"]
+industry_probs = [0.24, 0.18, 0.2, 0.08, 0.05, 0.05, 0.04, 0.06, 0.02,
+  0.03, 0.01, 0.04]
+exchange_codes = {"NYSE" : 1, "AMEX" : 2, "NASDAQ" : 3, "Other" : 4}
+
+# Market, size and value factors plus the risk-free rate for months or
+# trading days, scaled from monthly moments
+def factors_ff3(dates, seed = 1, daily = False):
+  rng = np.random.default_rng(seed)
+  n = len(dates)
+  scale = 1 / 21 if daily else 1
+  factors = pd.DataFrame({
+    "date" if daily else "month" : dates,
+    "mkt_excess" : rng.normal(0.006 * scale, 0.045 * np.sqrt(scale), n),
+    "smb" : rng.normal(0.002 * scale, 0.03 * np.sqrt(scale), n),
+    "hml" : rng.normal(0.003 * scale, 0.03 * np.sqrt(scale), n),
+    "rf" : np.full(n, 0.003 * scale)
+  })
+  return factors
+
+def factors_ff3_monthly(start = "1990-01-01", end = "2022-12-01",
+                        seed = 1):
+  months = pd.date_range(start, end, freq = "MS")
+  return factors_ff3(months, seed)
+
+def factors_ff3_daily(start = "1990-01-01", end = "2022-12-31", seed = 2):
+  dates = pd.bdate_range(start, end)
+  return factors_ff3(dates, seed, daily = True)
+
+# Stock-month panel: staggered listings with exponential lifetimes,
+# random missing months, lognormal size with a random walk and returns
+# from a one-factor model with fat-tailed idiosyncratic noise
+def crsp_monthly(factors, n_stocks = 2000, mean_life_years = 10,
+                 gap_prob = 0.01, seed = 3):
+  rng = np.random.default_rng(seed)
+  months = month_ordinal(factors["month"])
+  first, last = months.min(), months.max()
+  listing = rng.integers(first - 120, last, n_stocks)
+  life = np.ceil(rng.exponential(mean_life_years * 12, n_stocks)).astype(
+    np.int64) + 12
+  start = np.maximum(listing, first)
+  end = np.minimum(listing + life, last)
+  start, end = start[end >= start], end[end >= start]
+  n_stocks = start.size
+  length = end - start + 1
+  stock = np.repeat(np.arange(n_stocks), length)
+  offset = np.arange(stock.size) - np.repeat(np.cumsum(length) - length,
+    length)
+  month = start[stock] + offset
+  keep = rng.random(stock.size) >= gap_prob
+  keep[np.cumsum(length) - length] = True
+  stock, month = stock[keep], month[keep]
+  factor_row = month - first
+  beta = rng.normal(1, 0.4, n_stocks)
+  idiosyncratic = 0.1 * rng.standard_t(4, stock.size) / np.sqrt(2)
+  ret_excess = (beta[stock] * factors["mkt_excess"].to_numpy()[factor_row]
+    + idiosyncratic)
+  ret_excess = np.maximum(ret_excess, -0.99)
+  rf = factors["rf"].to_numpy()[factor_row]
+  new_stock = np.ones(stock.size, dtype = bool)
+  new_stock[1:] = stock[1:] != stock[:-1]
+  growth = np.log1p(ret_excess)
+  cumulative = np.cumsum(growth)
+  first_row = np.flatnonzero(new_stock)
+  base = cumulative[first_row] - growth[first_row]
+  log_size = (rng.normal(5, 2, n_stocks)[stock] + cumulative
+    - np.repeat(base, np.diff(np.r_[first_row, stock.size])))
+  mktcap = np.exp(log_size)
+  mktcap_lag = np.r_[np.nan, mktcap[:-1]]
+  gap = np.r_[True, np.diff(month) != 1] | new_stock
+  mktcap_lag[gap] = np.nan
+  exchange = rng.choice(exchanges, n_stocks, p = exchange_probs)
+  industry = rng.choice(industries, n_stocks, p = industry_probs)
+  permno = 10000 + np.arange(n_stocks)
+  data = pd.DataFrame({
+    "permno" : permno[stock],
+    "gvkey" : np.char.zfill((1000 + np.arange(n_stocks)).astype(str), 6)[
+      stock],
+    "month" : ordinal_month(month),
+    "ret" : ret_excess + rf,
+    "ret_excess" : ret_excess,
+    "shrout" : np.round(mktcap / 20, 3),
+    "altprc" : 20.0,
+    "mktcap" : mktcap,
+    "mktcap_lag" : mktcap_lag,
+    "exchange" : exchange[stock],
+    "exchcd" : pd.Series(exchange[stock]).map(exchange_codes).to_numpy(),
+    "industry" : industry[stock],
+    "shrcd" : 10,
+    "siccd" : rng.integers(100, 9999, n_stocks)[stock]
+  })
+  return data
+
+# Daily returns for every listed stock-month from a one-factor model;
+# the betas are drawn here, independently of the monthly panel's
+def crsp_daily(monthly, factors_daily, seed = 4):
+  rng = np.random.default_rng(seed)
+  day_month = month_ordinal(factors_daily["date"])
+  month_start = np.searchsorted(day_month, np.unique(day_month))
+  month_days = np.diff(np.r_[month_start, day_month.size])
+  first = day_month.min()
+  month = month_ordinal(monthly["month"]) - first
+  inside = (month >= 0) & (month < month_start.size)
+  monthly = monthly.loc[inside]
+  month = month[inside]
+  counts = month_days[month]
+  row = np.repeat(np.arange(month.size), counts)
+  day = (month_start[month][row] + np.arange(row.size)
+    - np.repeat(np.cumsum(counts) - counts, counts))
+  permno = monthly["permno"].to_numpy()
+  codes, uniques = pd.factorize(permno)
+  beta = rng.normal(1, 0.4, uniques.size)
+  ret_excess = (beta[codes[row]]
+    * factors_daily["mkt_excess"].to_numpy()[day]
+    + 0.02 * rng.standard_t(4, row.size) / np.sqrt(2))
+  data = pd.DataFrame({
+    "permno" : permno[row],
+    "date" : factors_daily["date"].to_numpy()[day],
+    "month" : monthly["month"].to_numpy()[row],
+    "ret_excess" : ret_excess
+  })
+  return data
+
+# Annual accounting rows for every firm-year with a December listing,
+# most fiscal years end in December, some in June
+def compustat(monthly, seed = 5):
+  rng = np.random.default_rng(seed)
+  december = monthly.loc[monthly["month"].dt.month == 12]
+  n = len(december)
+  fiscal_month = np.where(rng.random(n) < 0.8, 12, 6)
+  year = december["month"].dt.year.to_numpy()
+  datadate = (pd.to_datetime(pd.DataFrame({
+    "year" : year, "month" : fiscal_month, "day" : 1
+  })) + pd.offsets.MonthEnd(0))
+  be = december["mktcap"].to_numpy() * np.exp(rng.normal(-0.4, 0.8, n))
+  be[rng.random(n) < 0.03] *= -1
+  data = pd.DataFrame({
+    "gvkey" : december["gvkey"].to_numpy(),
+    "datadate" : datadate.to_numpy(),
+    "year" : year,
+    "be" : be,
+    "op" : rng.normal(0.12, 0.2, n),
+    "inv" : rng.normal(0.08, 0.25, n),
+    "at" : be * np.exp(rng.normal(0.8, 0.5, n)),
+    "ni" : be * rng.normal(0.1, 0.15, n)
+  })
+  return data
+
+# Enhanced TRACE trades: lognormal bond liquidity drives Poisson trade
+# counts per business day, heavy-tailed trade sizes around par prices
+def trace_enhanced(n_bonds = 500, start = "2014-01-01",
+                   end = "2016-11-30", seed = 6):
+  rng = np.random.default_rng(seed)
+  dates = pd.bdate_range(start, end).to_numpy()
+  liquidity = rng.lognormal(0, 1.2, n_bonds)
+  issue = rng.integers(0, dates.size, n_bonds) * (rng.random(n_bonds) < 0.3)
+  trades = rng.poisson(liquidity[:, None], (n_bonds, dates.size))
+  trades[np.arange(dates.size)[None, :] < issue[:, None]] = 0
+  bond, day = np.nonzero(trades)
+  count = trades[bond, day]
+  bond = np.repeat(bond, count)
+  day = np.repeat(day, count)
+  n = bond.size
+  coupon = rng.uniform(1, 7, n_bonds)
+  data = pd.DataFrame({
+    "cusip_id" : np.char.add("SYN", np.char.zfill(
+      np.arange(n_bonds).astype(str), 6))[bond],
+    "trd_exctn_dt" : dates[day],
+    "rptd_pr" : 100 + rng.normal(0, 3, n_bonds)[bond] + rng.normal(
+      0, 0.5, n),
+    "entrd_vol_qt" : np.round(rng.lognormal(10, 2, n), -3) + 1000,
+    "yld_pt" : coupon[bond] + rng.normal(0, 0.3, n),
+    "rpt_side_cd" : rng.choice(["B", "S"], n),
+    "cntra_mp_id" : rng.choice(["C", "D"], n, p = [0.7, 0.3])
+  })
+  return data
+
+# All tables at one scale, keyed by the names used in the database
+def synthetic_tables(n_stocks = 2000, n_bonds = 500, start = "1990-01-01",
+                     end = "2022-12-31", daily = True, seed = 0):
+  seeds = np.random.SeedSequence(seed).generate_state(6)
+  monthly_factors = factors_ff3_monthly(start, pd.Timestamp(end).to_period(
+    "M").to_timestamp(), seed = seeds[0])
+  tables = {"factors_ff3_monthly" : monthly_factors}
+  tables["crsp_monthly"] = crsp_monthly(monthly_factors, n_stocks,
+    seed = seeds[1])
+  tables["compustat"] = compustat(tables["crsp_monthly"], seed = seeds[2])
+  tables["trace_enhanced"] = trace_enhanced(n_bonds, seed = seeds[3])
+  if daily:
+    tables["factors_ff3_daily"] = factors_ff3_daily(start, end,
+      seed = seeds[4])
+    tables["crsp_daily"] = crsp_daily(tables["crsp_monthly"],
+      tables["factors_ff3_daily"], seed = seeds[5])
+  return tables
+
+# Stand-in for data/tidy_finance_python.sqlite so the chapters run
+# without WRDS access
+def write_database(path, tables):
+  con = sqlite3.connect(database = path)
+  for name, table in tables.items():
+    table.to_sql(name = name, con = con, if_exists = "replace",
+      index = False)
+    bump_version(con, name)
+  con.close()
@@ -0,0 +1,62 @@
+# tests/test_bond_panel.py
+import os
+import sys
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+  __file__))))
+from bond_panel import build_bond_panel
+
+# One trade per row, volume and price fixed so avg_yield is the yield
+def trades(rows):
+  return pd.DataFrame({
+    "cusip_id" : [r[0] for r in rows],
+    "trd_exctn_dt" : pd.to_datetime([r[1] for r in rows]),
+    "rptd_pr" : 100.0,
+    "entrd_vol_qt" : 1000.0,
+    "yld_pt" : [r[2] for r in rows]
+  })
+
+# Reference panel: last trading day per bond and calendar month
+def reference_panel(data):
+  return (data.assign(
+    month = lambda x: x["trd_exctn_dt"].dt.to_period("M").dt.to_timestamp()
+  ).sort_values(
+    ["cusip_id", "trd_exctn_dt"]
+  ).groupby(
+    ["cusip_id", "month"], as_index = False
+  ).last().get(
+    ["cusip_id", "month", "yld_pt"]
+  ).rename(
+    columns = {"yld_pt" : "avg_yield"}
+  ))
+
+def test_trade_on_first_of_month_stays_in_its_month():
+  data = trades([
+    ("A", "2015-05-28", 1.0),
+    ("A", "2015-05-29", 2.0),
+    ("A", "2015-06-01", 3.0),
+    ("A", "2015-06-15", 4.0)
+  ])
+  panel = build_bond_panel([data], min_trades = 1)
+  expected = reference_panel(data)
+  pd.testing.assert_frame_equal(panel, expected, check_dtype = False)
+  may = panel.loc[panel["month"] == "2015-05-01", "avg_yield"]
+  assert may.tolist() == [2.0]
+
+def test_bond_month_straddling_chunks():
+  data = trades([
+    ("A", "2015-05-29", 1.0),
+    ("A", "2015-06-01", 2.0),
+    ("A", "2015-06-02", 3.0),
+    ("A", "2015-06-30", 4.0),
+    ("B", "2015-06-01", 5.0),
+    ("B", "2015-07-01", 6.0)
+  ])
+  expected = reference_panel(data)
+  for size in range(1, len(data) + 1):
+    chunks = [data.iloc[start:start + size]
+      for start in range(0, len(data), size)]
+    panel = build_bond_panel(chunks, min_trades = 1)
+    pd.testing.assert_frame_equal(panel, expected, check_dtype = False)
@@ -0,0 +1,64 @@
+# tests/test_reg_path.py
+import os
+import sys
+import numpy as np
+import pytest
+from sklearn.linear_model import lasso_path, Ridge
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+  __file__))))
+from reg_path import lasso_coef_path, ridge_coef_path, elastic_net_gram
+
+# Correlated regressors of the size of one industry in chapter 11
+@pytest.fixture
+def data():
+  rng = np.random.default_rng(0)
+  n, p = 600, 40
+  common = rng.normal(size = (n, 1))
+  x = rng.normal(size = (n, p)) + 0.5 * common
+  x = (x - x.mean(axis = 0)) / x.std(axis = 0)
+  coef = np.zeros(p)
+  coef[:5] = [0.8, -0.5, 0.3, 0.2, -0.1]
+  y = x @ coef + rng.normal(size = n)
+  return x, y - y.mean()
+
+def test_lasso_coef_path_matches_sklearn(data):
+  x, y = data
+  alphas = np.logspace(-4, 0, 30)
+  path = lasso_coef_path(x, y, alphas, tol = 1e-10, max_iter = 100000)
+  _, coefs, _ = lasso_path(x, y, alphas = alphas[::-1], tol = 1e-10,
+    max_iter = 100000)
+  np.testing.assert_allclose(path, coefs.T[::-1], atol = 1e-6)
+
+# Alphas in any order come back in that order
+def test_lasso_coef_path_keeps_alpha_order(data):
+  x, y = data
+  alphas = np.array([0.01, 0.1, 0.001, 0.05])
+  path = lasso_coef_path(x, y, alphas, tol = 1e-10, max_iter = 100000)
+  for k, alpha in enumerate(alphas):
+    np.testing.assert_allclose(
+      path[k], lasso_coef_path(x, y, [alpha], tol = 1e-10,
+      max_iter = 100000)[0], atol = 1e-6)
+
+# The moment-based solver of the rolling forecasts agrees with sklearn
+def test_elastic_net_gram_matches_sklearn(data):
+  x, y = data
+  n = x.shape[0]
+  alphas = np.logspace(-1, -4, 10)
+  _, coefs, _ = lasso_path(x, y, alphas = alphas, tol = 1e-10,
+    max_iter = 100000)
+  coef = None
+  previous = None
+  for k, alpha in enumerate(alphas):
+    coef = elastic_net_gram(x.T @ x / n, x.T @ y / n, alpha, 1.0, coef,
+      previous, tol = 1e-10, max_iter = 100000)
+    previous = alpha
+    np.testing.assert_allclose(coef, coefs[:, k], atol = 1e-6)
+
+def test_ridge_coef_path_matches_sklearn(data):
+  x, y = data
+  alphas = [0.1, 10.0, 1000.0]
+  path = ridge_coef_path(x, y, alphas)
+  for k, alpha in enumerate(alphas):
+    ridge = Ridge(alpha = alpha, fit_intercept = False).fit(x, y)
+    np.testing.assert_allclose(path[k], ridge.coef_, atol = 1e-8)
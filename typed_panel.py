@@ -0,0 +1,73 @@
+# typed_panel.py
+import pandas as pd
+import numpy as np
+from calendar_ordinal import month_ordinal, ordinal_month
+
+categorical_columns = ["exchange", "industry", "gvkey", "cusip_id",
+  "complete_cusip", "sic_code"]
+id_columns = ["permno", "permco", "shrcd", "exchcd", "siccd", "year"]
+return_columns = ["ret", "ret_excess", "mkt_excess", "smb", "hml", "rf",
+  "beta_monthly", "beta_daily"]
+month_columns = ["month", "sorting_date"]
+
+# Smallest signed integer type holding every value of an integer column
+def smallest_int(values):
+  for dtype in (np.int16, np.int32):
+    info = np.iinfo(dtype)
+    if values.size == 0 or (values.min() >= info.min
+                            and values.max() <= info.max):
+      return dtype
+  return np.int64
+
+# Compact representation of a CRSP/Compustat panel: categorical codes,
+# narrow integer ids, month ordinals and optionally float32 returns.
+# The original dtypes are kept in attrs so restore_panel can undo it.
+# copy = False converts the frame passed in, for freshly read data that
+# nothing else holds.
+def compact_panel(data, float32_returns = False, month_as_ordinal = True,
+                  copy = True):
+  if copy:
+    data = data.copy()
+  original = {}
+  for column in data.columns:
+    values = data[column]
+    if column in categorical_columns and values.dtype == object:
+      original[column] = str(values.dtype)
+      data[column] = values.astype("category")
+    elif (column in id_columns
+          and pd.api.types.is_integer_dtype(values)):
+      original[column] = str(values.dtype)
+      data[column] = values.to_numpy().astype(
+        smallest_int(values.to_numpy()))
+    elif (column in month_columns and month_as_ordinal
+          and pd.api.types.is_datetime64_any_dtype(values)):
+      ordinal = month_ordinal(values)
+      if (values.isna().any()
+          or not (ordinal_month(ordinal) == values.to_numpy()).all()):
+        continue
+      original[column] = str(values.dtype)
+      data[column] = ordinal.astype(smallest_int(ordinal))
+    elif (column in return_columns and float32_returns
+          and values.dtype == np.float64):
+      original[column] = str(values.dtype)
+      data[column] = values.astype(np.float32)
+  data.attrs["typed_panel"] = original
+  return data
+
+# Back to the frames the chapters use, exact unless float32 was chosen
+def restore_panel(data):
+  data = data.copy()
+  original = data.attrs.pop("typed_panel", {})
+  for column, dtype in original.items():
+    if column not in data:
+      continue
+    if column in month_columns and dtype.startswith("datetime64"):
+      data[column] = ordinal_month(data[column].to_numpy())
+    elif dtype == "object":
+      data[column] = data[column].astype(object)
+    else:
+      data[column] = data[column].astype(dtype)
+  return data
+
+def memory_mb(data):
+  return data.memory_usage(deep = True).sum() / 1024 ** 2
@@ -0,0 +1,90 @@
+# wild_bootstrap.py
+import pandas as pd
+import numpy as np
+from joblib import Parallel, delayed
+from fe_absorb import group_sums
+
+webb_values = np.array([
+  -np.sqrt(1.5), -1.0, -np.sqrt(0.5), np.sqrt(0.5), 1.0, np.sqrt(1.5)
+])
+
+# Cluster-level weights, one column per bootstrap draw
+def bootstrap_weights(rng, n_clusters, n_draws, weights = "rademacher"):
+  if weights == "rademacher":
+    return 2.0 * rng.integers(0, 2, size = (n_clusters, n_draws)) - 1.0
+  if weights == "webb":
+    return webb_values[rng.integers(0, 6, size = (n_clusters, n_draws))]
+  raise ValueError(f"Unknown bootstrap weights: {weights}")
+
+# Restricted residual-maker factorized into cluster-level pieces, after
+# which a draw only needs products with the G cluster weights
+def factorize_wild_bootstrap(x, y, j, cluster_codes, n_clusters,
+                             null = 0.0):
+  nobs, k = x.shape
+  y_null = y - null * x[:, j]
+  x_restricted = np.delete(x, j, axis = 1)
+  beta_restricted = np.linalg.lstsq(x_restricted, y_null, rcond = None)[0]
+  residuals_restricted = y_null - x_restricted @ beta_restricted
+  xx_inv = np.linalg.inv(x.T @ x)
+  xu = group_sums(cluster_codes, x * residuals_restricted[:, None],
+    n_clusters)
+  a = xx_inv[j]
+  factors = {
+    "A" : xx_inv @ xu.T,
+    "ad" : xu @ a,
+    "aH" : group_sums(cluster_codes, x * (x @ a)[:, None], n_clusters),
+    "j" : j,
+    "scale" : (n_clusters / (n_clusters - 1)
+      * (nobs - 1) / (nobs - k))
+  }
+  return factors
+
+# Bootstrap t-statistics for one batch of draws
+def bootstrap_t_batch(seed, n_draws, factors, weights = "rademacher"):
+  rng = np.random.default_rng(seed)
+  w = bootstrap_weights(rng, factors["ad"].size, n_draws, weights)
+  delta = factors["A"] @ w
+  scores = factors["ad"][:, None] * w - factors["aH"] @ delta
+  std_error = np.sqrt(factors["scale"] * (scores ** 2).sum(axis = 0))
+  return delta[factors["j"]] / std_error
+
+# Wild cluster restricted bootstrap for one term of an AbsorbedPanel
+# fit, batches are seeded independently of the number of workers
+def wild_cluster_bootstrap(panel, outcome, regressors, term, cluster,
+                           n_boot = 9999, weights = "rademacher",
+                           seed = None, n_jobs = 1, batch_size = 1000,
+                           level = 0.95, null = 0.0):
+  regressors = list(regressors)
+  j = regressors.index(term)
+  fit = panel.fit(outcome, regressors, clusters = [cluster])
+  estimate = fit.loc[term, "estimate"]
+  std_error = fit.loc[term, "std_error"]
+  t_statistic = (estimate - null) / std_error
+  y = panel.demeaned([outcome])[:, 0]
+  x = panel.demeaned(regressors)
+  cluster_codes, uniques = pd.factorize(panel.data[cluster])
+  factors = factorize_wild_bootstrap(
+    x, y, j, cluster_codes, uniques.size, null
+  )
+  n_batches = int(np.ceil(n_boot / batch_size))
+  seeds = np.random.SeedSequence(seed).spawn(n_batches)
+  sizes = [min(batch_size, n_boot - b * batch_size)
+    for b in range(n_batches)]
+  t_boot = np.concatenate(
+    Parallel(n_jobs = n_jobs)
+    (delayed(bootstrap_t_batch)(s, n, factors, weights)
+    for s, n in zip(seeds, sizes))
+  )
+  critical_value = np.quantile(np.abs(t_boot), level)
+  result = pd.DataFrame({
+    "term" : [term],
+    "estimate" : [estimate],
+    "std_error" : [std_error],
+    "t_statistic" : [t_statistic],
+    "p_value" : [np.mean(np.abs(t_boot) >= np.abs(t_statistic))],
+    "conf.low" : [estimate - critical_value * std_error],
+    "conf.high" : [estimate + critical_value * std_error],
+    "n_clusters" : [uniques.size],
+    "n_boot" : [n_boot]
+  })
+  return result
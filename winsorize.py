@@ -0,0 +1,102 @@
+# winsorize.py
+import pandas as pd
+import numpy as np
+
+# Group keys as an index so fitted cutoffs can be looked up later
+def group_keys(data, by):
+  if by is None:
+    return pd.Index(np.zeros(len(data), dtype = np.int8))
+  if isinstance(by, str):
+    return pd.Index(data[by])
+  return pd.MultiIndex.from_frame(data[list(by)])
+
+# Linear-interpolated quantiles within every group from a single sort,
+# matching np.nanquantile(..., method = "linear") group by group
+def grouped_quantiles(values, codes, n_groups, probs):
+  order = np.lexsort((values, codes))
+  sorted_values = values[order]
+  sizes = np.bincount(codes, minlength = n_groups)
+  valid = np.bincount(codes, weights = ~np.isnan(values),
+    minlength = n_groups).astype(np.int64)
+  starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+  quantiles = np.full((n_groups, len(probs)), np.nan)
+  has_values = valid > 0
+  for i, p in enumerate(probs):
+    position = p * (valid[has_values] - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, valid[has_values] - 1)
+    fraction = position - lower
+    start = starts[has_values]
+    low_value = sorted_values[start + lower]
+    high_value = sorted_values[start + upper]
+    quantiles[has_values, i] = low_value + fraction * (
+      high_value - low_value)
+  return quantiles
+
+# Per-group cutoffs fitted once and reapplied to any sample
+class Winsorizer:
+  def __init__(self, columns, cut = 0.01, by = None,
+               method = "winsorize"):
+    if method not in ("winsorize", "trim"):
+      raise ValueError(f"Unknown method: {method}")
+    self.columns = list(columns)
+    self.cut = cut
+    self.by = by
+    self.method = method
+    self.cutoffs = None
+
+  def fit(self, data):
+    codes, groups = group_keys(data, self.by).factorize()
+    n_groups = len(groups)
+    codes = np.where(codes < 0, n_groups, codes)
+    cutoffs = {}
+    for column in self.columns:
+      values = data[column].to_numpy(dtype = np.float64)
+      quantiles = grouped_quantiles(
+        values, codes, n_groups + 1, [self.cut, 1 - self.cut]
+      )[:n_groups]
+      cutoffs[(column, "lower")] = quantiles[:, 0]
+      cutoffs[(column, "upper")] = quantiles[:, 1]
+    self.cutoffs = pd.DataFrame(cutoffs, index = groups)
+    return self
+
+  # Clip (or trim to NaN) the caller's frame, rows of unseen groups are
+  # untouched. float64 columns with a writeable buffer are clipped in
+  # place; other columns are converted to float64 and reassigned. With
+  # copy = True the frame is copied first and the input left as is.
+  def transform(self, data, copy = False):
+    if self.cutoffs is None:
+      raise ValueError("Winsorizer has not been fitted")
+    if copy:
+      data = data.copy()
+    positions = self.cutoffs.index.get_indexer(group_keys(data, self.by))
+    seen = positions >= 0
+    for column in self.columns:
+      values = data[column].to_numpy()
+      in_place = values.dtype == np.float64 and values.flags.writeable
+      if not in_place:
+        values = values.astype(np.float64)
+      lower = np.full(values.size, np.nan)
+      upper = np.full(values.size, np.nan)
+      lower[seen] = self.cutoffs[(column, "lower")].to_numpy()[
+        positions[seen]]
+      upper[seen] = self.cutoffs[(column, "upper")].to_numpy()[
+        positions[seen]]
+      if self.method == "winsorize":
+        np.copyto(values, lower, where = values < lower)
+        np.copyto(values, upper, where = values > upper)
+      else:
+        values[(values < lower) | (values > upper)] = np.nan
+      if not in_place:
+        data[column] = values
+    return data
+
+  def fit_transform(self, data, copy = False):
+    return self.fit(data).transform(data, copy)
+
+# Winsorize many columns at once, optionally within groups; modifies
+# data unless copy = True
+def winsorize_frame(data, columns, cut = 0.01, by = None,
+                    method = "winsorize", copy = False):
+  winsorizer = Winsorizer(columns, cut, by, method)
+  return winsorizer.fit_transform(data, copy), winsorizer
@@ -0,0 +1,143 @@
+# wrds_extract.py
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
+from sqlalchemy import create_engine, text
+from instrument import stage
+
+extract_path = "data/wrds"
+default_chunk_size = 100000
+
+# WRDS unless WRDS_URL points somewhere else, e.g. a local PostgreSQL
+# stand-in loaded with the same schemas for testing
+def wrds_url():
+  if os.getenv("WRDS_URL"):
+    return os.getenv("WRDS_URL")
+  return (
+    "postgresql+psycopg2://"
+    f"{os.getenv('WRDS_USER')}:{os.getenv('WRDS_PASSWORD')}"
+    "@wrds-pgdata.wharton.upenn.edu:9737/wrds"
+  )
+
+# One pooled connection per concurrent pull, no overflow so WRDS never
+# sees more sessions than pool_size
+def wrds_engine(url = None, pool_size = 4):
+  return create_engine(
+    url or wrds_url(),
+    pool_pre_ping = True,
+    pool_size = pool_size,
+    max_overflow = 0
+  )
+
+# Arrow types for the PostgreSQL type OIDs of psycopg2's cursor
+# description; numeric is read as float64 like pandas does
+postgres_types = {
+  16 : pa.bool_(), 20 : pa.int64(), 21 : pa.int16(), 23 : pa.int32(),
+  700 : pa.float32(), 701 : pa.float64(), 1700 : pa.float64(),
+  1082 : pa.date32(), 1114 : pa.timestamp("us"),
+  1184 : pa.timestamp("us", tz = "UTC"), 25 : pa.string(),
+  1042 : pa.string(), 1043 : pa.string()
+}
+
+# Schema of a result from the cursor metadata, so a column that is all
+# NULL in the first chunk still gets its real type. Explicit types (a
+# pa.Schema or a dict of column -> type) win; columns of unknown type are
+# carried as strings.
+def result_schema(result, columns, schema = None):
+  explicit = {}
+  if isinstance(schema, pa.Schema):
+    explicit = {f.name : f.type for f in schema}
+  elif schema:
+    explicit = dict(schema)
+  description = getattr(result.cursor, "description", None) or []
+  type_codes = {d[0] : d[1] for d in description}
+  return pa.schema([
+    (c, explicit.get(c) or postgres_types.get(type_codes.get(c),
+      pa.string()))
+    for c in columns
+  ])
+
+def column_array(values, arrow_type):
+  if pa.types.is_floating(arrow_type):
+    values = [None if v is None else float(v) for v in values]
+  elif pa.types.is_string(arrow_type):
+    values = [None if v is None else str(v) for v in values]
+  return pa.array(values, type = arrow_type)
+
+# Rows of one fetch as an Arrow record batch of the given schema
+def rows_to_batch(rows, schema):
+  arrays = list(zip(*rows)) if rows else [[] for _ in schema]
+  return pa.RecordBatch.from_arrays(
+    [column_array(a, f.type) for a, f in zip(arrays, schema)],
+    schema = schema
+  )
+
+# Server-side cursor (stream_results) fetched in fixed-size chunks, so
+# the client never buffers more than chunk_size rows of the result. All
+# chunks share one schema taken from the result metadata; an empty result
+# still gives one empty batch of that schema.
+def stream_query(engine, sql, params = None, chunk_size =
+                 default_chunk_size, schema = None):
+  with engine.connect().execution_options(
+    stream_results = True, max_row_buffer = chunk_size
+  ) as connection:
+    result = connection.execute(text(sql), params or {})
+    schema = result_schema(result, list(result.keys()), schema)
+    empty = True
+    for rows in result.partitions(chunk_size):
+      empty = False
+      yield rows_to_batch(rows, schema)
+    if empty:
+      yield rows_to_batch([], schema)
+
+# Pull one query into a parquet file in the local store, written under a
+# temporary name and renamed once complete. An empty result replaces the
+# file with an empty one, so no earlier extract is read in its place.
+def extract_table(engine, name, sql, params = None, store_dir =
+                  extract_path, chunk_size = default_chunk_size,
+                  schema = None):
+  os.makedirs(store_dir, exist_ok = True)
+  path = os.path.join(store_dir, f"{name}.parquet")
+  tmp_path = f"{path}.tmp"
+  rows = 0
+  tic = time.perf_counter()
+  with stage(f"extract {name}") as extract_stage:
+    writer = None
+    try:
+      for batch in stream_query(engine, sql, params, chunk_size, schema):
+        if writer is None:
+          writer = pq.ParquetWriter(tmp_path, batch.schema)
+        writer.write_batch(batch)
+        rows += batch.num_rows
+    finally:
+      if writer is not None:
+        writer.close()
+    os.replace(tmp_path, path)
+    extract_stage.rows(rows)
+  return {"table" : name, "rows" : rows,
+    "seconds" : time.perf_counter() - tic, "path" : path}
+
+# Independent pulls side by side, one pooled connection each. queries
+# maps name -> sql or (sql, params).
+def extract_tables(engine, queries, store_dir = extract_path,
+                   chunk_size = default_chunk_size, n_jobs = None,
+                   schemas = None):
+  n_jobs = n_jobs or engine.pool.size()
+  schemas = schemas or {}
+  jobs = []
+  for name, query in queries.items():
+    sql, params = query if isinstance(query, tuple) else (query, None)
+    jobs.append(delayed(extract_table)(
+      engine, name, sql, params, store_dir, chunk_size, schemas.get(name)
+    ))
+  summary = Parallel(n_jobs = n_jobs, prefer = "threads")(jobs)
+  return pd.DataFrame(summary)
+
+# Extracted table as pandas, dates as datetime64 like parse_dates gives
+def read_extract(name, columns = None, store_dir = extract_path):
+  return pq.read_table(
+    os.path.join(store_dir, f"{name}.parquet"), columns = columns
+  ).to_pandas(date_as_object = False)